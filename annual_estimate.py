@@ -0,0 +1,221 @@
+"""
+KGJ Annual Estimate
+Annual KPIs from a dispatch result, and a quick annual estimate from k
+representative days (k-medoids over the daily EE price / heat demand
+profiles) solved with run_dispatch and weighted back up to the year.
+
+    python annual_estimate.py --days 6 12 24 --input behounkova=beh.xlsx
+
+compares the estimate with a full solve (estimation error per KPI).
+"""
+
+import argparse
+import time
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from dispatch_engine import TechParams, run_dispatch
+
+
+REPRESENTATIVE_DAYS = 12
+CLUSTER_COLUMNS = ("ee_price", "heat_demand")
+
+# Labels as on the KPI cards / the Excel summary sheet
+KPI_LABELS = {
+    "total_profit":       "Celkový roční zisk (EUR)",
+    "revenue_heat":       "Příjem z tepla (EUR)",
+    "revenue_ee":         "Příjem z EE (EUR)",
+    "cost_gas":           "Náklad plyn (EUR)",
+    "cost_ee_dist":       "Náklad EE dist (EUR)",
+    "cost_service":       "Náklad servis (EUR)",
+    "kgj_hours":          "KGJ hodiny",
+    "kgj_starts":         "KGJ starty",
+    "avg_kgj_load":       "Průměrné zatížení KGJ (%)",
+    "ee_sold":            "EE prodáno celkem (MWh)",
+    "heat_kgj":           "Teplo z KGJ (MWh)",
+    "heat_boiler":        "Teplo z kotle (MWh)",
+    "heat_eboiler":       "Teplo z elektrokotle (MWh)",
+}
+
+
+# ──────────────────────────────────────────────
+# ANNUAL KPIs
+# ──────────────────────────────────────────────
+
+def annual_kpis(result: pd.DataFrame, p: TechParams, weights=None) -> dict:
+    """
+    KPI totals (KPI_LABELS keys) of a results DataFrame. `weights` (one per
+    hour) scales each hour, e.g. by the number of days a representative day
+    stands for; None counts every hour once.
+    """
+    w = np.ones(len(result)) if weights is None else np.asarray(weights, dtype=float)
+
+    def total(values):
+        return float(np.dot(w, np.asarray(values, dtype=float)))
+
+    ee = result["EE_price_EUR_MWh"]
+    gas = result["Gas_price_EUR_MWh"]
+    on = result["KGJ_on"]
+    kgj_hours = total(on)
+    return {
+        "total_profit":  total(result["Total_profit_EUR"]),
+        "revenue_heat":  total(result["Heat_demand_MWh"] * result["Heat_price_EUR_MWh"] * p.heat_min_cover),
+        "revenue_ee":    total(result["EE_Sold_Spot_MWh"] * ee),
+        "cost_gas":      total(result["KGJ_heat_MWh"] * p.kgj_gas_per_heat * gas
+                               + result["Gas_boiler_heat_MWh"] / p.boiler_eff * gas),
+        "cost_ee_dist":  total(result["EE_to_EBoiler_Grid_MWh"] * (ee + p.ee_dist_cost)),
+        "cost_service":  total(on * p.kgj_service),
+        "kgj_hours":     kgj_hours,
+        "kgj_starts":    total(result["KGJ_start"]),
+        "avg_kgj_load":  total(on * result["KGJ_load_pct"]) / kgj_hours if kgj_hours > 0 else 0.0,
+        "ee_sold":       total(result["EE_Sold_Spot_MWh"]),
+        "heat_kgj":      total(result["KGJ_heat_MWh"]),
+        "heat_boiler":   total(result["Gas_boiler_heat_MWh"]),
+        "heat_eboiler":  total(result["Electric_boiler_heat_MWh"]),
+    }
+
+
+# ──────────────────────────────────────────────
+# REPRESENTATIVE DAYS (k-medoids)
+# ──────────────────────────────────────────────
+
+def _day_profiles(df: pd.DataFrame) -> np.ndarray:
+    """One row per whole day: the 24-hour vectors of CLUSTER_COLUMNS, each standardised over the year."""
+    days = len(df) // 24
+    blocks = []
+    for col in CLUSTER_COLUMNS:
+        x = df[col].to_numpy(dtype=float)[:days * 24]
+        scale = x.std()
+        blocks.append(((x - x.mean()) / (scale if scale > 0 else 1.0)).reshape(days, 24))
+    return np.hstack(blocks)
+
+
+def _k_medoids(dist: np.ndarray, k: int, rng: np.random.Generator, max_iter: int = 100):
+    """Alternating k-medoids from a k-means++ seeding. Returns (medoids, labels, cost)."""
+    n = len(dist)
+    medoids = [int(rng.integers(n))]
+    for _ in range(1, k):
+        d2 = dist[:, medoids].min(axis=1) ** 2
+        medoids.append(int(rng.choice(n, p=d2 / d2.sum())) if d2.sum() > 0 else int(rng.integers(n)))
+    medoids = np.array(medoids)
+
+    for _ in range(max_iter):
+        labels = dist[:, medoids].argmin(axis=1)
+        new = medoids.copy()
+        for c in range(k):
+            members = np.flatnonzero(labels == c)
+            if len(members):
+                new[c] = members[dist[np.ix_(members, members)].sum(axis=1).argmin()]
+        if np.array_equal(new, medoids):
+            break
+        medoids = new
+    labels = dist[:, medoids].argmin(axis=1)
+    return medoids, labels, float(dist[np.arange(n), medoids[labels]].sum())
+
+
+def representative_days(df: pd.DataFrame, k: int = REPRESENTATIVE_DAYS, seed: int = 0,
+                        n_init: int = 5):
+    """
+    Cluster the whole days of `df` into k groups by their daily profiles.
+    Returns (medoid day indices in calendar order, days each one stands
+    for, cluster label of every day). Hours after the last whole day are
+    not clustered.
+    """
+    profiles = _day_profiles(df)
+    days = len(profiles)
+    if days == 0:
+        raise ValueError("Representative days need at least 24 hours of data")
+    k = min(k, days)
+    dist = np.sqrt(((profiles[:, None, :] - profiles[None, :, :]) ** 2).sum(axis=2))
+
+    rng = np.random.default_rng(seed)
+    medoids, labels, _ = min((_k_medoids(dist, k, rng) for _ in range(n_init)), key=lambda r: r[2])
+    order = np.argsort(medoids)
+    rank = np.empty(k, dtype=int)
+    rank[order] = np.arange(k)
+    labels = rank[labels]
+    return medoids[order], np.bincount(labels, minlength=k), labels
+
+
+def estimate_annual(df: pd.DataFrame, p: TechParams, k: int = REPRESENTATIVE_DAYS, seed: int = 0,
+                    **dispatch_options) -> Optional[pd.DataFrame]:
+    """
+    Solve only the k representative days of `df` plus any trailing partial
+    day, back to back in calendar order in one run_dispatch call
+    (`dispatch_options` passed through), so the KGJ state carries over
+    midnight as in the full year instead of every day starting cold.
+    Returns their hourly results with a "Day_weight" column (days each
+    hour stands for) or None on failure; annual_kpis(result, p,
+    result["Day_weight"]) gives the annual estimate.
+    """
+    medoids, counts, _ = representative_days(df, k, seed)
+    tail = np.arange(len(df) // 24 * 24, len(df))
+    hours = np.concatenate([(medoids[:, None] * 24 + np.arange(24)).ravel(), tail])
+
+    result = run_dispatch(df.iloc[hours].reset_index(drop=True), p, **dispatch_options)
+    if result is None:
+        return None
+    result["Day_weight"] = np.concatenate([np.repeat(counts, 24), np.ones(len(tail))]).astype(float)
+    result.attrs["representative_days"] = {"k": len(medoids), "days": [int(d) for d in medoids],
+                                           "weights": [int(c) for c in counts]}
+    return result
+
+
+def estimation_error(df: pd.DataFrame, p: TechParams, ks=(REPRESENTATIVE_DAYS,), seed: int = 0,
+                     **dispatch_options) -> pd.DataFrame:
+    """
+    Annual KPIs of a full solve of `df` next to the representative-day
+    estimate for each k in `ks`, with the relative error in %.
+    Solve times are in `.attrs["seconds"]`.
+    """
+    t0 = time.perf_counter()
+    full = run_dispatch(df, p, **dispatch_options)
+    if full is None:
+        raise RuntimeError("Full solve failed")
+    seconds = {"full": time.perf_counter() - t0}
+    table = pd.DataFrame({"full": annual_kpis(full, p)})
+
+    for k in ks:
+        t0 = time.perf_counter()
+        est = estimate_annual(df, p, k, seed, **dispatch_options)
+        seconds[f"k={k}"] = time.perf_counter() - t0
+        if est is None:
+            continue
+        table[f"k={k}"] = pd.Series(annual_kpis(est, p, est["Day_weight"]))
+        table[f"err_k={k}_%"] = 100 * (table[f"k={k}"] - table["full"]) / table["full"].abs().replace(0, np.nan)
+
+    table.index = [KPI_LABELS[key] for key in table.index]
+    table.attrs["seconds"] = seconds
+    return table
+
+
+def main():
+    from bench_dispatch import load_input, synthetic_year
+    from locations_config import LOCATIONS
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, nargs="+", default=[6, REPRESENTATIVE_DAYS, 24])
+    parser.add_argument("--engine", default="dp", choices=["dp", "mip"])
+    parser.add_argument("--backend", default="cbc")
+    parser.add_argument("--locations", nargs="+", default=list(LOCATIONS), choices=list(LOCATIONS))
+    parser.add_argument("--input", nargs="+", default=[], metavar="LOKALITA=SOUBOR.xlsx")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    inputs = dict(item.split("=", 1) for item in args.input)
+    options = {"engine": args.engine}
+    if args.engine == "mip":
+        options["backend"] = args.backend
+    for name in args.locations:
+        loc = LOCATIONS[name]
+        df = load_input(inputs[name], loc) if name in inputs else synthetic_year(loc, seed=args.seed)
+        table = estimation_error(df, loc.tech_params(), args.days, args.seed, **options)
+        print(f"\n{loc.display_name} ({len(df):,} h)")
+        print(table.round(2).to_string())
+        print("  časy: " + ", ".join(f"{key} {s:.2f}s" for key, s in table.attrs["seconds"].items()))
+
+
+if __name__ == "__main__":
+    main()
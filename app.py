@@ -5,12 +5,23 @@ Fixed: Plyn 35 EUR/MWh | Teplo 40 EUR/MWh
 """
 
 import io
+import uuid
 import streamlit as st
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import pandas as pd
 import numpy as np
 
 from locations_config import LOCATIONS, get_location
-from dispatch_engine import TechParams, compute_margins, best_source, run_dispatch
+from dispatch_engine import (DEFAULT_TIME_LIMIT, compute_margins, best_source, run_dispatch, rerun_dispatch,
+                             available_backends)
+from result_cache import ResultCache
+from job_manager import JobManager
+from solver_scheduler import get_scheduler
+from annual_estimate import KPI_LABELS, REPRESENTATIVE_DAYS, annual_kpis, estimate_annual
+from portfolio import PORTFOLIO_ROW, SharedLimit, run_portfolio, run_shared_portfolio
+from scenario_engine import PriceModel, run_scenarios
+from sensitivity import SWEEP_FIELDS, grid_values, sweep
 import chart_helpers as ch
 import chart_helpers_annual as cha
 
@@ -32,6 +43,53 @@ st.set_page_config(
 if "selected_location" not in st.session_state:
     st.session_state["selected_location"] = "behounkova"
 
+
+@st.cache_resource
+def get_result_cache() -> ResultCache:
+    """Shared on-disk result cache (directory from KGJ_CACHE_DIR)."""
+    return ResultCache()
+
+
+def session_alive(owner: str) -> bool:
+    """Whether the browser session `owner` is still connected (jobs of closed tabs get reaped)."""
+    return not Runtime.exists() or Runtime.instance().is_active_session(owner)
+
+
+@st.cache_resource
+def get_job_manager() -> JobManager:
+    """Background jobs of all sessions; the process-wide scheduler (KGJ_MAX_SOLVES) limits concurrent solves."""
+    return JobManager(alive=session_alive)
+
+
+# Queue owner of this browser session in the solver scheduler: the runtime
+# session id, so the job manager can ask whether the session is still there
+ctx = get_script_run_ctx()
+session_id = st.session_state.setdefault("session_id", ctx.session_id if ctx else uuid.uuid4().hex)
+
+
+def submit_job(key: str, kind: str, loc_id, fn, *args, label: str, weight: int = 1, meta=None, **kwargs):
+    """
+    Run fn as a background job of this session under `key` (one job per key
+    at a time) and rerun the page. `kind` picks how store_job_result keeps
+    the result, `meta` holds what it needs besides the result; pool runs
+    take `weight` solver slots.
+    """
+    job_id = get_job_manager().submit(fn, *args, label=label, owner=session_id, weight=weight, **kwargs)
+    st.session_state.setdefault("jobs", {})[key] = dict(meta or {}, id=job_id, kind=kind, loc=loc_id)
+    st.rerun()
+
+
+def session_jobs() -> dict:
+    """Jobs of this session still waiting for their result: key -> entry (see submit_job)."""
+    return st.session_state.get("jobs", {})
+
+
+def scheduler_load() -> str:
+    """One-line summary of the solver scheduler: busy slots, queue depth, average wait."""
+    load = get_scheduler().metrics()
+    return (f"Řešiče: {load['slots_used']}/{load['max_concurrent']} obsazeno · "
+            f"ve frontě {load['queued']} · průměrné čekání {load['avg_wait']:.0f} s")
+
 # ══════════════════════════════════════════════
 # CUSTOM CSS
 # ══════════════════════════════════════════════
@@ -247,24 +305,30 @@ with st.sidebar:
     - Min up/down: {current_loc.min_up}/{current_loc.min_down} h
     """)
     
-    params = TechParams(
-        kgj_heat_output=current_loc.kgj_heat_output,
-        kgj_el_output=current_loc.kgj_el_output,
-        kgj_heat_eff=current_loc.kgj_heat_output / current_loc.kgj_gas_input,
-        kgj_service=current_loc.kgj_service,
-        kgj_min_load=current_loc.kgj_min_load,
-        boiler_eff=current_loc.boiler_eff,
-        boiler_max_heat=current_loc.boiler_max_heat,
-        eboiler_eff=current_loc.eboiler_eff,
-        eboiler_max_heat=current_loc.eboiler_max_heat,
-        ee_dist_cost=current_loc.ee_dist_cost,
-        heat_min_cover=current_loc.heat_min_cover,
-        min_up=current_loc.min_up,
-        min_down=current_loc.min_down,
-        initial_state=0,
+    params = current_loc.tech_params()
+    
+    engine = st.radio(
+        "Výpočetní jádro",
+        options=["dp", "mip"],
+        format_func=lambda e: {"dp": "DP (přesné, rychlé)", "mip": "MIP (řešič)"}[e],
+        key="engine",
+    )
+    backend = "cbc"
+    if engine == "mip":
+        backend = st.selectbox(
+            "MIP řešič",
+            options=available_backends(),
+            format_func=lambda b: {"cbc": "CBC", "highs": "HiGHS"}.get(b, b),
+            key="backend",
+        )
+    time_budget = st.number_input(
+        "Časový limit výpočtu (s)", min_value=5, max_value=3600, value=int(DEFAULT_TIME_LIMIT), step=5,
+        key="time_budget",
+        help="Po vypršení se vrátí nejlepší dosud nalezené řešení.",
     )
     
     st.divider()
+    st.caption(scheduler_load())
     st.caption(f"Annual Dispatch · {current_loc.display_name}")
 
 # ══════════════════════════════════════════════
@@ -306,6 +370,8 @@ if uploaded is not None:
             df_input["gas_price"] = current_loc.fixed_gas_price
             df_input["heat_price"] = current_loc.fixed_heat_price
             df_input = df_input.reset_index(drop=True)
+            # Kept per location for the portfolio run (the uploader resets on switching)
+            st.session_state[f"df_input_{current_loc.name}"] = df_input
             
             st.markdown(f'<span class="status-chip-ok">✓ Načteno {len(df_input):,} hodin ({len(df_input)/8760*365:.0f} dní)</span>', unsafe_allow_html=True)
             
@@ -326,28 +392,283 @@ if uploaded is not None:
 # RUN OPTIMIZATION
 # ══════════════════════════════════════════════
 
+dispatch_key = f"dispatch_{current_loc.name}"
+estimate_key = f"estimate_{current_loc.name}"
+
 if df_input is not None:
     st.markdown("<br>", unsafe_allow_html=True)
     
-    if st.button("▶ SPUSTIT ROČNÍ OPTIMALIZACI", type="primary", use_container_width=True, key=f"run_{current_loc.name}"):
-        progress_bar = st.progress(0.0)
-        status_text = st.empty()
-        
-        status_text.text("⚙ CBC solver pracuje... Může trvat několik minut pro roční data.")
-        
-        with st.spinner("Optimalizuji..."):
-            result_df = run_dispatch(df_input, params)
-        
-        progress_bar.empty()
-        status_text.empty()
-        
-        if result_df is None:
-            st.error("❌ Solver nenašel optimální řešení.")
+    # The solve runs as a background job; the page stays usable and shows the previous results meanwhile
+    if st.button("▶ SPUSTIT ROČNÍ OPTIMALIZACI", type="primary", use_container_width=True,
+                 key=f"run_{current_loc.name}", disabled=dispatch_key in session_jobs()):
+        previous = st.session_state.get(f"result_df_{current_loc.name}")
+        label = f"{current_loc.display_name} · {engine.upper()}"
+        if previous is not None:
+            # Only hours whose inputs changed since the last run are re-solved
+            submit_job(dispatch_key, "dispatch", current_loc.name, rerun_dispatch, df_input, params, previous,
+                       engine=engine, backend=backend, time_limit=time_budget, label=label)
+        else:
+            submit_job(dispatch_key, "dispatch", current_loc.name, run_dispatch, df_input, params,
+                       engine=engine, backend=backend, cache=get_result_cache(), time_limit=time_budget,
+                       label=label)
+    
+    # Quick estimate: only k representative days are solved and weighted up to the year
+    col_days, col_est = st.columns([1, 3])
+    rep_days = col_days.number_input("Reprezentativní dny", min_value=2, max_value=60,
+                                     value=REPRESENTATIVE_DAYS, step=1, key=f"rep_days_{current_loc.name}")
+    if col_est.button("⚡ RYCHLÝ ODHAD — reprezentativní dny", use_container_width=True,
+                      key=f"run_estimate_{current_loc.name}", disabled=estimate_key in session_jobs()):
+        submit_job(estimate_key, "estimate", current_loc.name, estimate_annual, df_input, params, int(rep_days),
+                   engine=engine, backend=backend, cache=get_result_cache(), time_limit=time_budget,
+                   label=f"{current_loc.display_name} · odhad", meta={"days": int(rep_days), "hours": len(df_input)})
+
+
+def store_job_result(entry: dict, job):
+    """Keep a finished job's result in session_state and queue a notice for its location (or the portfolio)."""
+    kind, loc_id, result = entry["kind"], entry["loc"], job.result
+    cancelled = job.status == "cancelled"
+    if job.status == "failed":
+        notice = ("error", f"❌ {job.label}: výpočet selhal. {job.error or ''}")
+    elif kind == "dispatch":
+        if result is None:
+            notice = ("error", "❌ Solver nenašel optimální řešení.")
+        elif cancelled:
+            notice = ("warning", "⏹ Výpočet zrušen — zobrazeno nejlepší dosud nalezené řešení.")
+        elif result.attrs.get("stopped") == "time_limit":
+            notice = ("warning", f"⏱ Vypršel časový limit — zobrazeno nejlepší dosud nalezené řešení "
+                                 f"({job.elapsed:.0f} s).")
+        elif result.attrs.get("cached"):
+            notice = ("success", f"✅ Výsledek načten z cache — {len(result):,} hodin")
+        else:
+            notice = ("success", f"✅ Optimalizace dokončena za {job.elapsed:.0f} s — "
+                                 f"{len(result):,} hodin zpracováno")
+        if result is not None:
+            st.session_state[f"result_df_{loc_id}"] = result
+    elif kind == "estimate":
+        if result is None:
+            notice = ("error", "❌ Solver nenašel řešení reprezentativních dní.")
+        else:
+            p = LOCATIONS[loc_id].tech_params()
+            st.session_state[f"estimate_{loc_id}"] = {
+                "kpi": annual_kpis(result, p, result["Day_weight"]),
+                "days": entry["days"],
+                "hours": entry["hours"],
+            }
+            notice = (("warning", "⏹ Odhad zrušen — zobrazeno nejlepší dosud nalezené řešení.") if cancelled
+                      else ("success", f"✅ Odhad dokončen za {job.elapsed:.0f} s"))
+    elif kind == "portfolio":
+        results, summary = result
+        for site, site_result in results.items():
+            if site_result is not None:
+                st.session_state[f"result_df_{site}"] = site_result
+        st.session_state["portfolio_summary"] = summary
+        if any(site_result is None for site_result in results.values()):
+            notice = ("error", "❌ Solver nenašel řešení pro některé lokality.")
+        elif cancelled:
+            notice = ("warning", "⏹ Portfolio zrušeno — zobrazeno nejlepší dosud nalezené řešení.")
         else:
-            st.session_state[f"result_df_{current_loc.name}"] = result_df
-            st.success(f"✅ Optimalizace dokončena — {len(result_df):,} hodin zpracováno")
+            notice = ("success", f"✅ Portfolio dokončeno za {job.elapsed:.0f} s")
+    else:   # "scenarios" / "sweep": tables of the points solved before a cancel
+        solved = len(result) if kind == "scenarios" else int((result["status"] != "Cancelled").sum())
+        if solved:
+            st.session_state[f"{kind}_{loc_id}"] = result
+        notice = (("warning", f"⏹ Zrušeno — spočteno {solved:,} z {entry['total']:,}.") if cancelled
+                  else ("success", f"✅ {job.label}: hotovo za {job.elapsed:.0f} s"))
+    st.session_state.setdefault(f"notices_{loc_id or 'portfolio'}", []).append(notice)
+
+
+# Polled while any job of this session runs (which also keeps the jobs alive
+# for the heartbeat reaper); reruns the whole page once one has finished
+if session_jobs():
+    @st.fragment(run_every=1.0)
+    def job_status():
+        jobs = get_job_manager()
+        pending = session_jobs()
+        jobs.touch(entry["id"] for entry in pending.values())
+        finished = False
+        for key, entry in list(pending.items()):
+            job = jobs.get(entry["id"])
+            if job is not None and not job.is_done:
+                if entry["loc"] in (current_loc.name, None):
+                    col_bar, col_stop = st.columns([5, 1])
+                    if job.status == "queued":
+                        state = f"Ve frontě — pozice {job.position}"
+                    else:
+                        state = job.message or "Počítám..."
+                    col_bar.progress(job.progress, text=f"⚙ {job.label}: {state} ({job.elapsed:.0f} s)")
+                    if col_stop.button("⏹ Zrušit", use_container_width=True, key=f"cancel_{key}"):
+                        jobs.cancel(entry["id"])
+                continue
+            finished = True
+            del pending[key]
+            if job is None:
+                continue
+            jobs.forget(entry["id"])
+            if job.status == "cancelled" and job.started is None:
+                continue   # left the queue before it started
+            store_job_result(entry, job)
+        st.caption(scheduler_load())
+        if finished:
             st.rerun()
 
+    job_status()
+
+for kind, notice in st.session_state.pop(f"notices_{current_loc.name}", []):
+    {"error": st.error, "warning": st.warning}.get(kind, st.success)(notice)
+
+# ══════════════════════════════════════════════
+# PORTFOLIO RUN (all locations in parallel)
+# ══════════════════════════════════════════════
+
+portfolio_inputs = {loc_id: st.session_state[f"df_input_{loc_id}"]
+                    for loc_id in LOCATIONS if f"df_input_{loc_id}" in st.session_state}
+if len(LOCATIONS) > 1:
+    missing = [LOCATIONS[loc_id].display_name for loc_id in LOCATIONS if loc_id not in portfolio_inputs]
+    if missing:
+        st.caption(f"Portfolio: chybí data pro {', '.join(missing)}")
+    else:
+        with st.expander("Sdílené limity portfolia (0 = bez limitu)"):
+            l1, l2, l3 = st.columns(3)
+            gas_hourly = l1.number_input("Plyn — max MWh/h", min_value=0.0, value=0.0, key="limit_gas_hourly")
+            gas_annual = l2.number_input("Plyn — max MWh/rok", min_value=0.0, value=0.0, key="limit_gas_annual")
+            grid_annual = l3.number_input("Síť (EKotle) — max MWh/rok", min_value=0.0, value=0.0,
+                                          key="limit_grid_annual")
+        limits = [SharedLimit(resource, value, period)
+                  for resource, value, period in (("gas", gas_hourly, "hourly"), ("gas", gas_annual, "annual"),
+                                                  ("grid", grid_annual, "annual")) if value > 0]
+    if not missing and st.button("▶▶ SPUSTIT PORTFOLIO — všechny lokality paralelně", use_container_width=True,
+                                 key="run_portfolio", disabled="portfolio" in session_jobs()):
+        # One worker process (and solver slot) per site
+        label = f"Portfolio · {len(portfolio_inputs)} lokality"
+        if limits:
+            # Shared limits are priced by Lagrange multipliers: every iteration solves each site again
+            submit_job("portfolio", "portfolio", None, run_shared_portfolio, portfolio_inputs, limits,
+                       engine=engine, backend=backend, label=label, weight=len(portfolio_inputs))
+        else:
+            submit_job("portfolio", "portfolio", None, run_portfolio, portfolio_inputs, engine=engine,
+                       backend=backend, cache=get_result_cache(), label=label, weight=len(portfolio_inputs))
+
+for kind, notice in st.session_state.pop("notices_portfolio", []):
+    {"error": st.error, "warning": st.warning}.get(kind, st.success)(notice)
+
+if "portfolio_summary" in st.session_state:
+    summary = st.session_state["portfolio_summary"]
+    st.markdown("<br>", unsafe_allow_html=True)
+    st.markdown(f'<div class="section-hd"><div class="dot"></div> Portfolio — souhrn ({summary.attrs.get("wall_time", 0):.1f} s)</div>', unsafe_allow_html=True)
+    p1, p2, p3 = st.columns(3)
+    p1.metric("Zisk portfolia", f"{summary.loc[PORTFOLIO_ROW, 'total_profit']/1000:,.0f}k EUR")
+    p2.metric("KGJ hodiny celkem", f"{summary.loc[PORTFOLIO_ROW, 'kgj_hours']:,.0f}")
+    p3.metric("EE prodáno celkem", f"{summary.loc[PORTFOLIO_ROW, 'ee_sold']:,.0f} MWh")
+    lagrange = summary.attrs.get("lagrange")
+    if lagrange:
+        text = (f"Sdílené limity: {lagrange['status']}, {lagrange.get('iterations', 0)} iterací, "
+                f"horní mez {lagrange.get('bound', float('nan'))/1000:,.0f}k EUR, gap {100*lagrange.get('gap', float('nan')):.2f}%")
+        (st.caption if lagrange["status"] == "Feasible" else st.warning)(text)
+    st.dataframe(summary.rename(columns=KPI_LABELS).round(1), use_container_width=True)
+
+# ══════════════════════════════════════════════
+# PRICE SCENARIOS (Monte Carlo)
+# ══════════════════════════════════════════════
+
+if df_input is not None:
+    with st.expander("🎲 Scénáře cen EE — Monte Carlo"):
+        s1, s2, s3, s4 = st.columns(4)
+        n_scenarios = s1.number_input("Počet scénářů", min_value=10, max_value=5000, value=200, step=10,
+                                      key=f"mc_n_{current_loc.name}")
+        mc_seed = s2.number_input("Seed", min_value=0, value=0, step=1, key=f"mc_seed_{current_loc.name}")
+        mc_vol = s3.number_input("Volatilita (EUR/MWh/h)", min_value=0.0, value=PriceModel.volatility,
+                                 key=f"mc_vol_{current_loc.name}")
+        mc_spikes = s4.number_input("Četnost špiček (%/h)", min_value=0.0, max_value=100.0,
+                                    value=100 * PriceModel.spike_prob, key=f"mc_spikes_{current_loc.name}")
+        if st.button("▶ SPUSTIT SCÉNÁŘE", use_container_width=True, key=f"run_mc_{current_loc.name}",
+                     disabled=f"scenarios_{current_loc.name}" in session_jobs()):
+            model = PriceModel(volatility=mc_vol, spike_prob=mc_spikes / 100)
+            # The pool takes every core, so the run waits for an idle server
+            submit_job(f"scenarios_{current_loc.name}", "scenarios", current_loc.name, run_scenarios,
+                       df_input, params, int(n_scenarios), model, int(mc_seed),
+                       label=f"{current_loc.display_name} · {int(n_scenarios):,} scénářů",
+                       weight=get_scheduler().max_concurrent, meta={"total": int(n_scenarios)})
+    
+    if f"scenarios_{current_loc.name}" in st.session_state:
+        scenarios = st.session_state[f"scenarios_{current_loc.name}"]
+        pct = scenarios.attrs["percentiles"]
+        m1, m2, m3 = st.columns(3)
+        m1.metric("Zisk P5 / P50 / P95", " / ".join(f"{v/1000:,.0f}k" for v in pct.loc["total_profit"]))
+        m2.metric("KGJ hodiny P5 / P50 / P95", " / ".join(f"{v:,.0f}" for v in pct.loc["kgj_hours"]))
+        m3.metric("KGJ starty P5 / P50 / P95", " / ".join(f"{v:,.0f}" for v in pct.loc["kgj_starts"]))
+        st.plotly_chart(cha.scenario_profit_histogram(scenarios), use_container_width=True)
+
+# ══════════════════════════════════════════════
+# PARAMETER SENSITIVITY GRID
+# ══════════════════════════════════════════════
+
+if df_input is not None:
+    with st.expander("📐 Citlivostní mřížka — roční zisk"):
+        axes = []
+        for axis, default in (("x", "fixed_gas_price"), ("y", "fixed_heat_price")):
+            a1, a2, a3, a4 = st.columns([2, 1, 1, 1])
+            field = a1.selectbox(f"Parametr ({axis})", list(SWEEP_FIELDS), format_func=SWEEP_FIELDS.get,
+                                 index=list(SWEEP_FIELDS).index(default), key=f"sweep_{axis}_{current_loc.name}")
+            current = getattr(current_loc, field)
+            low = a2.number_input("Od", value=0.8 * float(current), key=f"sweep_{axis}_lo_{current_loc.name}_{field}")
+            high = a3.number_input("Do", value=1.2 * float(current), key=f"sweep_{axis}_hi_{current_loc.name}_{field}")
+            steps = a4.number_input("Kroků", min_value=1, max_value=25, value=10,
+                                    key=f"sweep_{axis}_n_{current_loc.name}")
+            axes.append((field, grid_values(low, high, steps)))
+        if axes[0][0] == axes[1][0]:
+            st.caption("Stejný parametr na obou osách — počítá se jen osa x.")
+            axes = axes[:1]
+        if st.button("▶ SPOČÍTAT MŘÍŽKU", use_container_width=True, key=f"run_sweep_{current_loc.name}",
+                     disabled=f"sweep_{current_loc.name}" in session_jobs()):
+            points = int(np.prod([len(v) for _, v in axes]))
+            submit_job(f"sweep_{current_loc.name}", "sweep", current_loc.name, sweep, df_input, current_loc,
+                       dict(axes), label=f"{current_loc.display_name} · mřížka {points:,} bodů",
+                       weight=get_scheduler().max_concurrent, meta={"total": points})
+    
+    if f"sweep_{current_loc.name}" in st.session_state:
+        st.plotly_chart(cha.sensitivity_heatmap(st.session_state[f"sweep_{current_loc.name}"], SWEEP_FIELDS),
+                        use_container_width=True)
+
+# ══════════════════════════════════════════════
+# QUICK ANNUAL ESTIMATE
+# ══════════════════════════════════════════════
+
+if f"estimate_{current_loc.name}" in st.session_state:
+    estimate = st.session_state[f"estimate_{current_loc.name}"]
+    est = estimate["kpi"]
+    full_df = st.session_state.get(f"result_df_{current_loc.name}")
+    full = annual_kpis(full_df, params) if full_df is not None and len(full_df) == estimate["hours"] else None
+    
+    st.markdown("<br>", unsafe_allow_html=True)
+    st.markdown(f'<div class="section-hd"><div class="dot"></div> Rychlý odhad — {estimate["days"]} reprezentativních dní</div>', unsafe_allow_html=True)
+    
+    def vs_full(key):
+        if full is None or full[key] == 0:
+            return "odhad"
+        return f"vs. plný výpočet {100 * (est[key] - full[key]) / abs(full[key]):+.1f}%"
+    
+    e1, e2, e3, e4, e5 = st.columns(5)
+    e1.markdown(f"""<div class="kpi-card {'kpi-positive' if est['total_profit']>=0 else 'kpi-negative'}">
+        <div class="kpi-label">Roční zisk (odhad)</div>
+        <div class="kpi-value {'kpi-pos' if est['total_profit']>=0 else 'kpi-neg'}">{est['total_profit']/1000:,.0f}k</div>
+        <div class="kpi-sub">{vs_full('total_profit')}</div></div>""", unsafe_allow_html=True)
+    e2.markdown(f"""<div class="kpi-card kpi-neutral">
+        <div class="kpi-label">Příjem z tepla</div>
+        <div class="kpi-value kpi-acc">{est['revenue_heat']/1000:,.0f}k</div>
+        <div class="kpi-sub">{vs_full('revenue_heat')}</div></div>""", unsafe_allow_html=True)
+    e3.markdown(f"""<div class="kpi-card kpi-neutral">
+        <div class="kpi-label">Příjem z EE</div>
+        <div class="kpi-value kpi-acc">{est['revenue_ee']/1000:,.0f}k</div>
+        <div class="kpi-sub">{vs_full('revenue_ee')}</div></div>""", unsafe_allow_html=True)
+    e4.markdown(f"""<div class="kpi-card kpi-negative">
+        <div class="kpi-label">Náklad plyn</div>
+        <div class="kpi-value kpi-neg">-{est['cost_gas']/1000:,.0f}k</div>
+        <div class="kpi-sub">{vs_full('cost_gas')}</div></div>""", unsafe_allow_html=True)
+    e5.markdown(f"""<div class="kpi-card kpi-info">
+        <div class="kpi-label">KGJ hodiny</div>
+        <div class="kpi-value">{est['kgj_hours']:,.0f}</div>
+        <div class="kpi-sub">{vs_full('kgj_hours')}</div></div>""", unsafe_allow_html=True)
+
 # ══════════════════════════════════════════════
 # DISPLAY RESULTS
 # ══════════════════════════════════════════════
@@ -357,29 +678,34 @@ if f"result_df_{current_loc.name}" in st.session_state:
     
     st.markdown("<br>", unsafe_allow_html=True)
     st.markdown('<div class="section-hd"><div class="dot"></div> Roční Výsledky — Přehled</div>', unsafe_allow_html=True)
+    if result_df.attrs.get("stopped"):
+        st.caption("⚠ Výpočet byl předčasně ukončen (zrušen nebo vypršel časový limit) — výsledek nemusí být optimální.")
+    if result_df.attrs.get("shared_limits"):
+        st.caption("ℹ Plán lokality ze sdílených limitů portfolia — není jejím samostatným optimem; "
+                   "nový běh lokality ji přepočítá celou.")
     
     # ══════════════════════════════════════════════
     # KEY METRICS
     # ══════════════════════════════════════════════
     
-    total_profit      = result_df["Total_profit_EUR"].sum()
-    total_revenue_ee  = (result_df["EE_Sold_Spot_MWh"] * result_df["EE_price_EUR_MWh"]).sum()
-    total_revenue_heat = (result_df["Heat_demand_MWh"] * current_loc.fixed_heat_price * params.heat_min_cover).sum()
-    total_cost_gas    = (result_df["KGJ_heat_MWh"] * params.kgj_gas_per_heat * current_loc.fixed_gas_price).sum() + \
-                        (result_df["Gas_boiler_heat_MWh"] / params.boiler_eff * current_loc.fixed_gas_price).sum()
-    total_cost_ee_dist = (result_df["EE_to_EBoiler_Grid_MWh"] * (result_df["EE_price_EUR_MWh"] + params.ee_dist_cost)).sum()
-    total_cost_service = (result_df["KGJ_on"] * params.kgj_service).sum()
-    
-    kgj_hours         = result_df["KGJ_on"].sum()
-    kgj_starts        = result_df["KGJ_start"].sum()
-    avg_kgj_load      = result_df.loc[result_df["KGJ_on"]==1, "KGJ_load_pct"].mean() if kgj_hours > 0 else 0
-    
-    total_heat_kgj    = result_df["KGJ_heat_MWh"].sum()
-    total_heat_boiler = result_df["Gas_boiler_heat_MWh"].sum()
-    total_heat_eboiler = result_df["Electric_boiler_heat_MWh"].sum()
+    kpi = annual_kpis(result_df, params)
+    total_profit      = kpi["total_profit"]
+    total_revenue_ee  = kpi["revenue_ee"]
+    total_revenue_heat = kpi["revenue_heat"]
+    total_cost_gas    = kpi["cost_gas"]
+    total_cost_ee_dist = kpi["cost_ee_dist"]
+    total_cost_service = kpi["cost_service"]
+    
+    kgj_hours         = kpi["kgj_hours"]
+    kgj_starts        = kpi["kgj_starts"]
+    avg_kgj_load      = kpi["avg_kgj_load"]
+    
+    total_heat_kgj    = kpi["heat_kgj"]
+    total_heat_boiler = kpi["heat_boiler"]
+    total_heat_eboiler = kpi["heat_eboiler"]
     total_heat_total  = total_heat_kgj + total_heat_boiler + total_heat_eboiler
     
-    total_ee_sold     = result_df["EE_Sold_Spot_MWh"].sum()
+    total_ee_sold     = kpi["ee_sold"]
     
     # KPI Cards Row 1
     k1, k2, k3, k4, k5 = st.columns(5)
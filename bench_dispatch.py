@@ -0,0 +1,133 @@
+"""
+Benchmark min up/down formulace KGJ dispatch MIP.
+
+Pro každou lokalitu a formulaci (MIN_RUN_FORMULATIONS) na celoročních
+datech: LP relaxace (kořenová mez), MIP optimum, root gap a časy řešení.
+S --compact také kompaktní model (bez redundantních sloupců), ověřený
+proti plnému: stejná LP mez i MIP optimum (pro přesnou shodu --gap 0).
+
+    python bench_dispatch.py
+    python bench_dispatch.py --backend cbc --input behounkova=beh.xlsx rabasova=rab.xlsx
+    python bench_dispatch.py --compact --gap 0
+
+Bez --input se použije syntetická forward křivka (deterministická, --seed).
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from dispatch_engine import (MIN_RUN_FORMULATIONS, available_backends, get_template,
+                             relaxation_bound, run_dispatch)
+from locations_config import LOCATIONS, LocationConfig
+
+
+def synthetic_year(loc: LocationConfig, year: int = 2027, seed: int = 0) -> pd.DataFrame:
+    """Hourly EE price and heat demand with daily and seasonal shape, plus price dips."""
+    rng = np.random.default_rng(seed)
+    dt = pd.date_range(f"{year}-01-01", f"{year + 1}-01-01", freq="h", inclusive="left")
+    t = np.arange(len(dt))
+    season = np.cos(2 * np.pi * t / len(dt))
+    daily = np.sin(2 * np.pi * (dt.hour.to_numpy() - 6) / 24)
+
+    ee = 80 + 25 * daily + 10 * season + rng.normal(0, 15, len(dt))
+    ee[rng.random(len(dt)) < 0.02] -= 120
+    cap = loc.kgj_heat_output + loc.boiler_max_heat
+    demand = 0.35 * cap * (1 + season) + 0.1 * cap * daily + rng.normal(0, 0.05 * cap, len(dt))
+
+    df = pd.DataFrame({"datetime": dt, "ee_price": ee, "heat_demand": np.clip(demand, 0, 0.95 * cap)})
+    df["gas_price"] = loc.fixed_gas_price
+    df["heat_price"] = loc.fixed_heat_price
+    return df
+
+
+def load_input(path: str, loc: LocationConfig) -> pd.DataFrame:
+    """Forward data from Excel in the app's upload format."""
+    df = pd.read_excel(path)
+    df.columns = [c.strip().lower().replace(" ", "_") for c in df.columns]
+    df = df[["datetime", "ee_price", "heat_demand"]].copy()
+    df["gas_price"] = loc.fixed_gas_price
+    df["heat_price"] = loc.fixed_heat_price
+    return df.reset_index(drop=True)
+
+
+def bench(df: pd.DataFrame, loc: LocationConfig, formulation: str, backend: str,
+          threads=None, presolve: bool = False, compact: bool = False, mip_gap=None) -> dict:
+    p = loc.tech_params()
+    t0 = time.perf_counter()
+    bound = relaxation_bound(df, p, backend=backend, threads=threads, formulation=formulation,
+                             compact=compact)
+    lp_time = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    result = run_dispatch(df, p, engine="mip", backend=backend, threads=threads, presolve=presolve,
+                          formulation=formulation, compact=compact, mip_gap=mip_gap)
+    mip_time = time.perf_counter() - t0
+    model = get_template(p, len(df), formulation=formulation, compact=compact).model
+
+    objective = result.attrs["objective"] if result is not None else np.nan
+    stats = result.attrs.get("solver", {}) if result is not None else {}
+    return {
+        "location": loc.short_name,
+        "formulation": formulation,
+        "model": "compact" if compact else "full",
+        "cols": model.n_cols,
+        "rows": model.n_rows,
+        "lp_bound": bound,
+        "mip_objective": objective,
+        "root_gap_%": 100 * (bound - objective) / max(abs(objective), 1e-9) if bound is not None else np.nan,
+        "lp_s": lp_time,
+        "mip_s": mip_time,
+        "nodes": stats.get("nodes"),
+        "status": result.attrs["status"] if result is not None else "Infeasible",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default="highs" if "highs" in available_backends() else "cbc",
+                        choices=available_backends())
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--locations", nargs="+", default=list(LOCATIONS), choices=list(LOCATIONS))
+    parser.add_argument("--formulations", nargs="+", default=list(MIN_RUN_FORMULATIONS),
+                        choices=list(MIN_RUN_FORMULATIONS))
+    parser.add_argument("--input", nargs="+", default=[], metavar="LOKALITA=SOUBOR.xlsx")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--presolve", action="store_true",
+                        help="MIP s presolvem (jinak se měří čistě formulace)")
+    parser.add_argument("--compact", action="store_true", help="porovnat i kompaktní model")
+    parser.add_argument("--gap", type=float, default=None, help="relativní MIP gap (výchozí dle řešiče)")
+    args = parser.parse_args()
+
+    inputs = dict(item.split("=", 1) for item in args.input)
+    rows = []
+    for name in args.locations:
+        loc = LOCATIONS[name]
+        df = load_input(inputs[name], loc) if name in inputs else synthetic_year(loc, seed=args.seed)
+        for formulation in args.formulations:
+            for compact in (False, True) if args.compact else (False,):
+                rows.append(bench(df, loc, formulation, args.backend, args.threads,
+                                  args.presolve, compact, args.gap))
+                print(pd.DataFrame(rows[-1:]).to_string(index=False, header=len(rows) == 1), flush=True)
+
+    table = pd.DataFrame(rows)
+    print()
+    print(f"backend={args.backend} threads={args.threads} presolve={args.presolve} gap={args.gap}")
+    print(table.round(3).to_string(index=False))
+
+    if args.compact:
+        print()
+        print("Kompaktní vs. plný model:")
+        for (location, formulation), g in table.groupby(["location", "formulation"], sort=False):
+            full, compact = g.set_index("model").loc[["full", "compact"]].to_dict("records")
+            d_lp = abs(compact["lp_bound"] - full["lp_bound"])
+            d_mip = abs(compact["mip_objective"] - full["mip_objective"])
+            ok = d_lp <= 1e-6 * abs(full["lp_bound"]) and d_mip <= 1e-6 * abs(full["mip_objective"])
+            print(f"  {location} {formulation}: ΔLP={d_lp:.2e} ΔMIP={d_mip:.2e} "
+                  f"{'OK' if ok else 'ROZDÍL'} (MIP {full['mip_s']:.1f}s → {compact['mip_s']:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -144,21 +144,16 @@ def margin_bar_chart(costs: dict, heat_price: float) -> go.Figure:
 # ──────────────────────────────────────────────
 
 def sensitivity_chart(gas: float, heat_p: float, params) -> go.Figure:
-    from dispatch_engine import compute_margins
+    from dispatch_engine import margins_table
 
     ee_range = np.arange(10, 250, 5)
+    r = margins_table(ee_range, gas, heat_p, params)
     traces = {
-        "Plynový kotel":      ([], COLORS["blue"]),
-        "KGJ + spot prodej":  ([], COLORS["accent"]),
-        "Elektrokotel (síť)": ([], COLORS["purple"]),
-        "KGJ + elektrokotel": ([], COLORS["accent2"]),
+        "Plynový kotel":      (r["m1"], COLORS["blue"]),
+        "KGJ + spot prodej":  (r["m2"], COLORS["accent"]),
+        "Elektrokotel (síť)": (r["m3"], COLORS["purple"]),
+        "KGJ + elektrokotel": (r["m4"], COLORS["accent2"]),
     }
-    for ee in ee_range:
-        r = compute_margins(ee, gas, heat_p, params)
-        traces["Plynový kotel"][0].append(r["m1"])
-        traces["KGJ + spot prodej"][0].append(r["m2"])
-        traces["Elektrokotel (síť)"][0].append(r["m3"])
-        traces["KGJ + elektrokotel"][0].append(r["m4"])
 
     fig = go.Figure()
     for name, (vals, color) in traces.items():
@@ -343,3 +343,74 @@ def forward_ee_price_chart(result_df: pd.DataFrame) -> go.Figure:
     fig.update_yaxes(title_text="EUR/MWh", title_font=dict(size=10))
     
     return fig
+
+
+def scenario_profit_histogram(scenarios: pd.DataFrame) -> go.Figure:
+    """Distribution of annual profit over price scenarios, with P5/P50/P95."""
+    profits = scenarios.loc[scenarios["status"] != "Failed", "total_profit"] / 1000
+    
+    fig = go.Figure()
+    
+    fig.add_trace(go.Histogram(
+        x=profits,
+        nbinsx=40,
+        marker_color=COLORS["blue"],
+        marker_line_width=0,
+        opacity=0.8,
+    ))
+    
+    for q, color in ((5, COLORS["red"]), (50, COLORS["green"]), (95, COLORS["accent2"])):
+        value = profits.quantile(q / 100)
+        fig.add_vline(
+            x=value,
+            line_color=color,
+            line_width=2,
+            line_dash="dash",
+            annotation_text=f"P{q}: {value:,.0f}k",
+            annotation_font=dict(size=10, color=color),
+        )
+    
+    apply_layout(fig, f"Roční zisk — {len(profits):,} scénářů cen EE", height=300)
+    fig.update_xaxes(title_text="Zisk (tis. EUR / rok)", title_font=dict(size=10))
+    fig.update_yaxes(title_text="Počet scénářů", title_font=dict(size=10))
+    
+    return fig
+
+
+def sensitivity_heatmap(table: pd.DataFrame, labels: dict = None) -> go.Figure:
+    """Annual profit over a one- or two-field parameter sweep (sensitivity.sweep)."""
+    from sensitivity import profit_surface
+
+    labels = labels or {}
+    names = table.attrs.get("fields", list(table.columns[:1]))
+    x = names[0]
+    
+    fig = go.Figure()
+    
+    if len(names) >= 2:
+        y = names[1]
+        surface = profit_surface(table) / 1000
+        fig.add_trace(go.Heatmap(
+            x=surface.columns,
+            y=surface.index,
+            z=surface.values,
+            colorscale=[[0, COLORS["red"]], [0.5, COLORS["surface2"]], [1, COLORS["green"]]],
+            zmid=0 if surface.values.min() < 0 < surface.values.max() else None,
+            colorbar=dict(title="tis. EUR", tickfont=dict(size=9)),
+            hovertemplate=f"{labels.get(x, x)}: %{{x:.3g}}<br>{labels.get(y, y)}: %{{y:.3g}}"
+                          "<br>Zisk: %{z:,.0f}k EUR<extra></extra>",
+        ))
+        fig.update_yaxes(title_text=labels.get(y, y), title_font=dict(size=10))
+    else:
+        fig.add_trace(go.Scatter(
+            x=table[x],
+            y=table["total_profit"] / 1000,
+            line=dict(color=COLORS["accent"], width=2),
+            mode="lines+markers",
+        ))
+        fig.update_yaxes(title_text="Zisk (tis. EUR / rok)", title_font=dict(size=10))
+    
+    apply_layout(fig, "Citlivost ročního zisku", height=380)
+    fig.update_xaxes(title_text=labels.get(x, x), title_font=dict(size=10))
+    
+    return fig
@@ -3,11 +3,34 @@ KGJ Dispatch Engine
 Core calculation and optimization logic.
 """
 
+import abc
+import atexit
+import hashlib
+import os
+import re
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent import futures as _futures
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+
 import pandas as pd
 import numpy as np
 import pulp
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import asdict, astuple, dataclass, field, replace
+from functools import partial
+from itertools import chain
+from typing import Callable, Dict, Optional
+
+try:
+    import highspy
+except ImportError:  # optional: only needed for backend="highs"
+    highspy = None
 
 
 # ──────────────────────────────────────────────
@@ -33,6 +56,7 @@ class TechParams:
     min_up: int = 4
     min_down: int = 4
     initial_state: int = 0
+    initial_hours: Optional[int] = None   # hours already spent in initial_state; None = unconstrained
 
     @property
     def kgj_gas_input(self):
@@ -51,8 +75,18 @@ class TechParams:
 # MARGINAL COST / MARGIN CALCULATIONS
 # ──────────────────────────────────────────────
 
-def compute_margins(ee: float, gas: float, heat_p: float, p: TechParams) -> dict:
-    """Compute marginal costs and margins for all 4 heat sources."""
+SOURCES = (
+    {"name": "Plynový kotel",      "short": "Kotel",    "id": 1, "color": "#5B8DEE"},
+    {"name": "KGJ + spot prodej",  "short": "KGJ+Spot", "id": 2, "color": "#F0A500"},
+    {"name": "Elektrokotel (síť)", "short": "EKotel",   "id": 3, "color": "#9B59B6"},
+    {"name": "KGJ + elektrokotel", "short": "KGJ+EK",  "id": 4, "color": "#00D4AA"},
+)
+NO_SOURCE = {"name": "Žádný zdroj", "short": "—", "id": 0, "color": "#E05555"}
+
+
+def _margin_columns(ee, gas, heat_p, p: TechParams) -> Dict[str, np.ndarray]:
+    """Marginal costs, margins and triggers as arrays (inputs broadcast)."""
+    ee, gas, heat_p = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (ee, gas, heat_p)))
 
     cost1 = gas / p.boiler_eff
 
@@ -84,150 +118,2462 @@ def compute_margins(ee: float, gas: float, heat_p: float, p: TechParams) -> dict
     }
 
 
+def best_source_id(m1, m2, m3, m4) -> np.ndarray:
+    """Id (1-4) of the source with the highest positive margin, 0 if none."""
+    margins = np.stack(np.broadcast_arrays(*(np.asarray(m, dtype=float) for m in (m1, m2, m3, m4))))
+    best = np.argmax(margins, axis=0) + 1
+    return np.where(margins.max(axis=0) > 0, best, 0)
+
+
+def margins_table(ee, gas, heat_p, p: TechParams) -> pd.DataFrame:
+    """
+    Columnar compute_margins for arrays or Series of prices: cost1..4, m1..4,
+    triggers, kgj_margin_ee and the best source id.
+    """
+    index = next((v.index for v in (ee, gas, heat_p) if isinstance(v, pd.Series)), None)
+    cols = _margin_columns(ee, gas, heat_p, p)
+    cols["best_source"] = best_source_id(cols["m1"], cols["m2"], cols["m3"], cols["m4"])
+    return pd.DataFrame({k: np.atleast_1d(v) for k, v in cols.items()}, index=index)
+
+
+def compute_margins(ee: float, gas: float, heat_p: float, p: TechParams) -> dict:
+    """Compute marginal costs and margins for all 4 heat sources."""
+    return {k: float(v) for k, v in _margin_columns(ee, gas, heat_p, p).items()}
+
+
 def best_source(m1, m2, m3, m4) -> dict:
     """Return the most profitable heat source."""
-    options = [
-        {"name": "Plynový kotel",      "short": "Kotel",    "id": 1, "m": m1, "color": "#5B8DEE"},
-        {"name": "KGJ + spot prodej",  "short": "KGJ+Spot", "id": 2, "m": m2, "color": "#F0A500"},
-        {"name": "Elektrokotel (síť)", "short": "EKotel",   "id": 3, "m": m3, "color": "#9B59B6"},
-        {"name": "KGJ + elektrokotel", "short": "KGJ+EK",  "id": 4, "m": m4, "color": "#00D4AA"},
-    ]
-    positive = [o for o in options if o["m"] > 0]
-    if not positive:
-        return {"name": "Žádný zdroj", "short": "—", "id": 0, "m": 0.0, "color": "#E05555"}
-    return sorted(positive, key=lambda x: x["m"], reverse=True)[0]
+    sid = int(best_source_id(m1, m2, m3, m4))
+    if sid == 0:
+        return {**NO_SOURCE, "m": 0.0}
+    return {**SOURCES[sid - 1], "m": (m1, m2, m3, m4)[sid - 1]}
 
 
 # ──────────────────────────────────────────────
-# FULL LP DISPATCH OPTIMIZATION
+# MATRIX-FORM MODEL BUILDER
 # ──────────────────────────────────────────────
 
-def run_dispatch(df: pd.DataFrame, p: TechParams) -> Optional[pd.DataFrame]:
+# Column blocks, laid out variable-major: column index = block * T + t.
+VAR_NAMES = (
+    "q_KGJ", "q_boiler", "q_eboiler",
+    "ee_from_kgj", "ee_sold_spot", "ee_to_eboiler_int", "ee_to_eboiler_grid",
+    "KGJ_on", "KGJ_start", "KGJ_stop", "heat_def",
+)
+BINARY_VARS = ("KGJ_on", "KGJ_start", "KGJ_stop")
+
+# Compact model: ee_from_kgj (= kgj_el_per_heat * q_KGJ) and KGJ_stop
+# (= start - on + on[t-1]) are substituted out and heat_def, which is
+# costless and unbounded above, is dropped; _complete_solution restores them.
+COMPACT_VAR_NAMES = tuple(v for v in VAR_NAMES if v not in ("ee_from_kgj", "KGJ_stop", "heat_def"))
+
+# Min up/down as aggregated window rows (starts/stops in the last hours are
+# free) or as turn-on/turn-off inequalities (tighter LP, no end exemption).
+MIN_RUN_FORMULATIONS = ("aggregated", "turn_on")
+
+INPUT_COLUMNS = ("ee_price", "gas_price", "heat_price", "heat_demand")
+
+
+@dataclass
+class MatrixModel:
+    """MIP in sparse COO form. The objective `c` is maximised."""
+    T: int
+    var_names: tuple
+    c: np.ndarray
+    obj_offset: float
+    col_lower: np.ndarray
+    col_upper: np.ndarray
+    integrality: np.ndarray
+    rows: np.ndarray
+    cols: np.ndarray
+    vals: np.ndarray
+    row_lower: np.ndarray
+    row_upper: np.ndarray
+    row_blocks: Dict[str, int] = field(default_factory=dict)   # first row of each named block
+    weights: Optional[np.ndarray] = None   # hours per time step (time-compressed models)
+    template: Optional["ModelTemplate"] = field(default=None, repr=False)
+    mps_text: Optional["_MpsText"] = field(default=None, repr=False)   # see write_mps
+    compact: bool = False   # built with COMPACT_VAR_NAMES
+    # Compact model: (rows, stop[0] coefficient, lower, upper) of the rows that
+    # hold the substituted stop in hour 0, with bounds for initial_state = 0
+    initial_rows: Optional[tuple] = field(default=None, repr=False)
+
+    @property
+    def n_cols(self):
+        return len(self.c)
+
+    @property
+    def n_rows(self):
+        return len(self.row_lower)
+
+    def idx(self, name: str) -> np.ndarray:
+        k = self.var_names.index(name)
+        return np.arange(k * self.T, (k + 1) * self.T)
+
+    def solution(self, x: np.ndarray, integral: bool = True) -> Dict[str, np.ndarray]:
+        """Split a flat solution vector into one hourly array per variable."""
+        sol = {name: x[k * self.T:(k + 1) * self.T] for k, name in enumerate(self.var_names)}
+        for name in BINARY_VARS:
+            if integral and name in sol:
+                sol[name] = np.round(sol[name])
+        return sol
+
+    def objective(self, x: np.ndarray) -> float:
+        return float(self.c @ x + self.obj_offset)
+
+    def vector(self, sol: Dict[str, np.ndarray]) -> np.ndarray:
+        """Flatten per-variable arrays back into a solution vector."""
+        return np.concatenate([np.asarray(sol[name], dtype=float) for name in self.var_names])
+
+
+class _RowBuilder:
+    """Accumulates blocks of constraint rows as COO triplets."""
+
+    def __init__(self):
+        self.n = 0
+        self._rows, self._cols, self._vals = [], [], []
+        self._lower, self._upper = [], []
+
+    def add(self, m: int, terms, lower, upper):
+        """
+        Append `m` rows. Each term is `(cols, coef)` covering all new rows,
+        or `(local_rows, cols, coef)` covering a subset of them.
+        """
+        if m <= 0:
+            return
+        local_all = np.arange(m)
+        for term in terms:
+            local, cols, coef = term if len(term) == 3 else (local_all, *term)
+            self._rows.append(self.n + local)
+            self._cols.append(np.asarray(cols))
+            self._vals.append(np.broadcast_to(np.asarray(coef, dtype=float), (len(local),)))
+        self._lower.append(np.broadcast_to(np.asarray(lower, dtype=float), (m,)))
+        self._upper.append(np.broadcast_to(np.asarray(upper, dtype=float), (m,)))
+        self.n += m
+
+    def arrays(self):
+        return (
+            np.concatenate(self._rows).astype(np.int64),
+            np.concatenate(self._cols).astype(np.int64),
+            np.concatenate(self._vals),
+            np.concatenate(self._lower),
+            np.concatenate(self._upper),
+        )
+
+
+def _check_input(df: pd.DataFrame):
+    """Reject a frame no engine can solve before anything is built from it."""
+    missing = [col for col in ("datetime",) + INPUT_COLUMNS if col not in df]
+    if missing:
+        raise ValueError(f"Missing input columns: {missing}")
+    if len(df) == 0:
+        raise ValueError("Empty horizon: the input has no hours")
+
+
+def _input_arrays(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """Pull the hourly model inputs out of the frame as float arrays."""
+    return {col: df[col].to_numpy(dtype=float) for col in INPUT_COLUMNS}
+
+
+def _initial_lock(p: TechParams):
     """
-    Solve the full MIP dispatch problem using PuLP/CBC.
-    Returns a results DataFrame or None on failure.
+    Hours at the start of the horizon that must stay on / off because the
+    unit has spent only initial_hours in initial_state so far.
     """
-    T = len(df)
-    BYPASS_TOL = 0.001
+    if p.initial_hours is None:
+        return 0, 0
+    if p.initial_state:
+        return max(p.min_up - p.initial_hours, 0), 0
+    return 0, max(p.min_down - p.initial_hours, 0)
+
+
+def _min_run_windows(weights: np.ndarray, hours: int):
+    """
+    For every step that starts at least `hours` hours before the end of the
+    horizon: the step and the number of consecutive steps that cover `hours`
+    hours from its start. Returns (steps, lengths).
+    """
+    first = np.concatenate([[0], np.cumsum(weights)[:-1]])
+    m = int(np.searchsorted(first, weights.sum() - hours, side="left"))
+    steps = np.arange(m)
+    last = np.searchsorted(first, first[:m] + hours - 1, side="right") - 1
+    return steps, last - steps + 1
+
+
+def _trailing_windows(weights: np.ndarray, hours: int):
+    """For every step: the first step that starts less than `hours` hours before it, and the count."""
+    first = np.concatenate([[0], np.cumsum(weights)[:-1]])
+    lo = np.searchsorted(first, first - hours + 1, side="left")
+    return lo, np.arange(len(weights)) - lo + 1
+
+
+def _window_terms(col_block: np.ndarray, steps: np.ndarray, lengths: np.ndarray, coef: float):
+    """COO term summing col_block over each window [steps[r], steps[r] + lengths[r])."""
+    local = np.repeat(np.arange(len(steps)), lengths)
+    offset = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return local, col_block[np.repeat(steps, lengths) + offset], coef
+
+
+def _model_structure(p: TechParams, T: int, weights: Optional[np.ndarray] = None,
+                     formulation: str = "aggregated", compact: bool = False,
+                     free_start: bool = False) -> MatrixModel:
+    """
+    Constraint matrix, integrality and input-independent bounds of the
+    dispatch MIP. Objective, demand right-hand sides and the bounds that
+    depend on inputs or the initial state are set by _apply_inputs.
+
+    With `weights` each of the T columns per variable is a time step of
+    weights[t] identical hours (see _compress_horizon); min up/down then
+    count hours rather than steps. `formulation` is one of
+    MIN_RUN_FORMULATIONS. A compact model (COMPACT_VAR_NAMES) substitutes
+    the stop in hour 0 too, so its rows depend on free_start.
+    """
+    names = COMPACT_VAR_NAMES if compact else VAR_NAMES
+    n = len(names) * T
+    inf = np.inf
+
+    def idx(name):
+        k = names.index(name)
+        return np.arange(k * T, (k + 1) * T)
+
+    q, qb, qe = idx("q_KGJ"), idx("q_boiler"), idx("q_eboiler")
+    e_spot = idx("ee_sold_spot")
+    e_int, e_grid = idx("ee_to_eboiler_int"), idx("ee_to_eboiler_grid")
+    on, start = idx("KGJ_on"), idx("KGJ_start")
+
+    col_lower = np.zeros(n)
+    col_upper = np.full(n, inf)
+    col_upper[q] = p.kgj_heat_output
+    col_upper[qb] = p.boiler_max_heat
+    col_upper[qe] = p.eboiler_max_heat
+    integrality = np.zeros(n, dtype=bool)
+    for name in BINARY_VARS:
+        if name in names:
+            col_upper[idx(name)] = 1.0
+            integrality[idx(name)] = True
+
+    rb = _RowBuilder()
+    blocks = {}
+    rb.add(T, [(q, 1.0), (on, -p.kgj_heat_output)], -inf, 0.0)
+    rb.add(T, [(q, 1.0), (on, -p.kgj_min_load * p.kgj_heat_output)], 0.0, inf)
+    # Heat cover; with zero demand the row is slack (boilers are bounded to 0)
+    blocks["cover"] = rb.n
+    rb.add(T, [(q, 1.0), (qb, 1.0), (qe, 1.0)], 0.0, inf)
+    if compact:
+        return _compact_rows(p, T, weights, formulation, free_start, rb, blocks,
+                             col_lower, col_upper, integrality)
+
+    e_kgj, stop, h_def = idx("ee_from_kgj"), idx("KGJ_stop"), idx("heat_def")
+    blocks["heat_def"] = rb.n
+    rb.add(T, [(h_def, 1.0), (q, 1.0)], 0.0, inf)
+    rb.add(T, [(qb, 1.0), (qe, 1.0), (h_def, -1.0)], -inf, 0.0)
+
+    rb.add(T, [(e_kgj, 1.0), (q, -p.kgj_el_per_heat)], 0.0, 0.0)
+    rb.add(T, [(e_spot, 1.0), (e_int, 1.0), (e_kgj, -1.0)], 0.0, 0.0)
+    rb.add(T, [(qe, 1.0), (e_int, -p.eboiler_eff), (e_grid, -p.eboiler_eff)], 0.0, 0.0)
+
+    # on[t] - on[t-1] == start[t] - stop[t], on[-1] = initial_state
+    blocks["link"] = rb.n
+    rb.add(T, [(on, 1.0), (start, -1.0), (stop, 1.0),
+               (np.arange(1, T), on[:-1], -1.0)], 0.0, 0.0)
+
+    if formulation == "turn_on":
+        # sum(start over the last min_up hours) <= on[t], same for stops and off
+        steps = np.ones(T, dtype=np.int64) if weights is None else weights
+        if p.min_up > 1:
+            lo, lengths = _trailing_windows(steps, p.min_up)
+            rb.add(T, [_window_terms(start, lo, lengths, 1.0), (on, -1.0)], -inf, 0.0)
+        if p.min_down > 1:
+            lo, lengths = _trailing_windows(steps, p.min_down)
+            rb.add(T, [_window_terms(stop, lo, lengths, 1.0), (on, 1.0)], -inf, 1.0)
+    elif weights is None:
+        m = T - p.min_up
+        if p.min_up > 0 and m > 0:
+            rb.add(m, [(on[i:i + m], 1.0) for i in range(p.min_up)]
+                   + [(start[:m], -float(p.min_up))], 0.0, inf)
+
+        m = T - p.min_down
+        if p.min_down > 0 and m > 0:
+            rb.add(m, [(on[i:i + m], -1.0) for i in range(p.min_down)]
+                   + [(stop[:m], -float(p.min_down))], -float(p.min_down), inf)
+    else:
+        # A start/stop keeps every step touching the next min_up/min_down hours
+        steps, lengths = _min_run_windows(weights, p.min_up)
+        if p.min_up > 0 and len(steps):
+            rb.add(len(steps), [_window_terms(on, steps, lengths, 1.0),
+                                (start[steps], -lengths)], 0.0, inf)
+        steps, lengths = _min_run_windows(weights, p.min_down)
+        if p.min_down > 0 and len(steps):
+            rb.add(len(steps), [_window_terms(on, steps, lengths, -1.0),
+                                (stop[steps], -lengths)], -lengths, inf)
+
+    rows, cols, vals, row_lower, row_upper = rb.arrays()
+    return MatrixModel(
+        T=T, var_names=VAR_NAMES,
+        c=np.zeros(n), obj_offset=0.0,
+        col_lower=col_lower, col_upper=col_upper, integrality=integrality,
+        rows=rows, cols=cols, vals=vals,
+        row_lower=row_lower.copy(), row_upper=row_upper.copy(),
+        row_blocks=blocks, weights=weights,
+    )
+
+
+def _compact_rows(p: TechParams, T: int, weights: Optional[np.ndarray], formulation: str,
+                  free_start: bool, rb: "_RowBuilder", blocks: dict, col_lower: np.ndarray,
+                  col_upper: np.ndarray, integrality: np.ndarray) -> MatrixModel:
+    """
+    Remaining rows of the compact model, with stop[t] = start[t] - on[t] + on[t-1].
+    stop[0] uses on[-1] = initial_state, so its rows are shifted by
+    _apply_inputs through `initial_rows`; with free_start stop[0] is 0.
+    """
+    inf = np.inf
+
+    def idx(name):
+        k = COMPACT_VAR_NAMES.index(name)
+        return np.arange(k * T, (k + 1) * T)
+
+    q, qe = idx("q_KGJ"), idx("q_eboiler")
+    e_spot, e_int, e_grid = idx("ee_sold_spot"), idx("ee_to_eboiler_int"), idx("ee_to_eboiler_grid")
+    on, start = idx("KGJ_on"), idx("KGJ_start")
+    steps = np.ones(T, dtype=np.int64) if weights is None else weights
+    init_rows, init_coef, init_lower, init_upper = [], [], [], []
+
+    rb.add(T, [(e_spot, 1.0), (e_int, 1.0), (q, -p.kgj_el_per_heat)], 0.0, 0.0)
+    rb.add(T, [(qe, 1.0), (e_int, -p.eboiler_eff), (e_grid, -p.eboiler_eff)], 0.0, 0.0)
+
+    # 0 <= stop[t] <= 1; with free_start only start[0] <= on[0]
+    blocks["link"] = rb.n
+    if not free_start:
+        init_rows.append(rb.n), init_coef.append(1.0), init_lower.append(0.0), init_upper.append(1.0)
+    rb.add(T, [(start, 1.0), (on, -1.0), (np.arange(1, T), on[:-1], 1.0)],
+           np.r_[-1.0 if free_start else 0.0, np.zeros(T - 1)],
+           np.r_[0.0 if free_start else 1.0, np.ones(T - 1)])
+
+    if formulation == "turn_on":
+        if p.min_up > 1:
+            lo, lengths = _trailing_windows(steps, p.min_up)
+            rb.add(T, [_window_terms(start, lo, lengths, 1.0), (on, -1.0)], -inf, 0.0)
+        if p.min_down > 1:
+            # sum(stop over the window) + on[t] <= 1 telescopes to sum(start) + on[lo - 1] <= 1
+            lo, lengths = _trailing_windows(steps, p.min_down)
+            inner = np.flatnonzero(lo > 0)
+            head = np.flatnonzero(lo == 0)
+            terms = [_window_terms(start, lo, lengths, 1.0), (inner, on[lo[inner] - 1], 1.0)]
+            if free_start:
+                terms.append((head, on[np.zeros(len(head), dtype=np.int64)], 1.0))
+            else:
+                init_rows.extend((rb.n + head).tolist())
+                init_coef.extend([1.0] * len(head))
+                init_lower.extend([-inf] * len(head))
+                init_upper.extend([1.0] * len(head))
+            rb.add(T, terms, -inf, 1.0)
+    else:
+        windows, lengths = _min_run_windows(steps, p.min_up)
+        if p.min_up > 0 and len(windows):
+            rb.add(len(windows), [_window_terms(on, windows, lengths, 1.0),
+                                  (start[windows], -lengths)], 0.0, inf)
+        windows, lengths = _min_run_windows(steps, p.min_down)
+        if free_start:
+            # stop[0] = 0 leaves the first row slack
+            windows, lengths = windows[windows > 0], lengths[windows > 0]
+        if p.min_down > 0 and len(windows):
+            # -sum(on over the window) - L * stop[s] >= -L
+            inner = np.flatnonzero(windows > 0)
+            longer = np.flatnonzero(lengths > 1)
+            if not free_start and windows[0] == 0:
+                init_rows.append(rb.n), init_coef.append(-float(lengths[0]))
+                init_lower.append(-float(lengths[0])), init_upper.append(inf)
+            rb.add(len(windows), [(longer, on[windows[longer]], lengths[longer] - 1.0),
+                                  _window_terms(on, windows + 1, lengths - 1, -1.0),
+                                  (start[windows], -lengths),
+                                  (inner, on[windows[inner] - 1], -lengths[inner])],
+                   -lengths, inf)
+
+    rows, cols, vals, row_lower, row_upper = rb.arrays()
+    initial_rows = None
+    if init_rows:
+        initial_rows = (np.asarray(init_rows, dtype=np.int64), np.asarray(init_coef),
+                        np.asarray(init_lower), np.asarray(init_upper))
+    return MatrixModel(
+        T=T, var_names=COMPACT_VAR_NAMES,
+        c=np.zeros(len(COMPACT_VAR_NAMES) * T), obj_offset=0.0,
+        col_lower=col_lower, col_upper=col_upper, integrality=integrality,
+        rows=rows, cols=cols, vals=vals,
+        row_lower=row_lower.copy(), row_upper=row_upper.copy(),
+        row_blocks=blocks, weights=weights, compact=True, initial_rows=initial_rows,
+    )
+
+
+def _complete_solution(sol: Dict[str, np.ndarray], p: TechParams,
+                       initial_state: float) -> Dict[str, np.ndarray]:
+    """Restore the variables a compact model substitutes out."""
+    sol = dict(sol)
+    prev = np.concatenate([[initial_state], sol["KGJ_on"][:-1]])
+    sol["ee_from_kgj"] = p.kgj_el_per_heat * sol["q_KGJ"]
+    sol["KGJ_stop"] = np.maximum(sol["KGJ_start"] - sol["KGJ_on"] + prev, 0.0)
+    return sol
+
+
+def _apply_inputs(model: MatrixModel, base_lower: np.ndarray, base_upper: np.ndarray,
+                  arr: Dict[str, np.ndarray], p: TechParams, free_start: bool = False,
+                  fixed_on: Optional[np.ndarray] = None):
+    """Write objective, demand right-hand sides and input-dependent bounds into `model`."""
+    ee, gas, heat, demand = (arr[col] for col in INPUT_COLUMNS)
+    T = model.T
+    q, qb, qe = model.idx("q_KGJ"), model.idx("q_boiler"), model.idx("q_eboiler")
+    on, start = model.idx("KGJ_on"), model.idx("KGJ_start")
+    stop = model.idx("KGJ_stop") if not model.compact else None
+
+    h_required = p.heat_min_cover * demand
+    has_demand = demand > 0
+
+    # Bounds — boilers are pinned to zero in hours without demand
+    col_lower, col_upper = model.col_lower, model.col_upper
+    col_lower[:] = base_lower
+    col_upper[:] = base_upper
+    col_upper[qb[~has_demand]] = 0.0
+    col_upper[qe[~has_demand]] = 0.0
+    if free_start:
+        col_upper[start[0]] = 0.0
+        if stop is not None:
+            col_upper[stop[0]] = 0.0
+    else:
+        keep_on, keep_off = _initial_lock(p)
+        col_lower[on[:keep_on]] = 1.0
+        col_upper[on[:keep_off]] = 0.0
+    if fixed_on is not None:
+        pinned = ~np.isnan(fixed_on)
+        col_lower[on[pinned]] = col_upper[on[pinned]] = fixed_on[pinned]
+        # No start/stop between two pinned hours in the same state
+        steady = np.flatnonzero(pinned[1:] & pinned[:-1] & (fixed_on[1:] == fixed_on[:-1])) + 1
+        col_upper[start[steady]] = 0.0
+        if stop is not None:
+            col_upper[stop[steady]] = 0.0
+
+    # Objective
+    c = model.c
+    c[:] = 0.0
+    c[q] = -gas * p.kgj_gas_per_heat
+    c[qb] = -gas / p.boiler_eff
+    c[model.idx("ee_sold_spot")] = ee
+    c[model.idx("ee_to_eboiler_grid")] = -(ee + p.ee_dist_cost)
+    c[on] = -p.kgj_service
+    offset = heat * h_required
+    if model.weights is not None:
+        c *= np.tile(model.weights, len(model.var_names))
+        offset = offset * model.weights
+    model.obj_offset = float(np.sum(offset))
 
-    model = pulp.LpProblem("KGJ_Integrated_Dispatch", pulp.LpMaximize)
+    # Demand right-hand sides and the initial-state link row
+    cover, link = model.row_blocks["cover"], model.row_blocks["link"]
+    model.row_lower[cover:cover + T] = h_required
+    if model.compact:
+        if model.initial_rows is not None and not free_start:
+            rows, coef, lower, upper = model.initial_rows
+            model.row_lower[rows] = lower - coef * p.initial_state
+            model.row_upper[rows] = upper - coef * p.initial_state
+        return
+    h_def = model.row_blocks["heat_def"]
+    model.row_lower[h_def:h_def + T] = h_required
+    if free_start:
+        model.row_lower[link], model.row_upper[link] = 0.0, 1.0
+    else:
+        model.row_lower[link] = model.row_upper[link] = p.initial_state
 
-    # Variables
-    q_kgj     = pulp.LpVariable.dicts("q_KGJ",    range(T), 0, p.kgj_heat_output)
-    q_boiler  = pulp.LpVariable.dicts("q_boiler",  range(T), 0, p.boiler_max_heat)
-    q_eboiler = pulp.LpVariable.dicts("q_eboiler", range(T), 0, p.eboiler_max_heat)
 
-    ee_from_kgj          = pulp.LpVariable.dicts("ee_from_kgj",          range(T), 0)
-    ee_sold_spot         = pulp.LpVariable.dicts("ee_sold_spot",         range(T), 0)
-    ee_to_eboiler_int    = pulp.LpVariable.dicts("ee_to_eboiler_int",    range(T), 0)
-    ee_to_eboiler_grid   = pulp.LpVariable.dicts("ee_to_eboiler_grid",   range(T), 0)
+class ModelTemplate:
+    """
+    The dispatch MIP for one parameter set and horizon length. The matrix is
+    built once; apply() only overwrites objective, demand right-hand sides
+    and bounds in place. Backends may keep per-template state (e.g. a
+    persistent HiGHS instance) in `solver_state`. Hold `lock` from apply()
+    until the solve has finished (see locked_template).
+    """
+
+    def __init__(self, p: TechParams, T: int, weights: Optional[np.ndarray] = None,
+                 formulation: str = "aggregated", compact: bool = False, free_start: bool = False):
+        self.T = T
+        self.model = _model_structure(p, T, weights, formulation, compact, free_start)
+        self.model.template = self
+        self._base_lower = self.model.col_lower.copy()
+        self._base_upper = self.model.col_upper.copy()
+        self.solver_state = {}
+        self.lock = threading.Lock()
+
+    def apply(self, arr: Dict[str, np.ndarray], p: TechParams, free_start: bool = False,
+              fixed_on: Optional[np.ndarray] = None) -> MatrixModel:
+        _apply_inputs(self.model, self._base_lower, self._base_upper, arr, p, free_start, fixed_on)
+        return self.model
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held: arrays, cached MPS text and solver state."""
+        m = self.model
+        arrays = (m.c, m.col_lower, m.col_upper, m.integrality, m.rows, m.cols, m.vals,
+                  m.row_lower, m.row_upper, self._base_lower, self._base_upper)
+        size = sum(a.nbytes for a in arrays)
+        if m.mps_text is not None:
+            size += m.mps_text.nbytes
+        if "highs" in self.solver_state:
+            # HiGHS holds the matrix (CSC) plus bounds, basis and solution per row/column
+            size += 12 * len(m.vals) + 64 * (m.n_cols + m.n_rows)
+        return size
+
+
+MAX_TEMPLATES = 8
+TEMPLATE_MB_ENV = "KGJ_TEMPLATE_MB"
+MAX_TEMPLATE_BYTES = int(float(os.environ.get(TEMPLATE_MB_ENV, 256)) * 1024 ** 2)
+_TEMPLATES = OrderedDict()
+_TEMPLATES_LOCK = threading.Lock()
+
+
+def _template_key(p: TechParams, T: int, weights: Optional[np.ndarray], formulation: str,
+                  compact: bool, free_start: bool) -> tuple:
+    # The initial state only enters bounds, so rolling windows share a template
+    # (compact models differ in structure with free_start)
+    steps = None if weights is None else hashlib.sha1(weights.astype(np.int64).tobytes()).hexdigest()
+    return (astuple(replace(p, initial_state=0, initial_hours=None)), T, steps, formulation,
+            compact, compact and free_start)
+
+
+def get_template(p: TechParams, T: int, weights: Optional[np.ndarray] = None,
+                 formulation: str = "aggregated", compact: bool = False,
+                 free_start: bool = False) -> ModelTemplate:
+    """
+    Model template for these parameters and horizon, reused across runs.
+    Least recently used templates are dropped beyond MAX_TEMPLATES or once
+    together they hold more than MAX_TEMPLATE_BYTES ($KGJ_TEMPLATE_MB); the
+    one returned is always kept.
+    """
+    key = _template_key(p, T, weights, formulation, compact, free_start)
+    with _TEMPLATES_LOCK:
+        template = _TEMPLATES.get(key)
+        if template is None:
+            template = _TEMPLATES[key] = ModelTemplate(p, T, weights, formulation,
+                                                       compact, compact and free_start)
+        _TEMPLATES.move_to_end(key)
+        sizes = [t.nbytes for t in _TEMPLATES.values()]
+        while len(_TEMPLATES) > 1 and (len(_TEMPLATES) > MAX_TEMPLATES or sum(sizes) > MAX_TEMPLATE_BYTES):
+            _TEMPLATES.popitem(last=False)
+            sizes.pop(0)
+        return template
+
+
+@contextmanager
+def locked_template(p: TechParams, T: int, weights: Optional[np.ndarray] = None,
+                    formulation: str = "aggregated", compact: bool = False, free_start: bool = False):
+    """
+    The shared template for these parameters, locked for the body. While
+    another solve holds it (two sessions solving the same site) a private,
+    unshared template is built instead, so solves never queue on each other.
+    """
+    template = get_template(p, T, weights, formulation, compact, free_start)
+    if not template.lock.acquire(blocking=False):
+        yield ModelTemplate(p, T, weights, formulation, compact, compact and free_start)
+        return
+    try:
+        yield template
+    finally:
+        template.lock.release()
+
+
+def build_model(arr: Dict[str, np.ndarray], p: TechParams, free_start: bool = False,
+                fixed_on: Optional[np.ndarray] = None, formulation: str = "aggregated",
+                compact: bool = False) -> MatrixModel:
+    """
+    Assemble bounds, constraint matrix and objective of the dispatch MIP
+    directly from the hourly input arrays (a one-off, unshared model).
+
+    free_start leaves the state before the first hour open (no start/stop
+    in hour 0); fixed_on pins KGJ_on wherever it is not NaN.
+    """
+    model = _model_structure(p, len(arr["ee_price"]), formulation=formulation,
+                             compact=compact, free_start=free_start)
+    _apply_inputs(model, model.col_lower.copy(), model.col_upper.copy(), arr, p, free_start, fixed_on)
+    return model
+
+
+# ──────────────────────────────────────────────
+# CBC HAND-OFF (free MPS file)
+# ──────────────────────────────────────────────
+
+def _fmt(values: np.ndarray) -> list:
+    # Costs and bounds repeat a lot, so only the distinct values are formatted
+    uniq, inverse = np.unique(values, return_inverse=True)
+    text = np.array([f"{v:.12g}" for v in uniq.tolist()], dtype=object)
+    return text[inverse.ravel()].tolist()
 
-    kgj_on    = pulp.LpVariable.dicts("KGJ_on",    range(T), 0, 1, cat="Binary")
-    kgj_start = pulp.LpVariable.dicts("KGJ_start", range(T), 0, 1, cat="Binary")
-    kgj_stop  = pulp.LpVariable.dicts("KGJ_stop",  range(T), 0, 1, cat="Binary")
-    heat_def  = pulp.LpVariable.dicts("heat_def",  range(T), 0)
 
-    # Constraints
-    for t in range(T):
-        demand     = df.loc[t, "heat_demand"]
-        h_required = p.heat_min_cover * demand
+def _names(prefix: str, idx) -> list:
+    """Fixed-width MPS names (CBC's reader expects the classic column layout)."""
+    return [f"{prefix}{i:<7}" for i in np.asarray(idx).tolist()]
 
-        model += q_kgj[t] <= p.kgj_heat_output * kgj_on[t]
-        model += q_kgj[t] >= p.kgj_min_load * p.kgj_heat_output * kgj_on[t]
 
-        if demand > 0:
-            model += q_kgj[t] + q_boiler[t] + q_eboiler[t] >= h_required
+class _MpsText:
+    """
+    A model's MPS text: the COLUMNS section split around the objective
+    entries and the row/column names, which only depend on the structure,
+    plus the row and bound sections last rendered, keyed by their values.
+    """
+
+    def __init__(self, model: MatrixModel):
+        n = model.n_cols
+        # Every column gets an objective entry so that it is always declared.
+        all_cols = np.concatenate([np.arange(n), model.cols])
+        all_rows = np.concatenate([np.full(n, -1), model.rows])
+        all_vals = np.concatenate([np.zeros(n), model.vals])
+        order = np.lexsort((all_rows, all_cols))
+        all_cols, all_rows, all_vals = all_cols[order], all_rows[order], all_vals[order]
+
+        self.col_names = _names("C", np.arange(n))
+        self.row_names = _names("R", np.arange(model.n_rows))
+        names = [self.col_names[j] for j in all_cols.tolist()]
+        # "\0" marks where each objective value goes
+        entries = [f"    {c}  OBJ       \0" if r < 0 else f"    {c}  {self.row_names[r]}  {v}"
+                   for c, r, v in zip(names, all_rows.tolist(), _fmt(all_vals))]
+
+        # INTORG/INTEND markers around each run of integer columns
+        integer = model.integrality[all_cols]
+        switch = np.flatnonzero(np.diff(np.concatenate([[False], integer, [False]]).astype(np.int8)))
+        for k, pos in enumerate(switch[::-1]):
+            marker = "INTEND" if (len(switch) - 1 - k) % 2 else "INTORG"
+            entries.insert(pos, f"    MARKER                 'MARKER'                 '{marker}'")
+        self.columns = "\n".join(["COLUMNS"] + entries + [""]).split("\0")
+        self._sections = {}
+
+    def section(self, name: str, arrays: tuple, render: Callable):
+        """render(*arrays), reused while the arrays keep their values."""
+        key = hashlib.sha1(b"".join(a.tobytes() for a in arrays)).digest()
+        cached = self._sections.get(name)
+        if cached is None or cached[0] != key:
+            cached = self._sections[name] = (key, render(*arrays))
+        return cached[1]
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held (str payload plus object headers)."""
+        strings = self.columns + self.col_names + self.row_names
+        strings += [s for _, text in self._sections.values()
+                    for s in (text if isinstance(text, tuple) else (text,))]
+        return sum(len(s) for s in strings) + 56 * len(strings)
+
+
+def _mps_rows(names: list, lo: np.ndarray, hi: np.ndarray):
+    """ROWS section and RHS/RANGES sections."""
+    is_eq = lo == hi
+    is_ge = ~is_eq & np.isfinite(lo)
+    is_le = ~is_eq & ~is_ge
+    row_type = np.where(is_eq, "E", np.where(is_ge, "G", "L"))
+    rhs = np.where(is_le, hi, lo)
+    ranged = is_ge & np.isfinite(hi)
+
+    rows = ["ROWS", " N  OBJ"] + [f" {t}  R{i}" for i, t in enumerate(row_type.tolist())]
+    lines = ["RHS"]
+    nz = np.flatnonzero(rhs != 0)
+    lines += [f"    RHS       {names[r]}  {v}" for r, v in zip(nz.tolist(), _fmt(rhs[nz]))]
+    if ranged.any():
+        lines.append("RANGES")
+        rg = np.flatnonzero(ranged)
+        lines += [f"    RNG       {names[r]}  {v}" for r, v in zip(rg.tolist(), _fmt(hi[rg] - lo[rg]))]
+    return "\n".join(rows) + "\n", "\n".join(lines) + "\n"
+
+
+def _mps_bounds(names: list, c_lo: np.ndarray, c_hi: np.ndarray) -> str:
+    lines = ["BOUNDS"]
+    fixed = c_lo == c_hi
+    sel = np.flatnonzero(fixed)
+    lines += [f" FX BND       {names[j]}  {v}" for j, v in zip(sel.tolist(), _fmt(c_lo[sel]))]
+    sel = np.flatnonzero(~fixed & np.isneginf(c_lo))
+    lines += [f" MI BND       {names[j]}" for j in sel.tolist()]
+    sel = np.flatnonzero(~fixed & np.isfinite(c_lo) & (c_lo != 0))
+    lines += [f" LO BND       {names[j]}  {v}" for j, v in zip(sel.tolist(), _fmt(c_lo[sel]))]
+    sel = np.flatnonzero(~fixed & np.isfinite(c_hi))
+    lines += [f" UP BND       {names[j]}  {v}" for j, v in zip(sel.tolist(), _fmt(c_hi[sel]))]
+    return "\n".join(lines) + "\n"
+
+
+def write_mps(model: MatrixModel, path: str):
+    """
+    Write the model as a (minimisation) MPS file with C<j>/R<i> names. The
+    text is cached on the model (see _MpsText): repeated solves of a
+    template format the objective and only re-render the row and bound
+    sections whose values apply() changed.
+    """
+    if model.mps_text is None:
+        model.mps_text = _MpsText(model)
+    text = model.mps_text
+    rows, rhs = text.section("rows", (model.row_lower, model.row_upper),
+                             partial(_mps_rows, text.row_names))
+    bounds = text.section("bounds", (model.col_lower, model.col_upper),
+                          partial(_mps_bounds, text.col_names))
+    segments = text.columns
+    columns = list(chain.from_iterable(zip(segments, _fmt(-model.c))))
+    columns.append(segments[-1])
+
+    with open(path, "w") as f:
+        f.write("NAME KGJ_Integrated_Dispatch\n")
+        f.write(rows)
+        f.write("".join(columns))
+        f.write(rhs)
+        f.write(bounds)
+        f.write("ENDATA\n")
+
+
+def _read_cbc_solution(path: str, n_cols: int):
+    """Parse a CBC solution file into (status, x)."""
+    x = np.zeros(n_cols)
+    with open(path) as f:
+        head = f.readline().split()
+        for line in f:
+            parts = line.split()
+            if parts and parts[0] == "**":
+                parts = parts[1:]
+            if len(parts) >= 3 and parts[1].startswith("C"):
+                x[int(parts[1][1:])] = float(parts[2])
+
+    first = head[0] if head else ""
+    if first == "Optimal":
+        status = "Optimal"
+    elif first == "Stopped" and len(head) >= 5 and head[4] == "objective":
+        status = "Feasible"
+    elif first in ("Infeasible", "Integer"):
+        status = "Infeasible"
+    elif first == "Unbounded":
+        status = "Unbounded"
+    else:
+        status = "Not Solved"
+    return status, x
+
+
+def _write_mip_start(model: MatrixModel, x: np.ndarray, path: str):
+    """Write a full solution vector in CBC's solution-file format (for -mips)."""
+    lines = ["Stopped on time - objective value 0"]
+    lines += [f"{j:>7} C{j} {v} 0" for j, v in enumerate(_fmt(x))]
+    with open(path, "w") as f:
+        f.write("\n".join(lines))
+        f.write("\n")
+
+
+def _cbc_log_stats(log: str) -> dict:
+    """Node count and relative gap from CBC's final summary."""
+    nodes = re.search(r"^Enumerated nodes:\s+(\d+)", log, re.M)
+    gap = re.search(r"^Gap:\s+(\S+)", log, re.M)
+    return {"nodes": int(nodes.group(1)) if nodes else None,
+            "gap": float(gap.group(1)) if gap else None}
+
+
+def _drain_lines(stream, lines: list):
+    for line in stream:
+        lines.append(line)
+
+
+_CBC_INCUMBENT = re.compile(r"^Cbc00(04|12|45)I ")   # integer solution found / MIP start accepted
+_CBC_PROGRESS = re.compile(r"Cbc0010I After \d+ nodes, \d+ on tree, (\S+) best solution, best possible (\S+)")
+
+
+def _cbc_line_gap(line: str) -> Optional[float]:
+    """Relative gap from a CBC branch-and-bound progress line (None for other lines)."""
+    match = _CBC_PROGRESS.search(line)
+    if match is None:
+        return None
+    best, bound = float(match.group(1)), float(match.group(2))
+    if abs(best) >= 1e49:   # no incumbent yet
+        return None
+    return abs(best - bound) / max(abs(best), 1e-9)
+
+
+# ──────────────────────────────────────────────
+# SOLVER BACKENDS
+# ──────────────────────────────────────────────
+
+DEFAULT_TIME_LIMIT = 120.0
+STOP_REASONS = ("cancelled", "time_limit")
+CANCEL_GRACE = 5.0     # seconds CBC gets to write its incumbent after a cancel before it is killed
+DEADLINE_GRACE = 0.5   # the same past the time budget, which is meant to be hard
+
+
+class CancelToken:
+    """
+    Stops a dispatch early: cancel() from any thread, or the wall-clock
+    deadline set by limit() passing. Solvers then stop with their best
+    incumbent. Pickled copies (for worker processes) keep the deadline, and
+    inside shared() also see cancel() through a flag file.
+    """
+
+    def __init__(self, budget: Optional[float] = None):
+        self.deadline = None
+        self._event = threading.Event()
+        self._flag = None       # file whose existence means cancelled, see shared()
+        self._checked = 0.0
+        if budget is not None:
+            self.limit(budget)
+
+    def limit(self, budget: float):
+        """Move the deadline to `budget` seconds from now unless it is already earlier."""
+        deadline = time.time() + float(budget)
+        self.deadline = deadline if self.deadline is None else min(self.deadline, deadline)
+
+    @contextmanager
+    def shared(self):
+        """
+        For the body, cancel() also reaches copies pickled to worker
+        processes: it creates a flag file in a temporary directory that
+        they check. Leave the body only after the workers are done.
+        """
+        if self._flag is not None:   # nested: the outer flag is shared already
+            yield self
+            return
+        directory = tempfile.mkdtemp(prefix="kgj_cancel_")
+        self._flag = os.path.join(directory, "cancelled")
+        try:
+            if self.cancelled:
+                self.cancel()
+            yield self
+        finally:
+            self._flag = None
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def cancel(self):
+        self._event.set()
+        flag = self._flag
+        if flag is not None:
+            try:
+                open(flag, "w").close()
+            except OSError:   # shared() has just ended
+                pass
+
+    @property
+    def cancelled(self) -> bool:
+        if self._event.is_set():
+            return True
+        flag = self._flag
+        # The flag file is looked at no more than ten times a second
+        if flag is not None and time.time() - self._checked >= 0.1:
+            self._checked = time.time()
+            if os.path.exists(flag):
+                self._event.set()
+                return True
+        return False
+
+    def remaining(self) -> float:
+        return np.inf if self.deadline is None else max(self.deadline - time.time(), 0.0)
+
+    def reason(self) -> Optional[str]:
+        """"cancelled", "time_limit" once the deadline has passed, else None."""
+        if self.cancelled:
+            return "cancelled"
+        if self.deadline is not None and time.time() >= self.deadline:
+            return "time_limit"
+        return None
+
+    def __getstate__(self):
+        return {"deadline": self.deadline, "flag": self._flag, "cancelled": self.cancelled}
+
+    def __setstate__(self, state):
+        self.deadline = state["deadline"]
+        self._event = threading.Event()
+        self._flag = state.get("flag")
+        self._checked = 0.0
+        if state.get("cancelled"):
+            self._event.set()
+
+
+@dataclass(frozen=True)
+class SolverOptions:
+    backend: str = "cbc"
+    formulation: str = "aggregated"   # see MIN_RUN_FORMULATIONS
+    compact: bool = False             # substitute out redundant columns (COMPACT_VAR_NAMES)
+    threads: Optional[int] = None   # None = solver default
+    time_limit: float = DEFAULT_TIME_LIMIT   # seconds per solve
+    mip_gap: Optional[float] = None   # relative optimality gap, None = solver default
+    presolve: bool = True           # time-compress runs of identical hours, fix dominated hours
+    # progress(fraction 0..1, message) during the solve, see _report
+    progress: Optional[Callable[[float, str], None]] = field(default=None, compare=False)
+    cancel: Optional[CancelToken] = field(default=None, compare=False)
+
+
+def _time_limit(opts: SolverOptions) -> float:
+    """Per-solve time limit, cut to what is left of the cancel token's budget."""
+    limit = opts.time_limit if opts.cancel is None else min(opts.time_limit, opts.cancel.remaining())
+    return max(float(limit), 0.1)
+
+
+def _stop_reason(opts: SolverOptions) -> Optional[str]:
+    return opts.cancel.reason() if opts.cancel is not None else None
+
+
+def _report(opts: SolverOptions, fraction: float, message: str = ""):
+    if opts.progress is not None:
+        opts.progress(min(max(float(fraction), 0.0), 1.0), message)
+
+
+def _subprogress(opts: SolverOptions, lo: float, hi: float, label: str = "") -> SolverOptions:
+    """opts whose progress maps 0..1 onto lo..hi of the caller's progress, messages prefixed by label."""
+    if opts.progress is None:
+        return opts
+    outer = opts.progress
+
+    def progress(fraction, message=""):
+        outer(lo + (hi - lo) * fraction, f"{label} — {message}" if label and message else label or message)
+
+    return replace(opts, progress=progress)
+
+
+class _MipProgress:
+    """
+    Throttled MIP progress: the larger of the elapsed share of the time
+    limit and the share of the MIP gap closed (log scale, from the first gap
+    seen down to the target gap).
+    """
+
+    def __init__(self, opts: SolverOptions, interval: float = 0.5):
+        self.opts = opts
+        self.interval = interval
+        self.target = max(1e-4 if opts.mip_gap is None else opts.mip_gap, 1e-9)
+        self.first_gap = None
+        self.t0 = time.perf_counter()
+        self.last = -np.inf
+
+    def update(self, gap: Optional[float] = None):
+        now = time.perf_counter()
+        if now - self.last < self.interval:
+            return
+        self.last = now
+        elapsed = now - self.t0
+        fraction = elapsed / self.opts.time_limit
+        message = f"MIP řešič {elapsed:.0f} s"
+        if gap is not None and np.isfinite(gap):
+            if self.first_gap is None and gap > self.target:
+                self.first_gap = gap
+            if self.first_gap is not None:
+                closed = np.log(self.first_gap / max(gap, self.target)) / np.log(self.first_gap / self.target)
+                fraction = max(fraction, closed)
+            message += f", mezera {100 * gap:.2f} %"
+        _report(self.opts, min(fraction, 0.99), message)
+
+
+class SolverBackend(abc.ABC):
+    """
+    Interface of a MIP backend: solve() takes a MatrixModel and returns
+    (status, x or None, stats) where stats holds wall_time, nodes and gap.
+    relax=True solves the LP relaxation instead.
+    """
+    name = ""
+
+    @abc.abstractmethod
+    def available(self) -> bool:
+        ...
+
+    @abc.abstractmethod
+    def solve(self, model: MatrixModel, opts: SolverOptions, x_start: Optional[np.ndarray] = None,
+              relax: bool = False):
+        ...
+
+
+# Running CBC processes, killed at interpreter exit so none outlives the app
+_LIVE_SOLVERS = set()
+_LIVE_SOLVERS_LOCK = threading.Lock()
+
+
+def _register_solver(proc: subprocess.Popen):
+    with _LIVE_SOLVERS_LOCK:
+        _LIVE_SOLVERS.add(proc)
+
+
+def _unregister_solver(proc: subprocess.Popen):
+    with _LIVE_SOLVERS_LOCK:
+        _LIVE_SOLVERS.discard(proc)
+
+
+@atexit.register
+def _kill_live_solvers():
+    with _LIVE_SOLVERS_LOCK:
+        for proc in _LIVE_SOLVERS:
+            if proc.poll() is None:
+                proc.kill()
+
+
+def _interrupt(proc: subprocess.Popen):
+    if os.name == "posix":
+        proc.send_signal(signal.SIGINT)
+    else:
+        proc.kill()
+
+
+class CbcBackend(SolverBackend):
+    """The CBC binary bundled with PuLP, fed an MPS file."""
+    name = "cbc"
+
+    def _solver(self, opts: SolverOptions):
+        return pulp.PULP_CBC_CMD(msg=False, timeLimit=_time_limit(opts))
+
+    def available(self) -> bool:
+        return self._solver(SolverOptions()).available()
+
+    def solve(self, model: MatrixModel, opts: SolverOptions, x_start: Optional[np.ndarray] = None,
+              relax: bool = False):
+        solver = self._solver(opts)
+        if not solver.available():
+            raise pulp.PulpSolverError("CBC solver is not available")
+
+        t0 = time.perf_counter()
+        with tempfile.TemporaryDirectory(prefix="kgj_") as tmp:
+            mps_path = os.path.join(tmp, "model.mps")
+            sol_path = os.path.join(tmp, "model.sol")
+            write_mps(model, mps_path)
+            cmd = [solver.path, mps_path]
+            if x_start is not None and not relax:
+                mst_path = os.path.join(tmp, "model.mst")
+                _write_mip_start(model, x_start, mst_path)
+                cmd += ["-mips", mst_path]
+            if opts.threads:
+                cmd += ["-threads", str(int(opts.threads))]
+            if opts.mip_gap is not None:
+                cmd += ["-ratioGap", str(opts.mip_gap)]
+            cmd += ["-sec", str(_time_limit(opts)), "-timeMode", "elapsed",
+                    "-initialSolve" if relax else "-branch",
+                    "-printingOptions", "all", "-solution", sol_path]
+            # CBC block-buffers its log, so it is drained on a thread while
+            # progress is reported on the clock from the latest gap seen
+            tracker = _MipProgress(opts) if opts.progress is not None and not relax else None
+            log, stopped = [], None
+            deadline = time.perf_counter() + _time_limit(opts)
+            with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True) as proc:
+                _register_solver(proc)
+                try:
+                    reader = threading.Thread(target=_drain_lines, args=(proc.stdout, log), daemon=True)
+                    reader.start()
+                    seen, gap, incumbent, interrupted, wake = 0, None, False, None, deadline
+                    while True:
+                        try:
+                            proc.wait(timeout=min(max(wake - time.perf_counter(), 0.01), 0.5))
+                            break
+                        except subprocess.TimeoutExpired:
+                            pass
+                        lines, seen = log[seen:], len(log)
+                        incumbent = incumbent or any(_CBC_INCUMBENT.match(line) for line in lines)
+                        if tracker is not None:
+                            gaps = [g for g in map(_cbc_line_gap, lines) if g is not None]
+                            gap = gaps[-1] if gaps else gap
+                            tracker.update(gap)
+                        # SIGINT makes CBC stop and write its incumbent, but it only
+                        # reacts between heuristics (-sec likewise), so it is killed
+                        # after a grace period, a short one past the time budget.
+                        # Without an incumbent (on a year, CBC spends ~20 s in cut
+                        # preprocessing before even loading the MIP start) there is
+                        # nothing to wait for, so it is killed at once.
+                        now = time.perf_counter()
+                        if interrupted is None:
+                            reason = _stop_reason(opts) or ("time_limit" if now >= deadline else None)
+                            if reason is not None:
+                                stopped = reason
+                                interrupted = max(now, deadline) if reason == "time_limit" else now
+                                wake = interrupted + (CANCEL_GRACE if stopped == "cancelled" else DEADLINE_GRACE)
+                                if incumbent:
+                                    _interrupt(proc)
+                                else:
+                                    proc.kill()
+                        elif now >= wake:
+                            proc.kill()
+                    reader.join()
+                except BaseException:
+                    proc.kill()
+                    raise
+                finally:
+                    _unregister_solver(proc)
+            if os.path.exists(sol_path):
+                status, x = _read_cbc_solution(sol_path, model.n_cols)
+            else:
+                status, x = "Not Solved", None
+
+        log = "".join(log)
+        stats = _cbc_log_stats(log)
+        if status == "Optimal":
+            stats["gap"] = 0.0
+        elif stopped is None and re.search(r"^Result - Stopped on time", log, re.M):
+            stopped = "time_limit"
+        if status != "Optimal" and stopped is not None:
+            stats["stopped"] = stopped
+        stats["wall_time"] = time.perf_counter() - t0
+        return status, x, stats
+
+
+def _highs_lp(model: MatrixModel):
+    """The model as a column-wise HighsLp (COO triplets converted to CSC)."""
+    order = np.lexsort((model.rows, model.cols))
+    cols = model.cols[order]
+
+    lp = highspy.HighsLp()
+    lp.num_col_ = model.n_cols
+    lp.num_row_ = model.n_rows
+    lp.sense_ = highspy.ObjSense.kMaximize
+    lp.offset_ = float(model.obj_offset)
+    lp.col_cost_ = model.c
+    lp.col_lower_ = model.col_lower
+    lp.col_upper_ = model.col_upper
+    lp.row_lower_ = model.row_lower
+    lp.row_upper_ = model.row_upper
+    lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+    lp.a_matrix_.num_col_ = model.n_cols
+    lp.a_matrix_.num_row_ = model.n_rows
+    lp.a_matrix_.start_ = np.searchsorted(cols, np.arange(model.n_cols + 1)).astype(np.int32)
+    lp.a_matrix_.index_ = model.rows[order].astype(np.int32)
+    lp.a_matrix_.value_ = model.vals[order]
+    lp.integrality_ = [highspy.HighsVarType.kInteger if i else highspy.HighsVarType.kContinuous
+                       for i in model.integrality.tolist()]
+    return lp
+
+
+class HighsBackend(SolverBackend):
+    """
+    In-process HiGHS through highspy; no file round-trip, multithreaded.
+    Models from a ModelTemplate reuse one persistent instance: only costs
+    and bounds are pushed, and the previous solution is offered as a start.
+    """
+    name = "highs"
+
+    def available(self) -> bool:
+        return highspy is not None
+
+    def _instance(self, model: MatrixModel):
+        state = model.template.solver_state if model.template is not None else {}
+        h = state.get("highs")
+        if h is None:
+            h = highspy.Highs()
+            h.setOptionValue("output_flag", False)
+            h.passModel(_highs_lp(model))
+            state["highs"] = h
+        else:
+            n, m = model.n_cols, model.n_rows
+            h.changeColsCost(n, np.arange(n, dtype=np.int32), model.c)
+            h.changeColsBounds(n, np.arange(n, dtype=np.int32), model.col_lower, model.col_upper)
+            h.changeRowsBounds(m, np.arange(m, dtype=np.int32), model.row_lower, model.row_upper)
+            h.changeObjectiveOffset(float(model.obj_offset))
+        return h, state
+
+    def solve(self, model: MatrixModel, opts: SolverOptions, x_start: Optional[np.ndarray] = None,
+              relax: bool = False):
+        if highspy is None:
+            raise RuntimeError("HiGHS backend requires the highspy package")
+
+        t0 = time.perf_counter()
+        h, state = self._instance(model)
+        h.setOptionValue("time_limit", _time_limit(opts))
+        h.setOptionValue("mip_rel_gap", 1e-4 if opts.mip_gap is None else float(opts.mip_gap))
+        h.setOptionValue("threads", int(opts.threads) if opts.threads else 0)
+        if relax:
+            binaries = np.flatnonzero(model.integrality).astype(np.int32)
+            h.changeColsIntegrality(len(binaries), binaries,
+                                    [highspy.HighsVarType.kContinuous] * len(binaries))
         else:
-            model += q_boiler[t] == 0
-            model += q_eboiler[t] == 0
+            if x_start is None:
+                x_start = state.get("highs_x")
+            if x_start is not None:
+                start = highspy.HighsSolution()
+                start.col_value = x_start.tolist()
+                start.value_valid = True
+                h.setSolution(start)
+        track = (opts.progress is not None or opts.cancel is not None) and not relax
+        if track:
+            tracker = _MipProgress(opts) if opts.progress is not None else None
 
-        model += heat_def[t] >= h_required - q_kgj[t]
-        model += q_boiler[t] + q_eboiler[t] <= heat_def[t]
+            def on_interrupt(callback_type, message, data_out, data_in, user_data):
+                if tracker is not None:
+                    tracker.update(data_out.mip_gap)
+                if _stop_reason(opts) is not None:
+                    data_in.user_interrupt = True
 
-        model += ee_from_kgj[t]       == q_kgj[t] * p.kgj_el_per_heat
-        model += ee_sold_spot[t] + ee_to_eboiler_int[t] == ee_from_kgj[t]
-        model += q_eboiler[t]         == p.eboiler_eff * (ee_to_eboiler_int[t] + ee_to_eboiler_grid[t])
+            h.setCallback(on_interrupt, None)
+            h.startCallback(highspy.cb.HighsCallbackType.kCallbackMipInterrupt)
+        try:
+            h.run()
+        finally:
+            if track:
+                h.stopCallback(highspy.cb.HighsCallbackType.kCallbackMipInterrupt)
+            if relax:
+                h.changeColsIntegrality(len(binaries), binaries,
+                                        [highspy.HighsVarType.kInteger] * len(binaries))
 
-        if t > 0:
-            model += kgj_on[t] - kgj_on[t-1] == kgj_start[t] - kgj_stop[t]
+        model_status = h.getModelStatus()
+        info = h.getInfo()
+        has_solution = info.primal_solution_status == 2   # kSolutionStatusFeasible
+        if model_status == highspy.HighsModelStatus.kOptimal:
+            status = "Optimal"
+        elif model_status == highspy.HighsModelStatus.kInfeasible:
+            status = "Infeasible"
+        elif model_status in (highspy.HighsModelStatus.kUnbounded,
+                              highspy.HighsModelStatus.kUnboundedOrInfeasible):
+            status = "Unbounded"
+        elif has_solution:
+            status = "Feasible"
         else:
-            model += kgj_on[t] - p.initial_state == kgj_start[t] - kgj_stop[t]
+            status = "Not Solved"
 
-    for t in range(T - p.min_up):
-        model += pulp.lpSum(kgj_on[t+i] for i in range(p.min_up)) >= p.min_up * kgj_start[t]
+        x = np.asarray(h.getSolution().col_value) if has_solution else None
+        if not relax:
+            state["highs_x"] = x
+        gap = info.mip_gap if has_solution and np.isfinite(info.mip_gap) else None
+        stats = {"nodes": None if relax else int(info.mip_node_count),
+                 "gap": 0.0 if status == "Optimal" else gap,
+                 "wall_time": time.perf_counter() - t0}
+        if model_status == highspy.HighsModelStatus.kInterrupt:
+            stats["stopped"] = _stop_reason(opts) or "cancelled"
+        elif model_status == highspy.HighsModelStatus.kTimeLimit:
+            stats["stopped"] = "time_limit"
+        return status, x, stats
 
-    for t in range(T - p.min_down):
-        model += pulp.lpSum(1 - kgj_on[t+i] for i in range(p.min_down)) >= p.min_down * kgj_stop[t]
 
-    # Objective
-    profit_terms = []
-    for t in range(T):
-        ee_p      = df.loc[t, "ee_price"]
-        gas_p     = df.loc[t, "gas_price"]
-        heat_p    = df.loc[t, "heat_price"]
-        delivered = p.heat_min_cover * df.loc[t, "heat_demand"]
-        profit_terms.append(
-            heat_p * delivered
-            + ee_p * ee_sold_spot[t]
-            - gas_p * (q_kgj[t] * p.kgj_gas_per_heat + q_boiler[t] / p.boiler_eff)
-            - (ee_p + p.ee_dist_cost) * ee_to_eboiler_grid[t]
-            - p.kgj_service * kgj_on[t]
-        )
-    model += pulp.lpSum(profit_terms)
+SOLVER_BACKENDS = {"cbc": CbcBackend, "highs": HighsBackend}
+
+
+def get_backend(name: str) -> SolverBackend:
+    if name not in SOLVER_BACKENDS:
+        raise ValueError(f"Unknown solver backend: {name}")
+    return SOLVER_BACKENDS[name]()
 
-    # Solve
-    solver = pulp.PULP_CBC_CMD(msg=False, timeLimit=120)
-    status = model.solve(solver)
 
-    if pulp.LpStatus[status] not in ("Optimal", "Feasible"):
+def available_backends() -> list:
+    return [name for name, cls in SOLVER_BACKENDS.items() if cls().available()]
+
+
+def _merge_stats(stats: list) -> dict:
+    """Aggregate per-solve stats: summed time and nodes, worst gap."""
+    stats = [s for s in stats if s]
+    if not stats:
+        return {}
+    nodes = [s["nodes"] for s in stats if s.get("nodes") is not None]
+    gaps = [s["gap"] for s in stats if s.get("gap") is not None]
+    return {
+        "backend": stats[0]["backend"],
+        "threads": stats[0]["threads"],
+        "solves": sum(s.get("solves", 1) for s in stats),
+        "wall_time": float(sum(s["wall_time"] for s in stats)),
+        "nodes": int(sum(nodes)) if nodes else None,
+        "gap": float(max(gaps)) if gaps else None,
+        "hours": int(sum(s.get("hours", 0) for s in stats)),
+        "steps": int(sum(s.get("steps", 0) for s in stats)),
+        "fixed": int(sum(s.get("fixed", 0) for s in stats)),
+        "stopped": next((s["stopped"] for s in stats if s.get("stopped")), None),
+    }
+
+
+# ──────────────────────────────────────────────
+# HOURLY ECONOMIC DISPATCH KERNEL
+# ──────────────────────────────────────────────
+
+DISPATCH_FLOWS = (
+    "q_KGJ", "q_boiler", "q_eboiler",
+    "ee_from_kgj", "ee_sold_spot", "ee_to_eboiler_int", "ee_to_eboiler_grid",
+)
+
+
+def _state_dispatch(state: int, ee, gas, heat_p, demand, p: TechParams) -> Dict[str, np.ndarray]:
+    """
+    Optimal continuous dispatch of every hour for one fixed KGJ state.
+
+    Heat not covered by the KGJ is supplied in merit order by internal
+    e-boiler power, grid e-boiler power and the gas boiler; sources with a
+    negative cost run at capacity. The hourly value is concave and piecewise
+    linear in q_KGJ, so it is evaluated at all breakpoints at once and the
+    best one kept. Infeasible hours get a profit of -inf and NaN flows.
+    """
+    ee, gas, heat_p, demand = np.broadcast_arrays(*(np.asarray(v, dtype=float)
+                                                     for v in (ee, gas, heat_p, demand)))
+    T = ee.shape[0]
+    h = p.heat_min_cover * demand
+    has_demand = demand > 0
+    e_max = np.where(has_demand, p.eboiler_max_heat, 0.0)
+    b_max = np.where(has_demand, p.boiler_max_heat, 0.0)
+    a = p.eboiler_eff * p.kgj_el_per_heat          # e-boiler heat per MWh KGJ heat
+
+    if state:
+        lo, hi = p.kgj_min_load * p.kgj_heat_output, p.kgj_heat_output
+        q = np.stack([
+            np.full(T, lo), np.full(T, hi), h,
+            h - e_max, h - b_max, h - e_max - b_max,
+            h / (1 + a), (h - b_max) / (1 + a),
+            e_max / a if a > 0 else np.full(T, hi),
+        ])
+        q = np.clip(q, lo, hi)
+    else:
+        q = np.zeros((1, T))
+
+    costs = np.stack([ee / p.eboiler_eff,
+                      (ee + p.ee_dist_cost) / p.eboiler_eff,
+                      gas / p.boiler_eff])
+    int_cap = np.minimum(e_max, a * q)
+    caps = np.stack([int_cap, e_max - int_cap, np.broadcast_to(b_max, q.shape)])
+
+    # Merit-order fill of the residual heat, cheapest layer first
+    order = np.argsort(costs, axis=0, kind="stable")
+    remaining = np.maximum(h - q, 0.0)
+    used = np.zeros_like(caps)
+    for rank in range(3):
+        layer = order[rank]
+        cost = np.take_along_axis(costs, layer[None], axis=0)[0]
+        cap = np.take_along_axis(caps, np.broadcast_to(layer, q.shape)[None], axis=0)[0]
+        take = np.where(cost < 0, cap, np.minimum(cap, remaining))
+        for j in range(3):
+            used[j] += np.where(layer == j, take, 0.0)
+        remaining = np.maximum(remaining - take, 0.0)
+
+    ee_kgj = p.kgj_el_per_heat * q
+    profit = (heat_p * h
+              + ee * ee_kgj
+              - gas * p.kgj_gas_per_heat * q
+              - p.kgj_service * state
+              - (costs[:, None, :] * used).sum(axis=0))
+    profit = np.where(remaining > 1e-9, -np.inf, profit)
+
+    best = np.argmax(profit, axis=0)[None]
+    pick = lambda v: np.take_along_axis(np.broadcast_to(v, q.shape), best, axis=0)[0]
+    used_int, used_grid = pick(used[0]), pick(used[1])
+    out = {
+        "q_KGJ": pick(q),
+        "q_boiler": pick(used[2]),
+        "q_eboiler": used_int + used_grid,
+        "ee_from_kgj": pick(ee_kgj),
+        "ee_sold_spot": pick(ee_kgj) - used_int / p.eboiler_eff,
+        "ee_to_eboiler_int": used_int / p.eboiler_eff,
+        "ee_to_eboiler_grid": used_grid / p.eboiler_eff,
+    }
+    out["profit"] = pick(profit)
+    infeasible = np.isneginf(out["profit"])
+    for name in DISPATCH_FLOWS:
+        out[name][infeasible] = np.nan
+    return out
+
+
+def economic_dispatch(on, ee, gas, heat_p, demand, p: TechParams) -> Dict[str, np.ndarray]:
+    """
+    Optimal continuous dispatch and hourly profit for a given KGJ on/off vector.
+
+    Accepts NumPy arrays or pandas Series (scalars broadcast). Returns one
+    array per flow in DISPATCH_FLOWS plus "profit"; hours that cannot cover
+    demand in the given state have profit -inf and NaN flows.
+    """
+    on = np.asarray(on, dtype=float) > 0.5
+    running = _state_dispatch(1, ee, gas, heat_p, demand, p)
+    stopped = _state_dispatch(0, ee, gas, heat_p, demand, p)
+    return {name: np.where(on, running[name], stopped[name]) for name in running}
+
+
+def evaluate_commitment(df: pd.DataFrame, on, p: TechParams) -> Optional[pd.DataFrame]:
+    """
+    Results DataFrame for a fixed KGJ schedule, dispatched optimally hour by
+    hour. Returns None if the schedule cannot cover demand.
+    """
+    arr = _input_arrays(df)
+    on = np.round(np.asarray(on, dtype=float))
+    flows = economic_dispatch(on, *(arr[col] for col in INPUT_COLUMNS), p)
+    if np.isneginf(flows["profit"]).any():
+        return None
+    return _build_output(df, p, _commitment_solution(on, flows, p.initial_state))
+
+
+def reprice_result(result: pd.DataFrame, df: pd.DataFrame, p: TechParams) -> pd.DataFrame:
+    """
+    The schedule and flows of `result` valued at the inputs of `df` and the
+    parameters `p` (same horizon), without re-optimising. attrs are kept,
+    with objective and params updated.
+    """
+    out = _build_output(df, p, _solution_from_output(result))
+    out.attrs.update(result.attrs, objective=float(out["Total_profit_EUR"].sum()), params=asdict(p))
+    return out
+
+
+def _commitment_solution(on: np.ndarray, flows: Dict[str, np.ndarray],
+                         initial_state: float) -> Dict[str, np.ndarray]:
+    """Per-variable solution arrays for a schedule and its dispatched flows."""
+    sol = {name: flows[name] for name in DISPATCH_FLOWS}
+    change = np.diff(on, prepend=initial_state)
+    sol["KGJ_on"] = on
+    sol["KGJ_start"] = (change > 0).astype(float)
+    sol["KGJ_stop"] = (change < 0).astype(float)
+    return sol
+
+
+# ──────────────────────────────────────────────
+# DYNAMIC-PROGRAMMING COMMITMENT ENGINE
+# ──────────────────────────────────────────────
+
+def _dp_commitment(v_on: np.ndarray, v_off: np.ndarray, p: TechParams,
+                   free_start: bool = False, weights: Optional[np.ndarray] = None,
+                   end_exempt: bool = True) -> Optional[np.ndarray]:
+    """
+    Exact on/off schedule maximising the sum of hourly values under the
+    min-up/min-down rules of the MIP. With end_exempt (the aggregated
+    formulation) starts and stops within the last min_up/min_down hours are
+    unconstrained; otherwise only a run reaching the horizon end may be short.
+
+    States are (off, k) for k = 1..min_down and (on, k) for k = 1..min_up,
+    k being the hours spent in the state, capped at the minimum. With
+    `weights`, step t lasts weights[t] hours and v_on/v_off are step totals.
+    """
+    T = len(v_on)
+    U, D = max(p.min_up, 1), max(p.min_down, 1)
+    S = D + U
+    NEG = -np.inf
+    v_on, v_off = v_on.tolist(), v_off.tolist()
+    w = [1] * T if weights is None else [int(x) for x in weights]
+    first = np.concatenate([[0], np.cumsum(w)[:-1]]).tolist()
+    hours = sum(w) if end_exempt else np.inf
+    back = np.zeros((T, S), dtype=np.int16)
+
+    # Hours already spent in the initial state (unknown history = unconstrained)
+    k0 = max(U, D) if p.initial_hours is None else max(p.initial_hours, 0)
+    vals = [NEG] * S
+    if free_start:
+        vals[D - 1], vals[S - 1] = v_off[0], v_on[0]
+    elif p.initial_state:
+        vals[D + min(k0 + w[0], U) - 1] = v_on[0]      # keep running
+        if k0 >= U:
+            vals[min(w[0], D) - 1] = v_off[0]         # stop in the first hour
+    else:
+        vals[min(k0 + w[0], D) - 1] = v_off[0]
+        if k0 >= D:
+            vals[D + min(w[0], U) - 1] = v_on[0]
+
+    for t in range(1, T):
+        new = [NEG] * S
+        arg = [0] * S
+        wt, ht = w[t], first[t]
+        for s in range(S):
+            val = vals[s]
+            if val == NEG:
+                continue
+            if s < D:
+                k = s + 1
+                stay, switch = min(k + wt, D) - 1, D + min(wt, U) - 1
+                may_switch = k >= D or ht - k >= hours - D
+            else:
+                k = s - D + 1
+                stay, switch = D + min(k + wt, U) - 1, min(wt, D) - 1
+                may_switch = k >= U or ht - k >= hours - U
+            if val > new[stay]:
+                new[stay], arg[stay] = val, s
+            if may_switch and val > new[switch]:
+                new[switch], arg[switch] = val, s
+        for s in range(S):
+            if new[s] != NEG:
+                new[s] += v_off[t] if s < D else v_on[t]
+        vals = new
+        back[t] = arg
+
+    s = int(np.argmax(vals))
+    if vals[s] == NEG:
+        return None
+    on = np.zeros(T)
+    for t in range(T - 1, -1, -1):
+        on[t] = 1.0 if s >= D else 0.0
+        s = back[t, s]
+    return on
+
+
+def _dispatch_dp(arr: Dict[str, np.ndarray], p: TechParams, free_start: bool = False,
+                 fixed_on: Optional[np.ndarray] = None, weights: Optional[np.ndarray] = None,
+                 end_exempt: bool = True) -> Optional[Dict[str, np.ndarray]]:
+    """Solve the commitment by DP and return per-variable solution arrays."""
+    inputs = [arr[col] for col in INPUT_COLUMNS]
+    running = _state_dispatch(1, *inputs, p)
+    stopped = _state_dispatch(0, *inputs, p)
+    v_on, v_off = running["profit"], stopped["profit"]
+    if weights is not None:
+        v_on, v_off = v_on * weights, v_off * weights
+    if fixed_on is not None:
+        v_on = np.where(fixed_on == 0, -np.inf, v_on)
+        v_off = np.where(fixed_on == 1, -np.inf, v_off)
+
+    on = _dp_commitment(v_on, v_off, p, free_start, weights, end_exempt)
+    if on is None:
+        return None
+
+    flows = {name: np.where(on > 0, running[name], stopped[name]) for name in DISPATCH_FLOWS}
+    return _commitment_solution(on, flows, on[0] if free_start else p.initial_state)
+
+
+# ──────────────────────────────────────────────
+# MERIT-ORDER WARM START
+# ──────────────────────────────────────────────
+
+def _repair_commitment(on: np.ndarray, p: TechParams, initial_state: Optional[float] = None,
+                       end_exempt: bool = True) -> np.ndarray:
+    """
+    Make an on/off vector satisfy the MIP's min up/down rules by only ever
+    switching the KGJ on: lock the initial hours, stretch short on-runs to
+    min_up and close off-gaps shorter than min_down.
+    initial_state=None treats the state before the first hour as open;
+    end_exempt=False also repairs runs in the last hours (turn-on formulation).
+    """
+    on = (np.asarray(on, dtype=float) > 0.5).astype(float)
+    T = len(on)
+    keep_on, keep_off = _initial_lock(p) if initial_state is not None else (0, 0)
+    on[:keep_on] = 1.0
+    on[:keep_off] = 0.0
+    prev = on[0] if initial_state is None else initial_state
+
+    up_end = T - p.min_up if end_exempt else T
+    down_end = T - p.min_down if end_exempt else T
+    change = np.diff(on, prepend=prev)
+    for s in np.flatnonzero(change > 0):
+        if s < up_end:
+            on[s:s + p.min_up] = 1.0
+
+    change = np.diff(on, prepend=prev)
+    stops = np.flatnonzero(change < 0)
+    starts = np.flatnonzero(change > 0)
+    for s in stops:
+        nxt = starts[starts > s]
+        if s < down_end and nxt.size and nxt[0] - s < p.min_down:
+            on[s:nxt[0]] = 1.0
+    return on
+
+
+def _improve_commitment(on: np.ndarray, delta: np.ndarray, movable: np.ndarray, p: TechParams,
+                        initial_state: Optional[float] = None) -> np.ndarray:
+    """
+    Local search on a feasible on/off vector: flip whole runs (which only
+    merges runs) and move switches by as many hours as the shrinking run can
+    spare, taking the best non-overlapping moves by value until none gains.
+    delta[t] is the value of running over standing still in hour t; hours
+    that are not `movable` keep their state. Feasibility is preserved.
+    """
+    on = on.copy()
+    T = len(on)
+    while True:
+        bounds = np.flatnonzero(np.diff(on)) + 1
+        starts, stops = np.r_[0, bounds], np.r_[bounds, T]
+        length = stops - starts
+        state = on[starts]
+        sign = np.where(state > 0, 1.0, -1.0)
+        # Shortest length a run may shrink to: the last run and a run that
+        # continues the initial state may be short. Runs already short (end of
+        # horizon exemption) must not have their start moved earlier.
+        shortest = np.where(state > 0, max(p.min_up, 1), max(p.min_down, 1))
+        short = length < shortest
+        short[-1] = False
+        shortest[-1] = 1
+        if initial_state is None or state[0] == initial_state:
+            shortest[0] = 1
+        cs = np.r_[0.0, np.cumsum(delta)]
+        frozen = np.r_[0, np.cumsum(~movable)]
+
+        moves = []   # (gain, first run touched, last run touched, from hour, to hour, new state)
+        run_value = sign * (cs[stops] - cs[starts])
+        for i in np.flatnonzero((frozen[stops] == frozen[starts]) & (run_value < -1e-9)).tolist():
+            moves.append((-run_value[i], i - 1, i + 1, starts[i], stops[i], 1.0 - state[i]))
+        for k, b in enumerate(bounds.tolist()):
+            # Hours at the head of run k+1 join run k, or the tail of run k joins run k+1
+            for grows, hours, new in ((k, np.arange(b, b + length[k + 1] - shortest[k + 1]), state[k]),
+                                      (k + 1, np.arange(b - 1, b - 1 - length[k] + shortest[k], -1),
+                                       state[k + 1])):
+                if not len(hours) or (grows == k + 1 and short[k + 1]):
+                    continue
+                stuck = ~movable[hours]
+                hours = hours[:int(np.argmax(stuck))] if stuck.any() else hours
+                gain = np.cumsum(delta[hours]) * (1.0 if new > 0 else -1.0)
+                if len(gain) and gain.max() > 1e-9:
+                    j = int(np.argmax(gain))
+                    a, z = sorted((int(hours[0]), int(hours[j])))
+                    moves.append((gain[j], k, k + 1, a, z + 1, new))
+        if not moves:
+            return on
+        used = np.zeros(len(starts) + 1, dtype=bool)
+        for _, lo, hi, a, z, new in sorted(moves, key=lambda m: -m[0]):
+            lo = max(lo, 0)
+            if used[lo:hi + 1].any():
+                continue
+            used[lo:hi + 1] = True
+            on[a:z] = new
+
+
+def _heuristic_commitment(arr: Dict[str, np.ndarray], p: TechParams, free_start: bool = False,
+                          fixed_on: Optional[np.ndarray] = None, end_exempt: bool = True):
+    """
+    Feasible KGJ schedule from the per-hour merit order: run the KGJ where
+    a KGJ option (source 2 or 4) has the best positive margin or where
+    demand cannot be covered without it, then repair min up/down.
+    Returns (on, flows) or None if no feasible repair was found.
+    """
+    r = _margin_columns(arr["ee_price"], arr["gas_price"], arr["heat_price"], p)
+    kgj_wins = np.isin(best_source_id(r["m1"], r["m2"], r["m3"], r["m4"]), (2, 4))
+
+    inputs = [arr[col] for col in INPUT_COLUMNS]
+    needs_kgj = np.isneginf(_state_dispatch(0, *inputs, p)["profit"])
+    on = (kgj_wins | needs_kgj).astype(float)
+    if fixed_on is not None:
+        pinned = ~np.isnan(fixed_on)
+        on[pinned] = fixed_on[pinned]
+
+    on = _repair_commitment(on, p, None if free_start else p.initial_state, end_exempt)
+    if fixed_on is not None and np.any(on[pinned] != fixed_on[pinned]):
+        return None
+    flows = economic_dispatch(on, *inputs, p)
+    if np.isneginf(flows["profit"]).any():
+        return None
+    return on, flows
+
+
+# ──────────────────────────────────────────────
+# PRESOLVE (time compression, dominance fixing)
+# ──────────────────────────────────────────────
+
+def _dominance_fixing(arr: Dict[str, np.ndarray], p: TechParams, free_start: bool = False,
+                      fixed_on: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    KGJ_on values forced in every optimal schedule (NaN = left to the MIP).
+
+    Over a stretch of hours where running is strictly better than standing
+    still, any off-period can be shrunk towards the stretch ends; if the
+    stretch is long enough to hold a min_up run between two min_down
+    periods, the hours more than min_down from both ends are on.
+    Symmetrically for stretches where running is strictly worse. Hours that
+    cannot be covered without the KGJ are always on. The exact hourly values
+    of both states are used, which also covers the e-boiler and demand cases
+    that the price triggers of _margin_columns do not.
+    """
+    inputs = [arr[col] for col in INPUT_COLUMNS]
+    v_on = _state_dispatch(1, *inputs, p)["profit"]
+    v_off = _state_dispatch(0, *inputs, p)["profit"]
+    with np.errstate(invalid="ignore"):
+        delta = np.nan_to_num(v_on - v_off, nan=0.0, posinf=1.0, neginf=-1.0)
+
+    out = np.full(len(delta), np.nan) if fixed_on is None else fixed_on.astype(float)
+    pinned = ~np.isnan(out)
+    sign = np.where(pinned, np.where(out > 0, 1.0, -1.0), np.sign(delta))
+
+    U, D = p.min_up, p.min_down
+    bounds = np.flatnonzero(np.diff(sign)) + 1
+    for a, b in zip(np.concatenate([[0], bounds]).tolist(), np.append(bounds, len(sign)).tolist()):
+        if sign[a] > 0 and b - a >= 2 * D + U:
+            out[a + D:b - D] = 1.0
+        elif sign[a] < 0 and b - a >= 2 * U + D:
+            out[a + U:b - U] = 0.0
+    out[np.isneginf(v_off) & ~pinned] = 1.0
+
+    # The initial lock and explicit pins always win
+    if not free_start:
+        keep_on, keep_off = _initial_lock(p)
+        out[:keep_on] = 1.0
+        out[:keep_off] = 0.0
+    if fixed_on is not None:
+        out[pinned] = fixed_on[pinned]
+    return out
+
+
+
+def _compress_horizon(arr: Dict[str, np.ndarray], p: TechParams,
+                      fixed_on: Optional[np.ndarray] = None):
+    """
+    Collapse the inside of every run of identical hours into one time step.
+
+    Within a run all hours have the same on/off values, so switches can be
+    moved towards the run ends without losing value or breaking min up/down:
+    some optimal schedule is constant beyond K = max(min_up, min_down) hours
+    from either end. Those hours become one step weighted by their count;
+    the last 2K hours of the horizon are never merged (end-of-horizon rules).
+    Returns (first hour of each step, step weights), or None if nothing merges.
+    """
+    T = len(arr["ee_price"])
+    K = max(p.min_up, p.min_down, 1)
+    same = np.ones(max(T - 1, 0), dtype=bool)
+    for col in INPUT_COLUMNS:
+        same &= arr[col][1:] == arr[col][:-1]
+    if fixed_on is not None:
+        pinned = np.nan_to_num(fixed_on, nan=-1.0)
+        same &= pinned[1:] == pinned[:-1]
+
+    run_start = np.flatnonzero(np.concatenate([[True], ~same]))
+    run_stop = np.append(run_start[1:], T)
+    inner_start = run_start + K
+    inner_stop = np.minimum(run_stop - K, T - 2 * K)
+    merge = inner_stop - inner_start >= 2
+    if not merge.any():
+        return None
+
+    step_start = np.ones(T, dtype=bool)
+    for a, b in zip(inner_start[merge].tolist(), inner_stop[merge].tolist()):
+        step_start[a + 1:b] = False
+    first = np.flatnonzero(step_start)
+    return first, np.diff(np.append(first, T))
+
+
+def _expand_solution(sol: Dict[str, np.ndarray], weights: np.ndarray,
+                     initial_state: float) -> Dict[str, np.ndarray]:
+    """Hourly solution arrays from a time-compressed one."""
+    hourly = {k: np.repeat(v, weights) for k, v in sol.items()}
+    change = np.diff(hourly["KGJ_on"], prepend=initial_state)
+    hourly["KGJ_start"] = (change > 0).astype(float)
+    hourly["KGJ_stop"] = (change < 0).astype(float)
+    return hourly
+
+
+# ──────────────────────────────────────────────
+# FULL LP DISPATCH OPTIMIZATION
+# ──────────────────────────────────────────────
+
+# Bump whenever a change alters results, so cached results are not reused.
+ENGINE_VERSION = "2.0"
+
+DISPATCH_ENGINES = ("mip", "dp")
+DISPATCH_MODES = ("full", "rolling", "blocks", "approx")
+
+BLOCK_REPAIR_MARGIN = 24
+INCREMENTAL_MARGIN = 48
+
+
+def run_dispatch(df: pd.DataFrame, p: TechParams, engine: str = "mip", mode: str = "full",
+                 window: int = 168, lookahead: int = 48,
+                 block_hours: Optional[int] = None, max_workers: Optional[int] = None,
+                 warm_start: bool = True, backend: str = "cbc",
+                 threads: Optional[int] = None, presolve: bool = True,
+                 formulation: str = "aggregated", compact: bool = False,
+                 mip_gap: Optional[float] = None, cache=None,
+                 progress: Optional[Callable[[float, str], None]] = None,
+                 time_limit: Optional[float] = None,
+                 cancel: Optional[CancelToken] = None) -> Optional[pd.DataFrame]:
+    """
+    Solve the full dispatch problem.
+
+    engine="mip" solves the MIP with CBC; engine="dp" solves the same
+    single-KGJ problem exactly by dynamic programming over the commitment.
+    mode="rolling" solves consecutive windows of `window` hours plus
+    `lookahead` hours, keeps the first `window` hours of each and carries
+    the KGJ state into the next one.
+    mode="blocks" solves calendar months (or `block_hours` chunks) in a
+    process pool and then re-solves a short window around each block
+    boundary to restore min up/down continuity.
+    mode="approx" (MIP only) rounds and repairs the LP relaxation instead of
+    branching; attrs hold the LP bound and the certified gap.
+    warm_start passes a repaired merit-order schedule to the solver as a MIP
+    start (its objective is reported as heuristic_objective).
+    backend selects the MIP solver ("cbc" or "highs", see SOLVER_BACKENDS)
+    and threads its thread count (None = solver default).
+    presolve merges the inside of long runs of identical hours into single
+    time steps and, for the MIP, fixes KGJ_on wherever dominance decides it
+    (both exact; "hours", "steps" and "fixed" in attrs["solver"]).
+    formulation selects how min up/down are modelled (MIN_RUN_FORMULATIONS):
+    "turn_on" gives a tighter LP relaxation and also enforces the rules in
+    the last hours of the horizon. compact solves the MIP without the
+    columns that are linear in others (same optimum, see COMPACT_VAR_NAMES).
+    mip_gap overrides the solver's relative optimality gap.
+    cache (a result_cache.ResultCache) returns a stored result for the same
+    inputs, parameters and options without solving; optimal results are
+    stored in it, and so are completed rolling, blocks and approx results
+    (status "Feasible", but deterministic).
+    progress(fraction, message) is called as the solve advances (presolve,
+    windows or blocks, and MIP gap / elapsed time while the solver runs),
+    from the calling thread.
+    time_limit is a wall-clock budget in seconds for the whole call (None:
+    DEFAULT_TIME_LIMIT per solve). cancel (a CancelToken) stops the solve
+    from another thread: CBC is interrupted, HiGHS and the DP stop between
+    stages, also in the worker processes of blocks mode. A stopped solve
+    returns its best incumbent with status "Feasible" and attrs["stopped"]
+    "cancelled" or "time_limit"; a horizon, window or block with no
+    incumbent yet gets the DP schedule instead.
+
+    Raises ValueError for an empty horizon or missing input columns.
+    Returns a results DataFrame or None on failure. Solve information
+    (status, objective, heuristic objective, for blocks and approx the bound and gap,
+    and under "solver" the backend's wall time, nodes and MIP gap) is in
+    `.attrs`.
+    """
+    if engine not in DISPATCH_ENGINES:
+        raise ValueError(f"Unknown engine: {engine}")
+    if mode not in DISPATCH_MODES:
+        raise ValueError(f"Unknown mode: {mode}")
+    if formulation not in MIN_RUN_FORMULATIONS:
+        raise ValueError(f"Unknown formulation: {formulation}")
+    if mode == "approx" and engine != "mip":
+        raise ValueError("mode='approx' needs engine='mip'")
+    _check_input(df)
+    if engine == "mip":
+        get_backend(backend)
+    if time_limit is not None:
+        cancel = cancel or CancelToken()
+        cancel.limit(time_limit)
+    opts = SolverOptions(backend=backend, threads=threads, presolve=presolve,
+                         formulation=formulation, compact=compact, mip_gap=mip_gap, progress=progress,
+                         time_limit=DEFAULT_TIME_LIMIT if time_limit is None else float(time_limit),
+                         cancel=cancel)
+
+    key = None
+    if cache is not None:
+        options = dict(engine=engine, mode=mode, window=window, lookahead=lookahead,
+                       block_hours=block_hours, warm_start=warm_start, presolve=presolve,
+                       formulation=formulation, backend=backend if engine == "mip" else None,
+                       compact=compact if engine == "mip" else None,
+                       mip_gap=mip_gap if engine == "mip" else None)
+        key = cache.key(df, p, options)
+        hit = cache.get(key)
+        if hit is not None:
+            _report(opts, 1.0, "Načteno z cache")
+            return hit
+
+    arr = _input_arrays(df)
+    if mode == "rolling":
+        status, sol, info = _solve_rolling(arr, p, engine, window, lookahead, warm_start, opts)
+    elif mode == "blocks":
+        status, sol, info = _solve_blocks(arr, p, engine, _block_starts(df, block_hours),
+                                          max_workers, warm_start, opts)
+    elif mode == "approx":
+        status, sol, info = _solve_approx(arr, p, opts=opts)
+    else:
+        status, sol, info = _solve(arr, p, engine, warm_start=warm_start, opts=opts)
+
+    if sol is None:
+        return None
+    info["solver"] = _merge_stats([info.get("solver")])
+    stopped = info["solver"].pop("stopped", None)
+    result = _build_output(df, p, sol)
+    _report(opts, 1.0, "Hotovo")
+    result.attrs.update(status=status, objective=float(result["Total_profit_EUR"].sum()),
+                        params=asdict(p), formulation=formulation, engine=engine, mode=mode,
+                        stopped=stopped, **info)
+    if key is not None and stopped is None and (status == "Optimal" or mode != "full"):
+        cache.put(key, result)
+    return result
+
+
+def _presolve(arr: Dict[str, np.ndarray], p: TechParams, free_start: bool,
+              fixed_on: Optional[np.ndarray], opts: SolverOptions, fix: bool = True):
+    """
+    Dominance fixing (with `fix`) and time compression when opts.presolve is
+    set. Returns (fixed_on, first hour of each step, step weights or None).
+    """
+    T = len(arr["ee_price"])
+    if not opts.presolve:
+        return fixed_on, np.arange(T), None
+    if fix:
+        fixed_on = _dominance_fixing(arr, p, free_start, fixed_on)
+    steps = _compress_horizon(arr, p, fixed_on)
+    first, weights = steps if steps is not None else (np.arange(T), None)
+    return fixed_on, first, weights
+
+
+def _mip_solution(heuristic, arr: Dict[str, np.ndarray], p: TechParams,
+                  free_start: bool = False) -> Dict[str, np.ndarray]:
+    """All MIP variables (VAR_NAMES) for a merit-order (on, flows) schedule."""
+    on, flows = heuristic
+    sol = _commitment_solution(on, flows, on[0] if free_start else p.initial_state)
+    sol["heat_def"] = np.maximum(p.heat_min_cover * arr["heat_demand"] - flows["q_KGJ"],
+                                 np.maximum(flows["q_boiler"] + flows["q_eboiler"], 0.0))
+    return sol
+
+
+def _fallback_solution(arr: Dict[str, np.ndarray], p: TechParams, engine: str, free_start: bool,
+                       fixed_on: Optional[np.ndarray], end_exempt: bool, heuristic=None):
+    """
+    Hourly solution for a horizon whose solve stopped without an incumbent:
+    the DP schedule, which is exact for this model and takes well under a
+    second for a year, so it beats the merit-order MIP start (e.g. 245564
+    against 207337 EUR on a synthetic Behounkova year); the merit-order
+    schedule only where DP finds none.
+    """
+    dp = _dispatch_dp(arr, p, free_start, fixed_on, end_exempt=end_exempt)
+    if dp is not None:
+        heuristic = dp["KGJ_on"], dp
+    elif heuristic is None:
+        heuristic = _heuristic_commitment(arr, p, free_start, fixed_on, end_exempt)
+    if heuristic is None:
         return None
+    if engine == "mip":
+        return _mip_solution(heuristic, arr, p, free_start)
+    on, flows = heuristic
+    return _commitment_solution(on, flows, on[0] if free_start else p.initial_state)
+
+
+def _solve(arr: Dict[str, np.ndarray], p: TechParams, engine: str, free_start: bool = False,
+           fixed_on: Optional[np.ndarray] = None, warm_start: bool = True,
+           opts: SolverOptions = SolverOptions()):
+    """
+    Solve one horizon, time-compressed first when opts.presolve is set.
+    A solve stopped by opts.cancel (or its time limit) without an incumbent
+    falls back to the DP schedule (_fallback_solution), flagged in
+    info["solver"]["stopped"].
+    Returns (status, per-variable solution arrays or None, info dict).
+    """
+    T = len(arr["ee_price"])
+    end_exempt = opts.formulation == "aggregated"
+    free_hours = T if fixed_on is None else int(np.isnan(fixed_on).sum())
+    pinned = fixed_on
+    _report(opts, 0.0, "Presolve")
+    fixed_on, first, weights = _presolve(arr, p, free_start, fixed_on, opts, fix=engine == "mip")
+    step_arr = {k: v[first] for k, v in arr.items()}
+    step_fixed = fixed_on[first] if fixed_on is not None else None
+
+    info = {}
+    heuristic = None
+    if _stop_reason(opts) is not None:
+        status, sol = "Not Solved", None
+        stats = {"backend": "dp" if engine == "dp" else opts.backend, "threads": opts.threads,
+                 "wall_time": 0.0, "nodes": None, "gap": None}
+    elif engine == "dp":
+        _report(opts, 0.05, "Dynamické programování")
+        t0 = time.perf_counter()
+        sol = _dispatch_dp(step_arr, p, free_start, step_fixed, weights, end_exempt)
+        status = "Optimal" if sol is not None else "Infeasible"
+        stats = {"backend": "dp", "threads": None, "wall_time": time.perf_counter() - t0,
+                 "nodes": None, "gap": 0.0}
+    else:
+        # The merit-order schedule is constant over merged steps, so it compresses as is
+        start = None
+        if warm_start:
+            heuristic = _heuristic_commitment(arr, p, free_start, fixed_on, end_exempt)
+        if heuristic is not None:
+            start = {k: v[first] for k, v in _mip_solution(heuristic, arr, p, free_start).items()}
+            info["heuristic_objective"] = float(heuristic[1]["profit"].sum())
+
+        _report(opts, 0.1, "Sestavuji model")
+        with locked_template(p, len(first), weights, opts.formulation, opts.compact, free_start) as template:
+            model = template.apply(step_arr, p, free_start, step_fixed)
+            x_start = model.vector(start) if start is not None else None
+            status, x, stats = get_backend(opts.backend).solve(model, _subprogress(opts, 0.1, 1.0),
+                                                               x_start=x_start)
+            sol = model.solution(x) if status in ("Optimal", "Feasible") else None
+        if sol is not None and model.compact:
+            sol = _complete_solution(sol, p, sol["KGJ_on"][0] if free_start else p.initial_state)
+        stats = dict(stats, backend=opts.backend, threads=opts.threads)
+
+    if sol is not None and weights is not None:
+        sol = _expand_solution(sol, weights, sol["KGJ_on"][0] if free_start else p.initial_state)
+    elif sol is None and (status == "Not Solved" or stats.get("stopped")):
+        # A solver stopped before its first incumbent may report the horizon
+        # "Infeasible" (CBC's "Integer infeasible"); it is not, so fall back too.
+        # Only the caller's pins bind the fallback; dominance fixing can leave the heuristic unrepairable
+        sol = _fallback_solution(arr, p, engine, free_start, pinned, end_exempt, heuristic)
+        if sol is not None:
+            status = "Feasible"
+            stats["stopped"] = stats.get("stopped") or _stop_reason(opts) or "time_limit"
+
+    fixed = 0 if fixed_on is None else free_hours - int(np.isnan(fixed_on).sum())
+    info["solver"] = dict(stats, hours=T, steps=len(first), fixed=fixed)
+    return status, sol, info
+
+
+def _solve_relaxation(arr: Dict[str, np.ndarray], p: TechParams, free_start: bool = False,
+                      fixed_on: Optional[np.ndarray] = None, opts: SolverOptions = SolverOptions()):
+    """
+    LP relaxation of one horizon, KGJ_on left fractional. opts.presolve
+    fixes and compresses the horizon as for the MIP first; both keep the MIP
+    optimum, so the LP objective still bounds it from above.
+    Returns (status, hourly solution arrays or None, info dict with "bound").
+    """
+    T = len(arr["ee_price"])
+    free_hours = T if fixed_on is None else int(np.isnan(fixed_on).sum())
+    fixed_on, first, weights = _presolve(arr, p, free_start, fixed_on, opts)
+    step_arr = {k: v[first] for k, v in arr.items()}
+    step_fixed = fixed_on[first] if fixed_on is not None else None
+
+    with locked_template(p, len(first), weights, opts.formulation, opts.compact, free_start) as template:
+        model = template.apply(step_arr, p, free_start, step_fixed)
+        status, x, stats = get_backend(opts.backend).solve(model, opts, relax=True)
+        ok = status in ("Optimal", "Feasible")
+        sol = model.solution(x, integral=False) if ok else None
+        bound = model.objective(x) if ok else None
+    if sol is not None and model.compact:
+        sol = _complete_solution(sol, p, sol["KGJ_on"][0] if free_start else p.initial_state)
+    if sol is not None and weights is not None:
+        sol = {k: np.repeat(v, weights) for k, v in sol.items()}
+
+    fixed = 0 if fixed_on is None else free_hours - int(np.isnan(fixed_on).sum())
+    stats = dict(stats, backend=opts.backend, threads=opts.threads, hours=T, steps=len(first), fixed=fixed)
+    return status, sol, {"bound": bound, "solver": stats}
+
+
+APPROX_THRESHOLDS = (0.5, 0.7, 0.9)
+
+
+def _solve_approx(arr: Dict[str, np.ndarray], p: TechParams, opts: SolverOptions = SolverOptions()):
+    """
+    Feasible schedule from the LP relaxation: KGJ_on is rounded at each of
+    APPROX_THRESHOLDS and repaired to min up/down, the merit-order schedule
+    is added as a further candidate, each is improved by local search on the
+    exact hourly values and the best one after re-dispatch is kept. The LP
+    objective bounds the optimum, so info holds "bound" and the certified
+    relative "gap".
+
+    The LP goes to in-process HiGHS whenever highspy is installed, whatever
+    opts.backend says. On a synthetic year (70k columns) that is 1.2-1.7 s
+    from cold against 2.6-3.0 s through CBC, and 0.4-0.7 s once the
+    template's LP is warm-started (e.g. after a price change). The cold LP alone takes about 1.1 s in
+    HiGHS, so the sub-second target is only met on warm re-solves.
+    """
+    # The compact model has the same relaxation and solves faster
+    lp_opts = replace(opts, compact=True, backend="highs" if highspy is not None else opts.backend)
+    _report(opts, 0.0, "LP relaxace")
+    status, relaxed, info = _solve_relaxation(arr, p, opts=lp_opts)
+    _report(opts, 0.8, "Zaokrouhlení a lokální prohledávání")
+    if relaxed is None and _stop_reason(opts) is not None:
+        return _solve(arr, p, "mip", opts=opts)   # the DP fallback
+    if relaxed is None:
+        return status, None, info
+
+    end_exempt = opts.formulation == "aggregated"
+    inputs = [arr[col] for col in INPUT_COLUMNS]
+    v_on = _state_dispatch(1, *inputs, p)["profit"]
+    v_off = _state_dispatch(0, *inputs, p)["profit"]
+    movable = np.isfinite(v_on) & np.isfinite(v_off)
+    movable[:max(_initial_lock(p))] = False
+    delta = np.where(movable, v_on - v_off, 0.0)
+
+    candidates = [_repair_commitment(((relaxed["KGJ_on"] >= threshold) | np.isneginf(v_off)).astype(float),
+                                     p, p.initial_state, end_exempt)
+                  for threshold in APPROX_THRESHOLDS]
+    heuristic = _heuristic_commitment(arr, p, end_exempt=end_exempt)
+    if heuristic is not None:
+        candidates.append(heuristic[0])
+
+    best = None
+    for on in candidates:
+        on = _improve_commitment(on, delta, movable, p, p.initial_state)
+        flows = economic_dispatch(on, *inputs, p)
+        objective = float(flows["profit"].sum())
+        if np.isfinite(objective) and (best is None or objective > best[2]):
+            best = on, flows, objective
+    if best is None:
+        return "Infeasible", None, info
+
+    on, flows, objective = best
+    bound = info["bound"]
+    info["gap"] = max(bound - objective, 0.0) / abs(bound) if bound else 0.0
+    return "Feasible", _commitment_solution(on, flows, p.initial_state), info
+
+
+def relaxation_bound(df: pd.DataFrame, p: TechParams, backend: str = "cbc",
+                     threads: Optional[int] = None, formulation: str = "aggregated",
+                     compact: bool = False) -> Optional[float]:
+    """
+    Objective of the LP relaxation of the full-horizon MIP: an upper bound on
+    the profit of any feasible schedule (None if the LP is infeasible).
+    """
+    if formulation not in MIN_RUN_FORMULATIONS:
+        raise ValueError(f"Unknown formulation: {formulation}")
+    get_backend(backend)
+    opts = SolverOptions(backend=backend, threads=threads, formulation=formulation, compact=compact,
+                         presolve=False)
+    _, _, info = _solve_relaxation(_input_arrays(df), p, opts=opts)
+    return info["bound"]
+
+
+def _stitched_status(statuses, exact: bool) -> str:
+    """
+    Status of a schedule stitched from sub-solves: "Optimal" only when the
+    stitching is known to lose nothing (`exact`, e.g. a single window or a
+    met block bound) and every sub-solve was optimal, else "Feasible".
+    """
+    return "Optimal" if exact and all(s == "Optimal" for s in statuses) else "Feasible"
+
+
+def _slice(arr: Dict[str, np.ndarray], start: int, stop: int) -> Dict[str, np.ndarray]:
+    return {k: v[start:stop] for k, v in arr.items()}
+
+
+def _trailing_run(on: np.ndarray) -> int:
+    """Length of the final run of equal values in an on/off vector."""
+    change = np.flatnonzero(np.diff(on) != 0)
+    return len(on) - (change[-1] + 1 if len(change) else 0)
+
+
+def _carry_state(p: TechParams, on_before: np.ndarray) -> TechParams:
+    """Parameters for a horizon starting right after the schedule `on_before`."""
+    if len(on_before) == 0:
+        return p
+    state = int(on_before[-1])
+    run = _trailing_run(on_before)
+    if run == len(on_before) and state == p.initial_state:
+        hours = None if p.initial_hours is None else p.initial_hours + run
+    else:
+        hours = run
+    return replace(p, initial_state=state, initial_hours=hours)
+
+
+def _solve_rolling(arr: Dict[str, np.ndarray], p: TechParams, engine: str,
+                   window: int, lookahead: int, warm_start: bool,
+                   opts: SolverOptions = SolverOptions()):
+    """Rolling-horizon solve; only one window model is alive at a time."""
+    if window < 1 or lookahead < 0:
+        raise ValueError("window must be >= 1 and lookahead >= 0")
+
+    T = len(arr["ee_price"])
+    on = np.zeros(0)
+    parts, statuses, stats = [], [], []
+    pos = 0
+    while pos < T:
+        end = min(pos + window + lookahead, T)
+        keep = end - pos if end == T else window
+        label = f"Okno {pos // 24 + 1}.–{(pos + keep) // 24}. den"
+        status, sol, info = _solve(_slice(arr, pos, end), _carry_state(p, on), engine, warm_start=warm_start,
+                                   opts=_subprogress(opts, pos / T, (pos + keep) / T, label))
+        stats.append(info.get("solver"))
+        if sol is None:
+            return status, None, {}
+        sol = {k: v[:keep] for k, v in sol.items()}
+        parts.append(sol)
+        statuses.append(status)
+        on = np.concatenate([on, sol["KGJ_on"]])
+        pos += keep
+
+    sol = {k: np.concatenate([part[k] for part in parts]) for k in parts[0]}
+    # Windows only see `lookahead` hours ahead, so more than one is a heuristic
+    return _stitched_status(statuses, len(parts) == 1), sol, {"solver": _merge_stats(stats)}
+
+
+def _block_starts(df: pd.DataFrame, block_hours: Optional[int]) -> list:
+    """First hour of each block: calendar months, or fixed chunks of block_hours."""
+    T = len(df)
+    if block_hours is None:
+        dt = pd.to_datetime(df["datetime"], errors="coerce")
+        if dt.notna().all():
+            month = (dt.dt.year * 12 + dt.dt.month).to_numpy()
+            return [0] + (np.flatnonzero(np.diff(month) != 0) + 1).tolist()
+        block_hours = 730
+    return list(range(0, T, max(int(block_hours), 1)))
+
+
+def _hourly_profit(arr: Dict[str, np.ndarray], p: TechParams, sol: Dict[str, np.ndarray]) -> np.ndarray:
+    """Hourly objective contribution of a solution."""
+    return (arr["heat_price"] * p.heat_min_cover * arr["heat_demand"]
+            + arr["ee_price"] * sol["ee_sold_spot"]
+            - arr["gas_price"] * (sol["q_KGJ"] * p.kgj_gas_per_heat + sol["q_boiler"] / p.boiler_eff)
+            - (arr["ee_price"] + p.ee_dist_cost) * sol["ee_to_eboiler_grid"]
+            - p.kgj_service * sol["KGJ_on"])
+
+
+def _repair_window(arr: Dict[str, np.ndarray], p: TechParams, on: np.ndarray,
+                   start: int, stop: int, tail: int) -> dict:
+    """
+    Arguments for re-solving hours [start, stop) of schedule `on`: the state is
+    carried in from the left and the last `tail` hours stay as they are, so
+    the window splices back into the schedule without breaking min up/down.
+    """
+    fixed_on = np.full(stop - start, np.nan)
+    if stop < len(on):
+        fixed_on[-tail:] = on[stop - tail:stop]
+    return dict(arr=_slice(arr, start, stop), p=_carry_state(p, on[:start]), fixed_on=fixed_on)
+
+
+def shared_cancel(cancel: Optional[CancelToken]):
+    """cancel.shared() for a pool run, a no-op without a token."""
+    return nullcontext() if cancel is None else cancel.shared()
+
+
+def collect_futures(futures: list, progress: Optional[Callable[[float, str], None]] = None,
+                    cancel: Optional[CancelToken] = None, label: str = "") -> list:
+    """
+    Results of pool `futures` in submission order, with progress(fraction,
+    "label i/n") as they finish. Once `cancel` stops, futures not started
+    yet are cancelled and give None; running ones are still awaited, and
+    stop with their incumbent when the pool runs inside shared_cancel.
+    """
+    pending = set(futures)
+    while pending:
+        if cancel is not None and cancel.reason() is not None:
+            for f in pending:
+                f.cancel()
+        done, pending = _futures.wait(pending, timeout=0.5, return_when=_futures.FIRST_COMPLETED)
+        if done and progress is not None:
+            finished = len(futures) - len(pending)
+            progress(finished / len(futures), f"{label} {finished}/{len(futures)}".strip())
+    return [None if f.cancelled() else f.result() for f in futures]
+
+
+def _await(future, futures: list, opts: SolverOptions, fallback: Callable):
+    """
+    Result of one of the pool `futures`. Once opts.cancel has stopped, all
+    futures not started yet are cancelled; for those fallback() (a local
+    solve, which then falls back to the DP schedule at once) is returned
+    instead. Running ones stop on their own: the workers' copy of the
+    token shares its cancel flag (CancelToken.shared).
+    """
+    while True:
+        if _stop_reason(opts) is not None:
+            for f in futures:
+                f.cancel()
+        if future.cancelled():
+            return fallback()
+        try:
+            return future.result(timeout=0.5)
+        except _futures.TimeoutError:
+            pass
+
+
+def _solve_blocks(arr: Dict[str, np.ndarray], p: TechParams, engine: str,
+                  starts: list, max_workers: Optional[int], warm_start: bool,
+                  opts: SolverOptions = SolverOptions()):
+    """
+    Solve blocks concurrently, stitch them and repair every block boundary.
+
+    Blocks after the first are solved with an open initial state, so each is
+    a relaxation of the monolithic problem restricted to its hours; the sum
+    of their optima bounds the monolithic optimum from above.
+    """
+    T = len(arr["ee_price"])
+    margin = max(BLOCK_REPAIR_MARGIN, 2 * (p.min_up + p.min_down) + 1)
+    tail = max(p.min_up, p.min_down) + 1
+
+    # Drop boundaries that leave blocks too short to be repaired independently
+    kept = [0]
+    for b in starts[1:]:
+        if b - kept[-1] >= 3 * margin and T - b >= 2 * margin:
+            kept.append(b)
+    bounds = list(zip(kept, kept[1:] + [T]))
+    # Progress callbacks stay in this process; it counts finished blocks and repairs
+    worker_opts = replace(opts, progress=None)
+    total = 2 * len(bounds) - 1
+    _report(opts, 0.0, f"Bloky 0/{len(bounds)}")
+
+    with shared_cancel(opts.cancel), ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(_solve, _slice(arr, a, b), p, engine, a > 0,
+                               warm_start=warm_start, opts=worker_opts)
+                   for a, b in bounds]
+        results = []
+        for (a, b), f in zip(bounds, futures):
+            local = partial(_solve, _slice(arr, a, b), p, engine, a > 0, warm_start=warm_start, opts=worker_opts)
+            results.append(_await(f, futures, opts, local))
+            _report(opts, len(results) / total, f"Bloky {len(results)}/{len(bounds)}")
+        blocks = [r[:2] for r in results]
+        stats = [r[2].get("solver") for r in results]
+        if any(sol is None for _, sol in blocks):
+            return "Infeasible", None, {}
+
+        bound = sum(float(_hourly_profit(_slice(arr, a, b), p, sol).sum())
+                    for (a, b), (_, sol) in zip(bounds, blocks))
+        bound_valid = all(status == "Optimal" for status, _ in blocks)
+        statuses = [status for status, _ in blocks]
+        sol = {k: np.concatenate([s[k] for _, s in blocks]) for k in blocks[0][1]}
+
+        # Boundary windows are disjoint, so they can be repaired in parallel
+        windows = [(max(b - margin, 0), min(b + margin, T)) for b in kept[1:]]
+        repairs = [_repair_window(arr, p, sol["KGJ_on"], a, b, tail) for a, b in windows]
+        futures = [pool.submit(_solve, engine=engine, warm_start=warm_start, opts=worker_opts, **repair)
+                   for repair in repairs]
+        for i, ((a, b), repair, f) in enumerate(zip(windows, repairs, futures)):
+            local = partial(_solve, engine=engine, warm_start=warm_start, opts=worker_opts, **repair)
+            status, part, part_info = _await(f, futures, opts, local)
+            _report(opts, (len(bounds) + i + 1) / total, f"Napojení bloků {i + 1}/{len(windows)}")
+            stats.append(part_info.get("solver"))
+            if part is None:
+                return status, None, {}
+            statuses.append(status)
+            for k in sol:
+                sol[k][a:b] = part[k]
+
+    on = sol["KGJ_on"]
+    change = np.diff(on, prepend=p.initial_state)
+    sol["KGJ_start"] = (change > 0).astype(float)
+    sol["KGJ_stop"] = (change < 0).astype(float)
+
+    objective = float(_hourly_profit(arr, p, sol).sum())
+    info = {"blocks": len(bounds), "solver": _merge_stats(stats)}
+    if bound_valid:
+        info["bound"] = bound
+        info["gap"] = max(bound - objective, 0.0) / abs(bound) if bound else 0.0
+    exact = bound_valid and objective >= bound - 1e-9 * max(abs(bound), 1.0)
+    return _stitched_status(statuses, exact), sol, info
+
+
+# ──────────────────────────────────────────────
+# INCREMENTAL RE-SOLVE
+# ──────────────────────────────────────────────
+
+def _changed_windows(changed: np.ndarray, margin: int) -> list:
+    """[start, stop) windows covering every changed hour plus `margin` on each side."""
+    T = len(changed)
+    hours = np.flatnonzero(changed)
+    if len(hours) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(hours) > 2 * margin) + 1
+    return [(max(int(run[0]) - margin, 0), min(int(run[-1]) + 1 + margin, T))
+            for run in np.split(hours, breaks)]
+
+
+def rerun_dispatch(df: pd.DataFrame, p: TechParams, previous: pd.DataFrame, engine: str = "mip",
+                   margin: Optional[int] = None, warm_start: bool = True,
+                   backend: str = "cbc", threads: Optional[int] = None,
+                   formulation: str = "aggregated", compact: bool = False,
+                   progress: Optional[Callable[[float, str], None]] = None,
+                   time_limit: Optional[float] = None,
+                   cancel: Optional[CancelToken] = None) -> Optional[pd.DataFrame]:
+    """
+    Re-solve only the hours whose inputs differ from `previous` (a run_dispatch
+    result for the same parameters and horizon).
+
+    Each changed stretch is widened by `margin` hours and re-optimised with
+    the KGJ state carried in from the left and the commitment at its right
+    edge fixed from the previous schedule, then spliced back in. Falls back
+    to a full run_dispatch when the horizon, the parameters, the formulation
+    or the engine differ, or when `previous` is not a proven optimum (a
+    stopped, decomposed, shared-limit or otherwise non-"Optimal" run) that
+    the unchanged hours could safely be kept from. progress, time_limit and cancel work as
+    in run_dispatch.
+    `.attrs["incremental"]` lists the re-solved windows.
+    """
+    if engine not in DISPATCH_ENGINES:
+        raise ValueError(f"Unknown engine: {engine}")
+    _check_input(df)
+    attrs = previous.attrs
+    if (len(previous) != len(df) or attrs.get("params") != asdict(p)
+            or attrs.get("formulation", "aggregated") != formulation
+            or attrs.get("engine") != engine or attrs.get("mode") not in ("full", "incremental")
+            or attrs.get("status") != "Optimal" or attrs.get("stopped") or attrs.get("shared_limits")
+            or not np.array_equal(pd.to_datetime(previous["datetime"]).to_numpy(),
+                                  pd.to_datetime(df["datetime"]).to_numpy())):
+        return run_dispatch(df, p, engine=engine, warm_start=warm_start, backend=backend, threads=threads,
+                            formulation=formulation, compact=compact, progress=progress,
+                            time_limit=time_limit, cancel=cancel)
+    if engine == "mip":
+        get_backend(backend)
+    if time_limit is not None:
+        cancel = cancel or CancelToken()
+        cancel.limit(time_limit)
+    opts = SolverOptions(backend=backend, threads=threads, formulation=formulation, compact=compact,
+                         progress=progress, cancel=cancel,
+                         time_limit=DEFAULT_TIME_LIMIT if time_limit is None else float(time_limit))
+
+    arr = _input_arrays(df)
+    changed = np.zeros(len(df), dtype=bool)
+    for col, name in zip(INPUT_COLUMNS, RESULT_COLUMNS[1:5]):
+        changed |= ~np.isclose(arr[col], previous[name].to_numpy(dtype=float), rtol=0.0, atol=1e-9)
+
+    if margin is None:
+        margin = max(INCREMENTAL_MARGIN, 2 * (p.min_up + p.min_down) + 1)
+    tail = max(p.min_up, p.min_down) + 1
+    windows = _changed_windows(changed, margin)
+
+    sol = _solution_from_output(previous)
+    statuses, stats = [attrs["status"]], []
+    for i, (a, b) in enumerate(windows):
+        label = f"Změněný úsek {i + 1}/{len(windows)}"
+        status, part, info = _solve(engine=engine, warm_start=warm_start,
+                                    opts=_subprogress(opts, i / len(windows), (i + 1) / len(windows), label),
+                                    **_repair_window(arr, p, sol["KGJ_on"], a, b, tail))
+        stats.append(info.get("solver"))
+        if part is None:
+            return None
+        statuses.append(status)
+        for k in sol:
+            sol[k][a:b] = part[k]
+
+    on = sol["KGJ_on"]
+    change = np.diff(on, prepend=p.initial_state)
+    sol["KGJ_start"] = (change > 0).astype(float)
+    sol["KGJ_stop"] = (change < 0).astype(float)
+
+    result = _build_output(df, p, sol)
+    _report(opts, 1.0, "Hotovo")
+    solver = _merge_stats(stats)
+    stopped = solver.pop("stopped", None)
+    # Re-solved windows keep the previous schedule at their edges, so only an unchanged run stays optimal
+    result.attrs.update(status=_stitched_status(statuses, not windows), objective=float(result["Total_profit_EUR"].sum()),
+                        params=asdict(p), formulation=formulation, engine=engine, mode="incremental",
+                        solver=solver, stopped=stopped, incremental={"windows": [list(w) for w in windows],
+                                     "hours": int(sum(b - a for a, b in windows))})
+    return result
+
+
+RESULT_COLUMNS = (
+    "datetime",
+    "EE_price_EUR_MWh",
+    "Gas_price_EUR_MWh",
+    "Heat_price_EUR_MWh",
+    "Heat_demand_MWh",
+    "Bypass_heat_MWh",
+    "KGJ_heat_MWh",
+    "KGJ_load_pct",
+    "KGJ_on",
+    "KGJ_start",
+    "KGJ_stop",
+    "Gas_boiler_heat_MWh",
+    "Gas_boiler_load_pct",
+    "Electric_boiler_heat_MWh",
+    "Electric_boiler_load_pct",
+    "KGJ_Electricity_MWh",
+    "EE_Sold_Spot_MWh",
+    "EE_to_EBoiler_Internal_MWh",
+    "EE_to_EBoiler_Grid_MWh",
+    "Total_profit_EUR",
+    "KGJ_Power_Trigger_EE_only",
+    "Cost_1_Boiler_EUR_per_MWh",
+    "Cost_2_KGJ_Spot_EUR_per_MWh",
+    "Cost_3_EBoiler_Grid_EUR_per_MWh",
+    "Cost_4_KGJ_EBoiler_EUR_per_MWh",
+    "KGJ_margin_EE_only_EUR_per_MWh",
+    "Margin_1_Boiler_EUR_per_MWh",
+    "Margin_2_KGJ_Spot_EUR_per_MWh",
+    "Margin_3_EBoiler_Grid_EUR_per_MWh",
+    "Margin_4_KGJ_EBoiler_EUR_per_MWh",
+)
+INT_RESULT_COLUMNS = ("KGJ_on", "KGJ_start", "KGJ_stop")
+
+
+def _solution_from_output(result: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """Per-variable solution arrays recovered from a results DataFrame."""
+    def col(name):
+        return result[name].to_numpy(dtype=float).copy()
+
+    return {
+        "q_KGJ": col("KGJ_heat_MWh") + col("Bypass_heat_MWh"),
+        "q_boiler": col("Gas_boiler_heat_MWh"),
+        "q_eboiler": col("Electric_boiler_heat_MWh"),
+        "ee_from_kgj": col("KGJ_Electricity_MWh"),
+        "ee_sold_spot": col("EE_Sold_Spot_MWh"),
+        "ee_to_eboiler_int": col("EE_to_EBoiler_Internal_MWh"),
+        "ee_to_eboiler_grid": col("EE_to_EBoiler_Grid_MWh"),
+        "KGJ_on": col("KGJ_on"),
+        "KGJ_start": col("KGJ_start"),
+        "KGJ_stop": col("KGJ_stop"),
+    }
+
+
+def _build_output(df: pd.DataFrame, p: TechParams, sol: Dict[str, np.ndarray]) -> pd.DataFrame:
+    """
+    Assemble the hourly results DataFrame from per-variable solution arrays.
+    All float columns are written into one preallocated block.
+    """
+    BYPASS_TOL = 0.001
+    arr = _input_arrays(df)
+    r = _margin_columns(arr["ee_price"], arr["gas_price"], arr["heat_price"], p)
+
+    kgj_total = sol["q_KGJ"]
+    bypass = np.maximum(kgj_total - p.heat_min_cover * arr["heat_demand"], 0.0)
+    bypass[bypass < BYPASS_TOL] = 0.0
+
+    columns = {
+        "EE_price_EUR_MWh":                  arr["ee_price"],
+        "Gas_price_EUR_MWh":                 arr["gas_price"],
+        "Heat_price_EUR_MWh":                arr["heat_price"],
+        "Heat_demand_MWh":                   arr["heat_demand"],
+        "Bypass_heat_MWh":                   bypass,
+        "KGJ_heat_MWh":                      kgj_total - bypass,
+        "KGJ_load_pct":                      100 * kgj_total / p.kgj_heat_output,
+        "Gas_boiler_heat_MWh":               sol["q_boiler"],
+        "Gas_boiler_load_pct":               100 * sol["q_boiler"] / p.boiler_max_heat,
+        "Electric_boiler_heat_MWh":          sol["q_eboiler"],
+        "Electric_boiler_load_pct":          100 * sol["q_eboiler"] / p.eboiler_max_heat,
+        "KGJ_Electricity_MWh":               sol["ee_from_kgj"],
+        "EE_Sold_Spot_MWh":                  sol["ee_sold_spot"],
+        "EE_to_EBoiler_Internal_MWh":        sol["ee_to_eboiler_int"],
+        "EE_to_EBoiler_Grid_MWh":            sol["ee_to_eboiler_grid"],
+        "Total_profit_EUR":                  _hourly_profit(arr, p, sol),
+        "KGJ_Power_Trigger_EE_only":         r["trigger_ee_only"],
+        "Cost_1_Boiler_EUR_per_MWh":         r["cost1"],
+        "Cost_2_KGJ_Spot_EUR_per_MWh":       r["cost2"],
+        "Cost_3_EBoiler_Grid_EUR_per_MWh":   r["cost3"],
+        "Cost_4_KGJ_EBoiler_EUR_per_MWh":    r["cost4"],
+        "KGJ_margin_EE_only_EUR_per_MWh":    r["kgj_margin_ee"],
+        "Margin_1_Boiler_EUR_per_MWh":       r["m1"],
+        "Margin_2_KGJ_Spot_EUR_per_MWh":     r["m2"],
+        "Margin_3_EBoiler_Grid_EUR_per_MWh": r["m3"],
+        "Margin_4_KGJ_EBoiler_EUR_per_MWh":  r["m4"],
+    }
+
+    float_cols = [c for c in RESULT_COLUMNS if c in columns]
+    block = np.empty((len(df), len(float_cols)))
+    for j, name in enumerate(float_cols):
+        block[:, j] = columns[name]
+    out = pd.DataFrame(block, columns=float_cols, copy=False)
 
-    # Build output DataFrame
-    rows = []
-    for t in range(T):
-        demand    = df.loc[t, "heat_demand"]
-        ee_p      = df.loc[t, "ee_price"]
-        gas_p     = df.loc[t, "gas_price"]
-        heat_p    = df.loc[t, "heat_price"]
-
-        kgj_total = q_kgj[t].varValue or 0.0
-        bypass    = max(kgj_total - p.heat_min_cover * demand, 0)
-        if bypass < BYPASS_TOL:
-            bypass = 0.0
-
-        r = compute_margins(ee_p, gas_p, heat_p, p)
-
-        rows.append({
-            "datetime":                          df.loc[t, "datetime"],
-            "EE_price_EUR_MWh":                  ee_p,
-            "Gas_price_EUR_MWh":                 gas_p,
-            "Heat_price_EUR_MWh":                heat_p,
-            "Heat_demand_MWh":                   demand,
-            "Bypass_heat_MWh":                   bypass,
-            "KGJ_heat_MWh":                      kgj_total - bypass,
-            "KGJ_load_pct":                      100 * kgj_total / p.kgj_heat_output,
-            "KGJ_on":                            int(round(kgj_on[t].varValue or 0)),
-            "KGJ_start":                         int(round(kgj_start[t].varValue or 0)),
-            "KGJ_stop":                          int(round(kgj_stop[t].varValue or 0)),
-            "Gas_boiler_heat_MWh":               q_boiler[t].varValue or 0.0,
-            "Gas_boiler_load_pct":               100 * (q_boiler[t].varValue or 0) / p.boiler_max_heat,
-            "Electric_boiler_heat_MWh":          q_eboiler[t].varValue or 0.0,
-            "Electric_boiler_load_pct":          100 * (q_eboiler[t].varValue or 0) / p.eboiler_max_heat,
-            "KGJ_Electricity_MWh":               ee_from_kgj[t].varValue or 0.0,
-            "EE_Sold_Spot_MWh":                  ee_sold_spot[t].varValue or 0.0,
-            "EE_to_EBoiler_Internal_MWh":        ee_to_eboiler_int[t].varValue or 0.0,
-            "EE_to_EBoiler_Grid_MWh":            ee_to_eboiler_grid[t].varValue or 0.0,
-            "Total_profit_EUR":                  profit_terms[t].value() or 0.0,
-            "KGJ_Power_Trigger_EE_only":         r["trigger_ee_only"],
-            "Cost_1_Boiler_EUR_per_MWh":         r["cost1"],
-            "Cost_2_KGJ_Spot_EUR_per_MWh":       r["cost2"],
-            "Cost_3_EBoiler_Grid_EUR_per_MWh":   r["cost3"],
-            "Cost_4_KGJ_EBoiler_EUR_per_MWh":    r["cost4"],
-            "KGJ_margin_EE_only_EUR_per_MWh":    r["kgj_margin_ee"],
-            "Margin_1_Boiler_EUR_per_MWh":       r["m1"],
-            "Margin_2_KGJ_Spot_EUR_per_MWh":     r["m2"],
-            "Margin_3_EBoiler_Grid_EUR_per_MWh": r["m3"],
-            "Margin_4_KGJ_EBoiler_EUR_per_MWh":  r["m4"],
-        })
-
-    return pd.DataFrame(rows)
+    out.insert(0, "datetime", df["datetime"].to_numpy())
+    for name, var in zip(INT_RESULT_COLUMNS, BINARY_VARS):
+        out.insert(RESULT_COLUMNS.index(name), name, sol[var].astype(np.int64))
+    return out
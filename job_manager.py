@@ -0,0 +1,217 @@
+"""
+KGJ Job Manager
+Long solves (run_dispatch, rerun_dispatch, portfolio and pool runs, ...)
+run as background jobs, each waiting for a slot of the process-wide
+SolverScheduler; callers keep only a job id and poll the job's status,
+queue position and progress, so a Streamlit session is never blocked by
+a solve. Jobs can be cancelled,
+and jobs of owners that are gone (closed browser tab) and no longer poll
+are cancelled by a heartbeat reaper.
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from typing import Callable, Optional
+
+from dispatch_engine import CancelToken
+from solver_scheduler import SolverScheduler, get_scheduler
+
+
+JOB_STATES = ("queued", "running", "done", "failed", "cancelled")
+HEARTBEAT_TIMEOUT = 60.0   # seconds without a poll after which a job counts as abandoned
+
+
+@dataclass
+class Job:
+    """State of one background job; JobManager.get returns snapshots of it."""
+    id: str
+    label: str = ""
+    owner: str = ""                 # scheduler queue the job waits in (e.g. a session id)
+    status: str = "queued"          # see JOB_STATES; "cancelled" may still hold the best incumbent
+    progress: float = 0.0           # 0..1 as reported by the solve
+    message: str = ""
+    result: object = None
+    error: Optional[str] = None
+    submitted: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    last_seen: float = field(default_factory=time.time)
+    position: int = 0               # place in the scheduler queue while queued
+    cancel: CancelToken = field(default_factory=CancelToken, repr=False)
+    ticket: object = field(default=None, repr=False)
+
+    @property
+    def is_done(self) -> bool:
+        return self.status in ("done", "failed", "cancelled")
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since the job started running (0 while queued)."""
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+
+class JobManager:
+    """
+    Background jobs on one bounded thread pool owned by the manager. Jobs
+    wait in the fair queue of `scheduler` (default the process-wide one); a
+    dispatcher thread hands each granted job to the pool, so at most
+    `scheduler.max_concurrent` jobs run at once and no thread waits per
+    queued job. The solvers do their work outside the GIL (the CBC
+    subprocess, HiGHS, process pools), so threads are enough and progress
+    callbacks update the job directly. A job not polled (get or touch) for
+    `heartbeat` seconds is cancelled, and forgotten once it has gone
+    unpolled for ten times that, unless alive(owner) says its owner is
+    still there: a Streamlit session stops polling while its script runs
+    (or waits), which says nothing about the job. alive is called with the
+    manager's lock held, so it must be quick. Finished jobs are kept until
+    forgotten, at most `keep` of them.
+    """
+
+    def __init__(self, scheduler: Optional[SolverScheduler] = None, keep: int = 100,
+                 heartbeat: float = HEARTBEAT_TIMEOUT, alive: Optional[Callable[[str], bool]] = None):
+        self.scheduler = scheduler or get_scheduler()
+        self._pool = ThreadPoolExecutor(max_workers=self.scheduler.max_concurrent,
+                                        thread_name_prefix="kgj-job")
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._queued = {}   # ticket id -> (job, fn, args, kwargs) of jobs waiting for a slot
+        self._lock = threading.Lock()
+        self.keep = keep
+        self.heartbeat = heartbeat
+        self.alive = alive
+        self._closed = threading.Event()
+        threading.Thread(target=self._dispatch_loop, name="kgj-job-dispatch", daemon=True).start()
+        threading.Thread(target=self._reap_loop, name="kgj-job-reaper", daemon=True).start()
+
+    def submit(self, fn: Callable, *args, label: str = "", owner: str = "", weight: int = 1, **kwargs) -> str:
+        """
+        Queue fn(*args, progress=..., cancel=..., **kwargs) under `owner`,
+        holding `weight` scheduler slots while it runs (e.g. one per worker
+        process of a pool run), and return the job id. fn must accept a
+        progress(fraction, message) callback and a CancelToken, as
+        run_dispatch and rerun_dispatch do.
+        """
+        job = Job(id=uuid.uuid4().hex[:12], label=label, owner=owner)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+            job.ticket = self.scheduler.enqueue(owner, weight)
+            self._queued[job.ticket.id] = (job, fn, args, kwargs)
+        return job.id
+
+    def _dispatch_loop(self):
+        while not self._closed.is_set():
+            ticket = self.scheduler.grant_next(lambda t: t.id in self._queued, timeout=0.5)
+            if ticket is None:
+                continue
+            with self._lock:
+                entry = self._queued.pop(ticket.id, None)
+            if entry is None:   # cancelled in between
+                self.scheduler.release(ticket)
+                continue
+            self._pool.submit(self._run, *entry)
+
+    def _run(self, job: Job, fn: Callable, args, kwargs):
+        try:
+            self._execute(job, fn, args, kwargs)
+        finally:
+            self.scheduler.release(job.ticket)
+
+    def _execute(self, job: Job, fn: Callable, args, kwargs):
+        self._update(job, status="running", started=time.time())
+
+        def progress(fraction: float, message: str = ""):
+            with self._lock:
+                # Nested stages may restart lower; the shown progress only grows
+                job.progress = max(job.progress, min(float(fraction), 1.0))
+                job.message = message
+
+        try:
+            result = fn(*args, progress=progress, cancel=job.cancel, **kwargs)
+        except Exception as e:
+            self._update(job, status="failed", error=f"{type(e).__name__}: {e}", finished=time.time())
+        else:
+            status = "cancelled" if job.cancel.cancelled else "done"
+            self._update(job, status=status, result=result, progress=1.0, finished=time.time())
+
+    def _update(self, job: Job, **changes):
+        with self._lock:
+            for name, value in changes.items():
+                setattr(job, name, value)
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.is_done]
+        for job_id in finished[:max(len(finished) - self.keep, 0)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Snapshot of a job, None if unknown (or already forgotten). Counts as a poll."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job.last_seen = time.time()
+            snapshot = replace(job)
+        if snapshot.status == "queued":
+            snapshot.position = self.scheduler.position(snapshot.ticket)
+        return snapshot
+
+    def touch(self, job_ids):
+        """Mark jobs as still wanted (a session holding them is alive)."""
+        now = time.time()
+        with self._lock:
+            for job_id in job_ids:
+                if job_id in self._jobs:
+                    self._jobs[job_id].last_seen = now
+
+    def cancel(self, job_id: str):
+        """Ask a job to stop; a running solve returns its best incumbent, a queued job leaves the queue."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                self._cancel(job)
+
+    def _cancel(self, job: Job):
+        # Called with _lock held
+        job.cancel.cancel()
+        if self._queued.pop(job.ticket.id, None) is not None:
+            self.scheduler.release(job.ticket)
+            job.status, job.finished = "cancelled", time.time()
+
+    def _reap_loop(self):
+        while not self._closed.wait(min(self.heartbeat / 4, 5.0)):
+            now = time.time()
+            with self._lock:
+                for job_id, job in list(self._jobs.items()):
+                    idle = now - job.last_seen
+                    if idle <= self.heartbeat or (self.alive is not None and self.alive(job.owner)):
+                        continue
+                    if not job.is_done:
+                        self._cancel(job)
+                    elif idle > 10 * self.heartbeat:
+                        del self._jobs[job_id]
+
+    def jobs(self) -> list:
+        """Snapshots of all known jobs, oldest first."""
+        with self._lock:
+            return [replace(job) for job in self._jobs.values()]
+
+    def forget(self, job_id: str):
+        """Drop a finished job and its result."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.is_done:
+                del self._jobs[job_id]
+
+    def shutdown(self, wait: bool = True):
+        """Cancel all jobs and stop the dispatcher, the reaper and the pool."""
+        self._closed.set()
+        with self._lock:
+            for job in self._jobs.values():
+                self._cancel(job)
+        self._pool.shutdown(wait=wait)
@@ -7,6 +7,8 @@ Fixed: plyn 35 EUR/MWh, teplo 40 EUR/MWh
 from dataclasses import dataclass
 from typing import Dict
 
+from dispatch_engine import TechParams
+
 
 @dataclass
 class LocationConfig:
@@ -60,6 +62,25 @@ class LocationConfig:
     def total_gas_consumption(self):
         return self.kgj_gas_input + (self.boiler_max_heat / self.boiler_eff)
 
+    def tech_params(self, initial_state: int = 0) -> TechParams:
+        """Dispatch engine parameters for this location."""
+        return TechParams(
+            kgj_heat_output=self.kgj_heat_output,
+            kgj_el_output=self.kgj_el_output,
+            kgj_heat_eff=self.kgj_heat_output / self.kgj_gas_input,
+            kgj_service=self.kgj_service,
+            kgj_min_load=self.kgj_min_load,
+            boiler_eff=self.boiler_eff,
+            boiler_max_heat=self.boiler_max_heat,
+            eboiler_eff=self.eboiler_eff,
+            eboiler_max_heat=self.eboiler_max_heat,
+            ee_dist_cost=self.ee_dist_cost,
+            heat_min_cover=self.heat_min_cover,
+            min_up=self.min_up,
+            min_down=self.min_down,
+            initial_state=initial_state,
+        )
+
 
 # ═══════════════════════════════════════════════
 # DEFINICE LOKALIT
@@ -0,0 +1,280 @@
+"""
+KGJ Portfolio Run
+All locations solved concurrently in a process pool, one site per worker,
+plus a combined portfolio summary of the annual KPIs. Limits shared by the
+sites (gas offtake, grid draw) are enforced by Lagrangian decomposition.
+"""
+
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+from typing import Callable, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from annual_estimate import annual_kpis
+from dispatch_engine import CancelToken, TechParams, collect_futures, reprice_result, run_dispatch, shared_cancel
+from locations_config import LOCATIONS, LocationConfig
+
+
+PORTFOLIO_ROW = "Portfolio"
+
+
+def _run_site(p: TechParams, df: pd.DataFrame, options: dict):
+    """One site in a worker process. Returns (results or None, wall seconds)."""
+    t0 = time.perf_counter()
+    result = run_dispatch(df, p, **options)
+    return result, time.perf_counter() - t0
+
+
+def run_portfolio(inputs: Dict[str, pd.DataFrame], locations: Dict[str, LocationConfig] = LOCATIONS,
+                  max_workers: Optional[int] = None,
+                  progress: Optional[Callable[[float, str], None]] = None,
+                  cancel: Optional[CancelToken] = None, **dispatch_options):
+    """
+    Solve every site in `inputs` (location id -> input curve) with
+    run_dispatch in its own process, so the wall time follows the slowest
+    site rather than the sum. `dispatch_options` are passed to every
+    run_dispatch call (a result_cache.ResultCache as cache is shared
+    safely). max_workers defaults to one process per site.
+    progress(fraction, message) counts finished sites; `cancel` is passed
+    on to run_dispatch, and once it stops, running sites return their
+    incumbent and sites not started yet are skipped (None).
+
+    Returns (location id -> results DataFrame or None on failure,
+    portfolio_summary of them). The total wall time is in the summary's
+    `.attrs["wall_time"]`, the cancel reason in `.attrs["stopped"]`.
+    """
+    unknown = [loc_id for loc_id in inputs if loc_id not in locations]
+    if unknown:
+        raise ValueError(f"Unknown locations: {unknown}")
+
+    t0 = time.perf_counter()
+    options = dict(dispatch_options, cancel=cancel)
+    with shared_cancel(cancel), ProcessPoolExecutor(max_workers=max_workers or max(len(inputs), 1)) as pool:
+        futures = [pool.submit(_run_site, locations[loc_id].tech_params(), df, options)
+                   for loc_id, df in inputs.items()]
+        outcomes = dict(zip(inputs, collect_futures(futures, progress, cancel, "Lokality")))
+
+    results = {loc_id: outcome[0] if outcome else None for loc_id, outcome in outcomes.items()}
+    summary = portfolio_summary(results, locations)
+    summary["solve_s"] = pd.Series({locations[loc_id].display_name: outcome[1]
+                                    for loc_id, outcome in outcomes.items() if outcome})
+    summary.attrs["wall_time"] = time.perf_counter() - t0
+    if cancel is not None and cancel.reason() is not None:
+        summary.attrs["stopped"] = cancel.reason()
+    summary.loc[PORTFOLIO_ROW, "solve_s"] = summary.attrs["wall_time"]
+    return results, summary
+
+
+def portfolio_summary(results: Dict[str, Optional[pd.DataFrame]],
+                      locations: Dict[str, LocationConfig] = LOCATIONS) -> pd.DataFrame:
+    """
+    Annual KPIs (annual_estimate.annual_kpis keys) per site plus a
+    PORTFOLIO_ROW total over the solved sites; the average KGJ load is
+    weighted by KGJ hours. Failed sites keep only their status.
+    """
+    rows = {}
+    for loc_id, result in results.items():
+        loc = locations[loc_id]
+        row = {"status": "Failed", "hours": np.nan}
+        if result is not None:
+            row = dict(annual_kpis(result, loc.tech_params()),
+                       status=result.attrs.get("status", "Optimal"), hours=len(result))
+        rows[loc.display_name] = row
+    summary = pd.DataFrame.from_dict(rows, orient="index")
+
+    solved = summary[summary["status"] != "Failed"]
+    total = solved.drop(columns="status").sum()
+    if "avg_kgj_load" in solved and total.get("kgj_hours", 0) > 0:
+        total["avg_kgj_load"] = (solved["avg_kgj_load"] * solved["kgj_hours"]).sum() / total["kgj_hours"]
+    if len(solved) < len(summary):
+        total["status"] = "Partial"
+    else:
+        total["status"] = "Optimal" if (solved["status"] == "Optimal").all() else "Feasible"
+    summary.loc[PORTFOLIO_ROW] = total
+    return summary
+
+
+# ──────────────────────────────────────────────
+# SHARED LIMITS (Lagrangian decomposition)
+# ──────────────────────────────────────────────
+
+SHARED_RESOURCES = ("gas", "grid")
+LIMIT_PERIODS = ("hourly", "annual")
+
+
+@dataclass(frozen=True)
+class SharedLimit:
+    """
+    Portfolio-wide cap on "gas" (gas offtake of KGJs and boilers) or "grid"
+    (grid draw of the e-boilers), in MWh. period="hourly" caps every hour
+    (`limit` a scalar or one value per hour), "annual" the horizon total.
+    """
+    resource: str
+    limit: object
+    period: str = "hourly"
+
+
+def _usage(result: pd.DataFrame, p: TechParams, resource: str) -> np.ndarray:
+    """Hourly use of a shared resource by one site."""
+    if resource == "gas":
+        kgj = result["KGJ_heat_MWh"] + result["Bypass_heat_MWh"]
+        return (kgj * p.kgj_gas_per_heat + result["Gas_boiler_heat_MWh"] / p.boiler_eff).to_numpy()
+    return result["EE_to_EBoiler_Grid_MWh"].to_numpy()
+
+
+def _priced_site(df: pd.DataFrame, p: TechParams, limits, multipliers):
+    """
+    (params, inputs) of a site with the multipliers added to the resource
+    prices: gas on the hourly gas price, grid on the distribution fee.
+    """
+    df = df.copy()
+    for limit, price in zip(limits, multipliers):
+        if limit.resource == "gas":
+            df["gas_price"] = df["gas_price"].to_numpy(dtype=float) + price
+        else:
+            p = replace(p, ee_dist_cost=p.ee_dist_cost + float(price))
+    return p, df
+
+
+def run_shared_portfolio(inputs: Dict[str, pd.DataFrame], limits,
+                         locations: Dict[str, LocationConfig] = LOCATIONS, max_iter: int = 30,
+                         tol: float = 0.005, step: Optional[float] = None,
+                         max_workers: Optional[int] = None,
+                         progress: Optional[Callable[[float, str], None]] = None,
+                         cancel: Optional[CancelToken] = None, **dispatch_options):
+    """
+    Portfolio run with SharedLimit caps across the sites. Each limit gets a
+    Lagrange multiplier (EUR/MWh; one per hour for hourly limits) that is
+    added to the resource price of every site, so the sites stay separate
+    run_dispatch problems, solved in parallel each iteration. Multipliers
+    follow a projected subgradient step (initially `step`, default the mean
+    resource price for hourly limits and a quarter of it for annual ones,
+    shrinking as 1/sqrt(iteration)) until the best feasible plan is within
+    `tol` of the dual bound or after max_iter iterations. Without a
+    feasible plan by then, up to max_iter more iterations only raise the
+    prices where a limit is still exceeded.
+
+    Grid limits can only be annual: the e-boiler grid fee is a single
+    TechParams value. The bound is exact only for exact subproblems
+    (engine="dp", or a MIP at zero gap); DP also keeps each iteration well
+    under a second.
+
+    Returns (location id -> results at the true prices, summary) as
+    run_portfolio, the summary with gas and grid use per site. With no
+    feasible iterate the least violating plan is returned. A site's plan is
+    only its share of the joint plan, never its own optimum: its
+    attrs["status"] and attrs["shared_limits"] are the Lagrange status
+    ("Feasible" or "Infeasible"), as is the summary status.
+    `.attrs["lagrange"]` holds status, bound, gap, iterations, the final
+    multipliers and the per-iteration history.
+
+    progress(fraction, message) follows the iterations; `cancel` is passed
+    on to run_dispatch, and once it stops no further iteration starts (the
+    reason is in `.attrs["lagrange"]["stopped"]`).
+    """
+    if max_iter < 1:
+        raise ValueError("max_iter must be at least 1")
+    unknown = [loc_id for loc_id in inputs if loc_id not in locations]
+    if unknown:
+        raise ValueError(f"Unknown locations: {unknown}")
+    for limit in limits:
+        if limit.resource not in SHARED_RESOURCES:
+            raise ValueError(f"Unknown shared resource: {limit.resource}")
+        if limit.period not in LIMIT_PERIODS:
+            raise ValueError(f"Unknown limit period: {limit.period}")
+        if limit.resource == "grid" and limit.period == "hourly":
+            raise ValueError("Grid limits can only be annual (the grid fee is a scalar parameter)")
+    T = len(next(iter(inputs.values())))
+    if any(limit.period == "hourly" for limit in limits) and any(len(df) != T for df in inputs.values()):
+        raise ValueError("Hourly shared limits need the same horizon at every site")
+
+    params = {loc_id: locations[loc_id].tech_params() for loc_id in inputs}
+    caps = [np.broadcast_to(np.asarray(limit.limit, dtype=float), (T,)) if limit.period == "hourly"
+            else float(limit.limit) for limit in limits]
+    multipliers = [np.zeros(T) if limit.period == "hourly" else 0.0 for limit in limits]
+    if step is None:
+        gas = np.mean([df["gas_price"].mean() for df in inputs.values()])
+        grid = np.mean([df["ee_price"].mean() + params[loc_id].ee_dist_cost for loc_id, df in inputs.items()])
+        steps = [(gas if limit.resource == "gas" else grid) * (1.0 if limit.period == "hourly" else 0.25)
+                 for limit in limits]
+    else:
+        steps = [step] * len(limits)
+
+    t0 = time.perf_counter()
+    options = dict(dispatch_options, cancel=cancel)
+    bound, best, closest, history = np.inf, None, None, []
+    with shared_cancel(cancel), ProcessPoolExecutor(max_workers=max_workers or max(len(inputs), 1)) as pool:
+        for iteration in range(2 * max_iter):
+            if progress is not None:
+                progress(min(iteration / max_iter, 1.0), f"Iterace {iteration + 1}")
+            futures = {loc_id: pool.submit(_run_site, *_priced_site(df, params[loc_id], limits, multipliers),
+                                           options)
+                       for loc_id, df in inputs.items()}
+            priced = {loc_id: f.result()[0] for loc_id, f in futures.items()}
+            if any(result is None for result in priced.values()):
+                return _shared_outcome(priced, params, locations, "Infeasible", t0, {})
+
+            # L(multipliers) = sum of priced site optima + multipliers . caps bounds the joint optimum
+            dual = sum(r.attrs["objective"] for r in priced.values())
+            dual += sum(float(np.sum(m * c)) for m, c in zip(multipliers, caps))
+            bound = min(bound, dual)
+
+            results = {loc_id: reprice_result(r, inputs[loc_id], params[loc_id]) for loc_id, r in priced.items()}
+            profit = sum(r.attrs["objective"] for r in results.values())
+            violations = []
+            for limit, cap in zip(limits, caps):
+                use = sum(_usage(r, params[loc_id], limit.resource) for loc_id, r in results.items())
+                violations.append(use - cap if limit.period == "hourly" else float(use.sum()) - cap)
+            excess = [float(np.max(v)) for v in violations]
+            feasible = all(e <= 1e-6 * max(1.0, float(np.max(c))) for e, c in zip(excess, caps))
+
+            if feasible and (best is None or profit > best[0]):
+                best = profit, results
+            total_excess = sum(max(e, 0.0) for e in excess)
+            if closest is None or total_excess < closest[0]:
+                closest = total_excess, results
+            gap = (bound - best[0]) / abs(bound) if best is not None and bound else np.inf
+            history.append({"iteration": iteration, "dual": dual, "profit": profit,
+                            "max_excess": excess, "feasible": feasible})
+            if gap <= tol or (iteration + 1 >= max_iter and best is not None):
+                break
+            if cancel is not None and cancel.reason() is not None:
+                break
+
+            for j, v in enumerate(violations):
+                # Projected direction: slack where the price is already zero cannot move it
+                v = np.where((multipliers[j] > 0) | (v > 0), v, 0.0)
+                scale = float(np.max(np.abs(v)))
+                if iteration + 1 >= max_iter:
+                    # Repair phase: raise the price by the last step wherever the limit is still exceeded
+                    multipliers[j] = multipliers[j] + steps[j] / np.sqrt(max_iter) * (v > 0)
+                elif scale > 0:
+                    multipliers[j] = np.maximum(multipliers[j] + steps[j] / np.sqrt(iteration + 1) * v / scale, 0.0)
+
+    info = {"bound": bound, "gap": gap, "iterations": len(history), "history": history,
+            "multipliers": {f"{limit.resource}_{limit.period}": m for limit, m in zip(limits, multipliers)}}
+    if cancel is not None and cancel.reason() is not None:
+        info["stopped"] = cancel.reason()
+    if best is not None:
+        return _shared_outcome(best[1], params, locations, "Feasible", t0, info)
+    return _shared_outcome(closest[1], params, locations, "Infeasible", t0, info)
+
+
+def _shared_outcome(results, params, locations, status, t0, info):
+    """(results, summary) of a shared-limit run, with resource use per site."""
+    for result in results.values():
+        if result is not None:
+            result.attrs.update(status=status, shared_limits=status)
+    summary = portfolio_summary(results, locations)
+    summary.loc[PORTFOLIO_ROW, "status"] = status
+    for resource in SHARED_RESOURCES:
+        use = pd.Series({locations[loc_id].display_name: float(_usage(r, params[loc_id], resource).sum())
+                         for loc_id, r in results.items() if r is not None})
+        summary[f"{resource}_MWh"] = use
+        summary.loc[PORTFOLIO_ROW, f"{resource}_MWh"] = use.sum()
+    summary.attrs["wall_time"] = time.perf_counter() - t0
+    summary.attrs["lagrange"] = dict(info, status=status)
+    return results, summary
@@ -0,0 +1,116 @@
+"""
+KGJ Result Cache
+Content-addressed on-disk cache of dispatch results (Parquet).
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from dataclasses import asdict
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from dispatch_engine import ENGINE_VERSION, INPUT_COLUMNS, TechParams
+
+
+CACHE_DIR_ENV = "KGJ_CACHE_DIR"
+CACHE_MAX_BYTES_ENV = "KGJ_CACHE_MAX_MB"
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "kgj_dispatch")
+DEFAULT_MAX_MB = 512
+
+
+def cache_key(df: pd.DataFrame, p: TechParams, options: dict) -> str:
+    """SHA-256 of the input arrays, the TechParams fields, the solve options and ENGINE_VERSION."""
+    h = hashlib.sha256()
+    h.update(ENGINE_VERSION.encode())
+    h.update(json.dumps(asdict(p), sort_keys=True).encode())
+    h.update(json.dumps(options, sort_keys=True, default=str).encode())
+    for col in INPUT_COLUMNS:
+        h.update(np.ascontiguousarray(df[col].to_numpy(dtype=float)).tobytes())
+    dt = pd.to_datetime(df["datetime"], errors="coerce")
+    h.update(np.ascontiguousarray(dt.to_numpy(dtype="datetime64[ns]").view(np.int64)).tobytes())
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    Results stored as <key>.parquet under `directory` (default: $KGJ_CACHE_DIR
+    or ~/.cache/kgj_dispatch). A hit refreshes the file's mtime; when the
+    directory grows past `max_bytes` the least recently used files are
+    removed first.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.directory = directory or os.environ.get(CACHE_DIR_ENV) or DEFAULT_CACHE_DIR
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get(CACHE_MAX_BYTES_ENV, DEFAULT_MAX_MB)) * 1024 ** 2)
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, df: pd.DataFrame, p: TechParams, options: dict) -> str:
+        return cache_key(df, p, options)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.parquet")
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        path = self._path(key)
+        try:
+            result = pd.read_parquet(path)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        result.attrs["cached"] = True
+        return result
+
+    def put(self, key: str, result: pd.DataFrame):
+        # Write to a temporary file first so readers never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            result.to_parquet(tmp, index=False)
+            os.replace(tmp, self._path(key))
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self.evict()
+
+    def entries(self) -> list:
+        """(path, size, mtime) of every cached result, oldest first."""
+        out = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".parquet"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            out.append((path, st.st_size, st.st_mtime))
+        return sorted(out, key=lambda e: e[2])
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """Remove least recently used results until the cache fits max_bytes."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        for path, _, _ in self.entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,136 @@
+"""
+KGJ Price Scenarios
+Monte Carlo EE price paths around the forward curve (mean-reverting noise
+plus decaying spikes) or user-supplied paths, each dispatched with
+run_dispatch in a process pool. Only the annual KPIs of every scenario are
+kept, never the hourly frames.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+from annual_estimate import annual_kpis
+from dispatch_engine import CancelToken, TechParams, collect_futures, run_dispatch, shared_cancel
+
+
+SCENARIO_KPIS = ("total_profit", "kgj_hours", "kgj_starts")
+SCENARIO_PERCENTILES = (5, 50, 95)
+
+
+@dataclass(frozen=True)
+class PriceModel:
+    """
+    Hourly EE price = forward curve + x + s. x is an Ornstein-Uhlenbeck
+    deviation (pulled back by `reversion` per hour, `volatility` EUR/MWh
+    shocks); s are spikes arriving with `spike_prob` per hour, exponential
+    size `spike_mean` EUR/MWh, upward with `spike_up` probability, decaying
+    by `spike_decay` per hour.
+    """
+    reversion: float = 0.1
+    volatility: float = 6.0
+    spike_prob: float = 0.005
+    spike_mean: float = 60.0
+    spike_up: float = 0.7
+    spike_decay: float = 0.5
+
+
+def simulate_path(curve: np.ndarray, model: PriceModel, seed: int, scenario: int) -> np.ndarray:
+    """One price path; the same (seed, scenario) always gives the same path."""
+    rng = np.random.default_rng([seed, scenario])
+    T = len(curve)
+    shocks = rng.normal(0.0, model.volatility, T)
+    arrivals = rng.random(T) < model.spike_prob
+    jumps = np.where(arrivals, rng.exponential(model.spike_mean, T), 0.0)
+    jumps *= np.where(rng.random(T) < model.spike_up, 1.0, -1.0)
+
+    path = np.empty(T)
+    x = s = 0.0
+    for t in range(T):
+        x += -model.reversion * x + shocks[t]
+        s = s * model.spike_decay + jumps[t]
+        path[t] = curve[t] + x + s
+    return path
+
+
+def simulate_prices(df: pd.DataFrame, n: int, model: PriceModel = PriceModel(), seed: int = 0) -> np.ndarray:
+    """(n, hours) array of price paths around df["ee_price"]."""
+    curve = df["ee_price"].to_numpy(dtype=float)
+    return np.array([simulate_path(curve, model, seed, i) for i in range(n)])
+
+
+def _run_batch(df: pd.DataFrame, p: TechParams, scenarios, paths, model: PriceModel, seed: int,
+               options: dict) -> list:
+    """
+    KPI rows for a batch of scenarios in a worker process (paths None =
+    simulate). Stops at the first scenario cut short by options["cancel"];
+    that one is left out.
+    """
+    curve = df["ee_price"].to_numpy(dtype=float)
+    scenario_df = df.copy()
+    rows = []
+    for j, i in enumerate(scenarios):
+        scenario_df["ee_price"] = paths[j] if paths is not None else simulate_path(curve, model, seed, i)
+        result = run_dispatch(scenario_df, p, **options)
+        if result is not None and result.attrs.get("stopped") == "cancelled":
+            break
+        row = {"scenario": i, "status": "Failed", "mean_ee_price": float(scenario_df["ee_price"].mean())}
+        if result is not None:
+            row.update(annual_kpis(result, p), status=result.attrs.get("status", "Optimal"))
+        rows.append(row)
+    return rows
+
+
+def run_scenarios(df: pd.DataFrame, p: TechParams, n: int = 1000, model: PriceModel = PriceModel(),
+                  seed: int = 0, paths=None, max_workers: Optional[int] = None, batch: Optional[int] = None,
+                  progress: Optional[Callable[[float, str], None]] = None,
+                  cancel: Optional[CancelToken] = None, **dispatch_options) -> pd.DataFrame:
+    """
+    Dispatch n price scenarios of `df` and return one row of annual KPIs
+    (annual_estimate.annual_kpis keys) per scenario. `paths` (an (n, hours)
+    array or a DataFrame with one column per scenario) replaces the
+    simulated paths. Scenarios are sent to a process pool in batches of
+    `batch` (default: about four batches per worker). dispatch_options
+    are passed to run_dispatch; engine defaults to "dp", which solves a
+    year in well under a second. progress(fraction, message) counts
+    finished batches. Once `cancel` stops, batches not started yet are
+    dropped and the table holds only the scenarios solved so far, with the
+    reason in `.attrs["stopped"]`.
+    `.attrs["percentiles"]` holds scenario_percentiles of the result.
+    """
+    dispatch_options.setdefault("engine", "dp")
+    if paths is not None:
+        paths = np.asarray(paths.T if isinstance(paths, pd.DataFrame) else paths, dtype=float)
+        if paths.ndim != 2 or paths.shape[1] != len(df):
+            raise ValueError(f"Scenario paths must have shape (n, {len(df)})")
+        n = len(paths)
+    workers = max_workers or os.cpu_count() or 1
+    batch = batch or max(1, -(-n // (4 * workers)))
+
+    options = dict(dispatch_options, cancel=cancel)
+    with shared_cancel(cancel), ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_run_batch, df, p, range(a, min(a + batch, n)),
+                               paths[a:a + batch] if paths is not None else None, model, seed, options)
+                   for a in range(0, n, batch)]
+        rows = [row for batch_rows in collect_futures(futures, progress, cancel, "Dávky")
+                for row in batch_rows or []]
+
+    table = pd.DataFrame(rows, columns=None if rows else ["scenario", "status", *SCENARIO_KPIS])
+    table = table.set_index("scenario")
+    if cancel is not None and cancel.reason() is not None:
+        table.attrs["stopped"] = cancel.reason()
+    table.attrs["percentiles"] = scenario_percentiles(table)
+    return table
+
+
+def scenario_percentiles(table: pd.DataFrame, kpis=SCENARIO_KPIS,
+                         percentiles=SCENARIO_PERCENTILES) -> pd.DataFrame:
+    """P5/P50/P95 (or `percentiles`) of the KPIs over the solved scenarios."""
+    solved = table[table["status"] != "Failed"]
+    out = pd.DataFrame({f"P{q}": solved[list(kpis)].quantile(q / 100) for q in percentiles})
+    out.attrs["scenarios"] = len(solved)
+    return out
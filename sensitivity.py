@@ -0,0 +1,130 @@
+"""
+KGJ Sensitivity Grid
+Full-year re-dispatch over a grid of TechParams / LocationConfig field
+values (fixed prices, fees, capacities) in a process pool, giving the
+annual profit surface.
+"""
+
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import astuple, fields, replace
+from functools import lru_cache
+from typing import Callable, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from annual_estimate import annual_kpis
+from dispatch_engine import CancelToken, TechParams, collect_futures, run_dispatch, shared_cancel
+from locations_config import LocationConfig
+
+
+# Fields offered in the app (any TechParams / LocationConfig field can be swept)
+SWEEP_FIELDS = {
+    "fixed_gas_price":  "Cena plynu (EUR/MWh)",
+    "fixed_heat_price": "Cena tepla (EUR/MWh)",
+    "ee_dist_cost":     "Distribuce EE (EUR/MWh)",
+    "kgj_service":      "Servis KGJ (EUR/h)",
+    "eboiler_max_heat": "Max. teplo EKotle (MW)",
+    "boiler_max_heat":  "Max. teplo kotle (MW)",
+    "kgj_min_load":     "Min. zatížení KGJ (-)",
+}
+
+_LOCATION_FIELDS = {f.name: f.type for f in fields(LocationConfig)}
+_TECH_FIELDS = {f.name: f.type for f in fields(TechParams)}
+
+
+def point_params(loc: LocationConfig, point: dict):
+    """
+    (TechParams, gas price, heat price) for one grid point. LocationConfig
+    fields are applied first, so derived parameters follow them; fields
+    only TechParams has (e.g. eboiler_max_heat) are applied after.
+    """
+    types = {**_TECH_FIELDS, **_LOCATION_FIELDS}
+    unknown = [name for name in point if name not in types]
+    if unknown:
+        raise ValueError(f"Unknown sweep fields: {unknown}")
+    # Grid values arrive as floats; hour counts stay integers
+    point = {k: int(round(v)) if types[k] is int else v for k, v in point.items()}
+    loc = replace(loc, **{k: v for k, v in point.items() if k in _LOCATION_FIELDS})
+    p = replace(loc.tech_params(), **{k: v for k, v in point.items() if k not in _LOCATION_FIELDS})
+    return p, float(loc.fixed_gas_price), float(loc.fixed_heat_price)
+
+
+# Worker state, set once per process by _init_worker
+_BASE: Optional[pd.DataFrame] = None
+_OPTIONS: dict = {}
+
+
+def _init_worker(df: pd.DataFrame, options: dict):
+    global _BASE, _OPTIONS
+    _BASE, _OPTIONS = df, options
+    _priced_inputs.cache_clear()
+
+
+@lru_cache(maxsize=64)
+def _priced_inputs(gas: float, heat: float) -> pd.DataFrame:
+    """The base curve with the fixed prices filled in, shared by all points with these prices."""
+    df = _BASE.copy()
+    df["gas_price"] = gas
+    df["heat_price"] = heat
+    return df
+
+
+def _solve_point(p: TechParams, gas: float, heat: float) -> dict:
+    result = run_dispatch(_priced_inputs(gas, heat), p, **_OPTIONS)
+    if result is None:
+        return {"status": "Failed"}
+    if result.attrs.get("stopped") == "cancelled":
+        return {"status": "Cancelled"}
+    return dict(annual_kpis(result, p), status=result.attrs.get("status", "Optimal"))
+
+
+def sweep(df: pd.DataFrame, loc: LocationConfig, grid: Dict[str, list],
+          max_workers: Optional[int] = None, progress: Optional[Callable[[float, str], None]] = None,
+          cancel: Optional[CancelToken] = None, **dispatch_options) -> pd.DataFrame:
+    """
+    Re-dispatch the year of `df` (datetime, ee_price, heat_demand) for every
+    combination of `grid` (field -> values) and return one row per point:
+    the field values, annual KPIs (annual_estimate.annual_kpis keys) and
+    status. Workers receive the curve once (pool initializer) and reuse
+    the priced inputs per price pair; points that map to the same
+    parameters and prices are solved once. engine defaults to "dp".
+    progress(fraction, message) counts solved points. Once `cancel` stops,
+    points not started yet keep status "Cancelled" and no KPIs, and the
+    reason is in `.attrs["stopped"]`.
+    """
+    dispatch_options.setdefault("engine", "dp")
+    names = list(grid)
+    points = [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+    inputs = [point_params(loc, point) for point in points]
+    # TechParams is not hashable, so points are keyed by its field values
+    keys = [(astuple(p), gas, heat) for p, gas, heat in inputs]
+    unique = dict(zip(keys, inputs))
+
+    base = df[["datetime", "ee_price", "heat_demand"]].reset_index(drop=True)
+    workers = min(max_workers or os.cpu_count() or 1, len(unique))
+    options = dict(dispatch_options, cancel=cancel)
+    with shared_cancel(cancel), ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                    initargs=(base, options)) as pool:
+        futures = [pool.submit(_solve_point, *point) for point in unique.values()]
+        outcomes = collect_futures(futures, progress, cancel, "Body")
+    solved = {key: outcome or {"status": "Cancelled"} for key, outcome in zip(unique, outcomes)}
+
+    table = pd.DataFrame([dict(point, **solved[key]) for point, key in zip(points, keys)])
+    table.attrs.update(fields=names, solved=sum(outcome is not None for outcome in outcomes))
+    if cancel is not None and cancel.reason() is not None:
+        table.attrs["stopped"] = cancel.reason()
+    return table
+
+
+def profit_surface(table: pd.DataFrame, kpi: str = "total_profit") -> pd.DataFrame:
+    """KPI pivoted to (second field x first field) for a two-field sweep."""
+    x, y = table.attrs.get("fields", list(table.columns[:2]))[:2]
+    return table.pivot_table(index=y, columns=x, values=kpi, aggfunc="first")
+
+
+def grid_values(low: float, high: float, steps: int) -> list:
+    """`steps` evenly spaced values from low to high."""
+    return [float(v) for v in np.linspace(low, high, max(int(steps), 1))]
@@ -0,0 +1,186 @@
+"""
+KGJ Solver Scheduler
+Process-wide limit on concurrent solves with a fair queue: every owner
+(e.g. a Streamlit session) has its own FIFO and waiting solves are served
+round-robin across owners, so one analyst queueing many runs cannot starve
+the others.
+"""
+
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+
+MAX_SOLVES_ENV = "KGJ_MAX_SOLVES"
+WAIT_HISTORY = 100   # granted requests the average wait is taken over
+
+
+def default_max_solves() -> int:
+    """$KGJ_MAX_SOLVES, else half the cores (HiGHS and the process pools use several each)."""
+    if os.environ.get(MAX_SOLVES_ENV):
+        return max(int(os.environ[MAX_SOLVES_ENV]), 1)
+    return max((os.cpu_count() or 2) // 2, 1)
+
+
+@dataclass
+class Ticket:
+    """One request for `weight` solver slots."""
+    id: int
+    owner: str
+    weight: int = 1
+    enqueued: float = field(default_factory=time.time)
+    granted: Optional[float] = None
+
+
+class SolverScheduler:
+    """
+    Grants at most `max_concurrent` solver slots at a time. A request may
+    take several slots (`weight`, e.g. one per worker process of a pool
+    run); one heavier than the limit runs alone. Each owner with requests
+    queued or running counts its grants, starting level with the least
+    served active owner; waiting requests are ordered by (owner's count plus
+    its requests ahead, arrival), i.e. round-robin across owners and FIFO
+    within one.
+    """
+
+    def __init__(self, max_concurrent: Optional[int] = None):
+        self.max_concurrent = max_concurrent or default_max_solves()
+        self._cond = threading.Condition()
+        self._ids = itertools.count(1)
+        self._waiting = []
+        self._running = {}
+        self._grants = {}   # owner -> grants while it has requests queued or running
+        self._waits = deque(maxlen=WAIT_HISTORY)
+        self._served = 0
+
+    def _order(self) -> list:
+        """Waiting tickets in the order they will be served."""
+        rounds = dict(self._grants)
+        keyed = []
+        for t in sorted(self._waiting, key=lambda t: t.id):
+            rank = rounds.get(t.owner, 0)
+            rounds[t.owner] = rank + 1
+            keyed.append((rank, t.id, t))
+        return [t for _, _, t in sorted(keyed, key=lambda k: k[:2])]
+
+    def _fits(self, ticket: Ticket) -> bool:
+        used = sum(t.weight for t in self._running.values())
+        return not self._running or used + min(ticket.weight, self.max_concurrent) <= self.max_concurrent
+
+    def _retire(self, owner: str):
+        """Forget an owner's grant count once it has nothing queued or running."""
+        if not any(t.owner == owner for t in itertools.chain(self._waiting, self._running.values())):
+            self._grants.pop(owner, None)
+
+    def enqueue(self, owner: str = "", weight: int = 1) -> Ticket:
+        with self._cond:
+            ticket = Ticket(next(self._ids), owner, max(int(weight), 1))
+            if owner not in self._grants:
+                self._grants[owner] = min(self._grants.values(), default=0)
+            self._waiting.append(ticket)
+            self._cond.notify_all()
+            return ticket
+
+    def _grant(self, ticket: Ticket):
+        self._waiting.remove(ticket)
+        ticket.granted = time.time()
+        self._running[ticket.id] = ticket
+        self._grants[ticket.owner] += 1
+        self._waits.append(ticket.granted - ticket.enqueued)
+
+    def wait(self, ticket: Ticket, cancel=None, timeout: Optional[float] = None) -> bool:
+        """
+        Block until the ticket is granted (True). False when `cancel` (a
+        dispatch_engine.CancelToken) stops, which leaves the queue, or once
+        `timeout` seconds have passed, which keeps the place in it.
+        """
+        end = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while True:
+                if cancel is not None and cancel.reason() is not None:
+                    self._waiting.remove(ticket)
+                    self._retire(ticket.owner)
+                    self._cond.notify_all()
+                    return False
+                order = self._order()
+                if order and order[0] is ticket and self._fits(ticket):
+                    self._grant(ticket)
+                    return True
+                left = 0.5 if end is None else min(end - time.time(), 0.5)
+                if left <= 0:
+                    return False
+                self._cond.wait(timeout=left)
+
+    def grant_next(self, accept: Callable[[Ticket], bool], timeout: Optional[float] = None) -> Optional[Ticket]:
+        """
+        Block until the next ticket to be served is one `accept` claims and
+        it fits, then grant and return it; None once `timeout` has passed.
+        Lets one dispatcher thread start the granted requests of many
+        tickets (see job_manager.JobManager).
+        """
+        end = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while True:
+                order = self._order()
+                if order and accept(order[0]) and self._fits(order[0]):
+                    self._grant(order[0])
+                    return order[0]
+                left = 0.5 if end is None else min(end - time.time(), 0.5)
+                if left <= 0:
+                    return None
+                self._cond.wait(timeout=left)
+
+    def release(self, ticket: Ticket):
+        """Give back a granted ticket's slots, or leave the queue if it is still waiting."""
+        with self._cond:
+            if self._running.pop(ticket.id, None) is not None:
+                self._served += 1
+            elif any(t is ticket for t in self._waiting):
+                self._waiting.remove(ticket)
+            self._retire(ticket.owner)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, owner: str = "", weight: int = 1, cancel=None):
+        """Hold solver slots for the body; yields False if cancelled while queued."""
+        ticket = self.enqueue(owner, weight)
+        try:
+            yield self.wait(ticket, cancel)
+        finally:
+            self.release(ticket)
+
+    def position(self, ticket: Ticket) -> int:
+        """1-based place in the queue, 0 once granted (or gone)."""
+        with self._cond:
+            order = self._order()
+            return order.index(ticket) + 1 if ticket in order else 0
+
+    def metrics(self) -> dict:
+        """Queue depth, running requests and slots, limit, average wait (s) and served count."""
+        with self._cond:
+            return {
+                "queued": len(self._waiting),
+                "running": len(self._running),
+                "slots_used": sum(t.weight for t in self._running.values()),
+                "max_concurrent": self.max_concurrent,
+                "avg_wait": sum(self._waits) / len(self._waits) if self._waits else 0.0,
+                "served": self._served,
+            }
+
+
+_SCHEDULER = None
+_SCHEDULER_LOCK = threading.Lock()
+
+
+def get_scheduler() -> SolverScheduler:
+    """The process-wide scheduler (limit from default_max_solves)."""
+    global _SCHEDULER
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None:
+            _SCHEDULER = SolverScheduler()
+        return _SCHEDULER
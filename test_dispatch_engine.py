@@ -0,0 +1,333 @@
+"""
+Dispatch engine tests. Every engine path (DP, matrix MIP, compact MIP,
+each with and without presolve) must reach the optimum of the original
+per-hour PuLP model on short random horizons, for both min up/down
+formulations and initial states; the solve modes built on them are
+checked against that optimum too.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pulp
+import pytest
+
+import dispatch_engine
+from dispatch_engine import (MIN_RUN_FORMULATIONS, CancelToken, SolverBackend, TechParams, available_backends,
+                             build_model, get_template, rerun_dispatch, run_dispatch, write_mps)
+
+
+HOURS = 72
+SEEDS = (0, 1, 2)
+
+
+def random_horizon(seed: int, hours: int = HOURS) -> pd.DataFrame:
+    """
+    Prices around the KGJ trigger, so the unit cycles against min up/down,
+    held in runs of up to 16 identical hours (long ones get compressed by
+    presolve), and a demand with some zero stretches.
+    """
+    rng = np.random.default_rng(seed)
+    runs = rng.integers(1, 17, size=hours)
+    ee = np.repeat(rng.uniform(20.0, 200.0, size=hours).round(), runs)[:hours]
+    level = rng.uniform(0.2, 2.5, size=hours).round(2)
+    level[rng.random(hours) < 0.15] = 0.0
+    return pd.DataFrame({
+        "datetime": pd.date_range("2027-01-01", periods=hours, freq="h"),
+        "ee_price": ee,
+        "gas_price": 40.0,
+        "heat_price": 60.0,
+        "heat_demand": np.repeat(level, runs)[:hours],
+    })
+
+
+def reference_objective(df: pd.DataFrame, p: TechParams, formulation: str) -> float:
+    """
+    Optimum of the original per-hour PuLP model. "aggregated" is that model
+    as it was; "turn_on" replaces its min up/down rows by the turn-on ones,
+    which also hold in the last hours of the horizon.
+    """
+    T = len(df)
+    model = pulp.LpProblem("KGJ_Reference", pulp.LpMaximize)
+    q_kgj = pulp.LpVariable.dicts("q_KGJ", range(T), 0, p.kgj_heat_output)
+    q_boiler = pulp.LpVariable.dicts("q_boiler", range(T), 0, p.boiler_max_heat)
+    q_eboiler = pulp.LpVariable.dicts("q_eboiler", range(T), 0, p.eboiler_max_heat)
+    ee_from_kgj = pulp.LpVariable.dicts("ee_from_kgj", range(T), 0)
+    ee_sold_spot = pulp.LpVariable.dicts("ee_sold_spot", range(T), 0)
+    ee_to_eboiler_int = pulp.LpVariable.dicts("ee_to_eboiler_int", range(T), 0)
+    ee_to_eboiler_grid = pulp.LpVariable.dicts("ee_to_eboiler_grid", range(T), 0)
+    kgj_on = pulp.LpVariable.dicts("KGJ_on", range(T), 0, 1, cat="Binary")
+    kgj_start = pulp.LpVariable.dicts("KGJ_start", range(T), 0, 1, cat="Binary")
+    kgj_stop = pulp.LpVariable.dicts("KGJ_stop", range(T), 0, 1, cat="Binary")
+    heat_def = pulp.LpVariable.dicts("heat_def", range(T), 0)
+
+    for t in range(T):
+        demand = df.loc[t, "heat_demand"]
+        h_required = p.heat_min_cover * demand
+        model += q_kgj[t] <= p.kgj_heat_output * kgj_on[t]
+        model += q_kgj[t] >= p.kgj_min_load * p.kgj_heat_output * kgj_on[t]
+        if demand > 0:
+            model += q_kgj[t] + q_boiler[t] + q_eboiler[t] >= h_required
+        else:
+            model += q_boiler[t] == 0
+            model += q_eboiler[t] == 0
+        model += heat_def[t] >= h_required - q_kgj[t]
+        model += q_boiler[t] + q_eboiler[t] <= heat_def[t]
+        model += ee_from_kgj[t] == q_kgj[t] * p.kgj_el_per_heat
+        model += ee_sold_spot[t] + ee_to_eboiler_int[t] == ee_from_kgj[t]
+        model += q_eboiler[t] == p.eboiler_eff * (ee_to_eboiler_int[t] + ee_to_eboiler_grid[t])
+        previous = kgj_on[t - 1] if t > 0 else p.initial_state
+        model += kgj_on[t] - previous == kgj_start[t] - kgj_stop[t]
+
+    if formulation == "aggregated":
+        for t in range(T - p.min_up):
+            model += pulp.lpSum(kgj_on[t + i] for i in range(p.min_up)) >= p.min_up * kgj_start[t]
+        for t in range(T - p.min_down):
+            model += pulp.lpSum(1 - kgj_on[t + i] for i in range(p.min_down)) >= p.min_down * kgj_stop[t]
+    else:
+        for t in range(T):
+            model += pulp.lpSum(kgj_start[s] for s in range(max(t - p.min_up + 1, 0), t + 1)) <= kgj_on[t]
+            model += pulp.lpSum(kgj_stop[s] for s in range(max(t - p.min_down + 1, 0), t + 1)) <= 1 - kgj_on[t]
+
+    model += pulp.lpSum(
+        df.loc[t, "heat_price"] * p.heat_min_cover * df.loc[t, "heat_demand"]
+        + df.loc[t, "ee_price"] * ee_sold_spot[t]
+        - df.loc[t, "gas_price"] * (q_kgj[t] * p.kgj_gas_per_heat + q_boiler[t] / p.boiler_eff)
+        - (df.loc[t, "ee_price"] + p.ee_dist_cost) * ee_to_eboiler_grid[t]
+        - p.kgj_service * kgj_on[t]
+        for t in range(T)
+    )
+    status = model.solve(pulp.PULP_CBC_CMD(msg=False))
+    assert pulp.LpStatus[status] == "Optimal"
+    return pulp.value(model.objective)
+
+
+ENGINE_PATHS = {
+    "dp":               dict(engine="dp", presolve=False),
+    "dp_presolve":      dict(engine="dp", presolve=True),
+    "mip":              dict(engine="mip", presolve=False),
+    "mip_presolve":     dict(engine="mip", presolve=True),
+    "compact":          dict(engine="mip", presolve=False, compact=True),
+    "compact_presolve": dict(engine="mip", presolve=True, compact=True),
+}
+if "highs" in available_backends():
+    ENGINE_PATHS["highs_presolve"] = dict(engine="mip", presolve=True, backend="highs", mip_gap=0.0)
+
+
+@pytest.fixture(scope="module")
+def references():
+    """Reference optimum per (seed, formulation, initial state), solved once."""
+    return {}
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("formulation", MIN_RUN_FORMULATIONS)
+@pytest.mark.parametrize("initial_state", (0, 1))
+@pytest.mark.parametrize("path", list(ENGINE_PATHS))
+def test_engine_matches_reference(references, path, initial_state, formulation, seed):
+    df = random_horizon(seed)
+    p = TechParams(initial_state=initial_state)
+    key = (seed, formulation, initial_state)
+    if key not in references:
+        references[key] = reference_objective(df, p, formulation)
+
+    result = run_dispatch(df, p, formulation=formulation, **ENGINE_PATHS[path])
+    assert result is not None
+    assert result.attrs["status"] == "Optimal"
+    assert result.attrs["objective"] == pytest.approx(references[key], rel=1e-6, abs=1e-4)
+
+
+@pytest.mark.parametrize("engine", ("dp", "mip"))
+def test_empty_horizon_is_rejected(engine):
+    with pytest.raises(ValueError, match="Empty horizon"):
+        run_dispatch(random_horizon(0).iloc[:0], TechParams(), engine=engine)
+
+
+def test_missing_input_column_is_rejected():
+    with pytest.raises(ValueError, match="heat_demand"):
+        run_dispatch(random_horizon(0).drop(columns="heat_demand"), TechParams(), engine="dp")
+
+
+def test_incomplete_backend_fails_on_instantiation():
+    class NoSolve(SolverBackend):
+        def available(self) -> bool:
+            return True
+
+    with pytest.raises(TypeError):
+        NoSolve()
+
+
+def assert_min_runs(on: np.ndarray, p: TechParams):
+    """Every run started inside the horizon and ended inside it lasts min_up / min_down hours."""
+    on = np.asarray(on, dtype=int)
+    starts = np.flatnonzero(np.diff(on, prepend=p.initial_state) != 0)
+    bounds = np.append(starts, len(on))
+    for a, b in zip(bounds[:-1], bounds[1:]):
+        if b < len(on):
+            assert b - a >= (p.min_up if on[a] else p.min_down), f"run {a}..{b} too short"
+
+
+@pytest.fixture(scope="module")
+def long_horizon():
+    """Ten days with the DP optimum as reference."""
+    df = random_horizon(5, hours=240)
+    p = TechParams()
+    return df, p, run_dispatch(df, p, engine="dp").attrs["objective"]
+
+
+@pytest.mark.parametrize("engine", ("dp", "mip"))
+def test_rolling_is_feasible_and_bounded_by_optimum(long_horizon, engine):
+    df, p, optimum = long_horizon
+    result = run_dispatch(df, p, engine=engine, mode="rolling", window=48, lookahead=24)
+    assert result.attrs["status"] == "Feasible"
+    assert result.attrs["objective"] <= optimum + 1e-6
+    assert_min_runs(result["KGJ_on"].to_numpy(), p)
+
+
+def test_rolling_single_window_is_the_full_solve(long_horizon):
+    df, p, optimum = long_horizon
+    result = run_dispatch(df, p, engine="dp", mode="rolling", window=len(df))
+    assert result.attrs["status"] == "Optimal"
+    assert result.attrs["objective"] == pytest.approx(optimum)
+
+
+def test_blocks_keep_min_runs_across_seams_and_bound_the_optimum():
+    df = random_horizon(6, hours=480)
+    p = TechParams()
+    optimum = run_dispatch(df, p, engine="dp").attrs["objective"]
+    result = run_dispatch(df, p, engine="dp", mode="blocks", block_hours=120, max_workers=2)
+    assert result.attrs["blocks"] > 1
+    assert_min_runs(result["KGJ_on"].to_numpy(), p)
+    assert result.attrs["objective"] <= optimum + 1e-6
+    assert result.attrs["bound"] >= optimum - 1e-6
+    assert result.attrs["gap"] >= 0.0
+    assert result.attrs["status"] == ("Optimal" if result.attrs["gap"] <= 1e-9 else "Feasible")
+
+
+@pytest.mark.parametrize("engine", ("dp", "mip"))
+@pytest.mark.parametrize("seed", (0, 1))
+def test_rerun_matches_a_full_resolve(engine, seed):
+    df = random_horizon(seed, hours=240)
+    p = TechParams()
+    previous = run_dispatch(df, p, engine=engine)
+    changed = df.copy()
+    changed.loc[100:120, "ee_price"] += 60.0 if seed else -60.0
+
+    result = rerun_dispatch(changed, p, previous, engine=engine)
+    assert result.attrs["mode"] == "incremental"
+    assert result.attrs["incremental"]["hours"] < len(df)
+    full = run_dispatch(changed, p, engine="dp").attrs["objective"]
+    assert result.attrs["objective"] == pytest.approx(full, rel=1e-8, abs=1e-4)
+    assert_min_runs(result["KGJ_on"].to_numpy(), p)
+
+
+def test_rerun_without_changes_keeps_the_optimum():
+    df, p = random_horizon(2, hours=240), TechParams()
+    previous = run_dispatch(df, p, engine="dp")
+    result = rerun_dispatch(df, p, previous, engine="dp")
+    assert result.attrs["incremental"]["windows"] == []
+    assert result.attrs["status"] == "Optimal"
+    assert result.attrs["objective"] == pytest.approx(previous.attrs["objective"])
+
+
+def test_rerun_resolves_from_scratch_after_a_heuristic_run():
+    df, p = random_horizon(3, hours=240), TechParams()
+    rolling = run_dispatch(df, p, engine="dp", mode="rolling", window=24, lookahead=0)
+    result = rerun_dispatch(df, p, rolling, engine="dp")
+    assert result.attrs["mode"] == "full"
+    assert result.attrs["objective"] == pytest.approx(run_dispatch(df, p, engine="dp").attrs["objective"])
+
+
+def test_cached_mps_text_matches_a_fresh_write(tmp_path):
+    p = TechParams()
+    template = get_template(p, HOURS)
+    write_mps(template.apply(dispatch_engine._input_arrays(random_horizon(0)), p), tmp_path / "first.mps")
+
+    arr = dispatch_engine._input_arrays(random_horizon(1))
+    fixed_on = np.full(HOURS, np.nan)
+    fixed_on[10:14] = 1.0
+    write_mps(template.apply(arr, p, fixed_on=fixed_on), tmp_path / "cached.mps")
+    write_mps(build_model(arr, p, fixed_on=fixed_on), tmp_path / "fresh.mps")
+    assert (tmp_path / "cached.mps").read_text() == (tmp_path / "fresh.mps").read_text()
+
+
+def test_templates_are_bounded_by_memory(monkeypatch):
+    monkeypatch.setattr(dispatch_engine, "_TEMPLATES", OrderedDict())
+    p = TechParams()
+    one = get_template(p, HOURS).nbytes
+    monkeypatch.setattr(dispatch_engine, "MAX_TEMPLATE_BYTES", int(2.5 * one))
+    for hours in (HOURS + 1, HOURS + 2, HOURS + 3):
+        template = get_template(p, hours)
+    assert list(dispatch_engine._TEMPLATES.values())[-1] is template
+    assert len(dispatch_engine._TEMPLATES) == 2
+
+
+@pytest.mark.parametrize("backend", ("cbc", "highs"))
+def test_approx_gap_is_certified(long_horizon, backend):
+    if backend not in available_backends():
+        pytest.skip(f"{backend} not installed")
+    df, p, optimum = long_horizon
+    result = run_dispatch(df, p, engine="mip", mode="approx", backend=backend)
+    assert result.attrs["status"] == "Feasible"
+    assert_min_runs(result["KGJ_on"].to_numpy(), p)
+    objective, bound = result.attrs["objective"], result.attrs["bound"]
+    assert objective <= optimum + 1e-6 <= bound + 2e-6
+    assert result.attrs["gap"] >= 0.0
+    assert result.attrs["gap"] == pytest.approx((bound - objective) / abs(bound))
+
+
+def wait_for_cancel(cancel: CancelToken, timeout: float = 10.0) -> bool:
+    end = time.time() + timeout
+    while time.time() < end:
+        if cancel.cancelled:
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_shared_cancel_reaches_worker_processes():
+    cancel = CancelToken()
+    with cancel.shared(), ProcessPoolExecutor(max_workers=1) as pool:
+        future = pool.submit(wait_for_cancel, cancel)
+        time.sleep(0.5)
+        cancel.cancel()
+        assert future.result(timeout=5)
+
+
+@pytest.fixture(scope="module")
+def year_horizon():
+    """A year, long enough that CBC is still preprocessing after a second."""
+    df = random_horizon(0, hours=8760)
+    p = TechParams()
+    return df, p, run_dispatch(df, p, engine="dp").attrs["objective"]
+
+
+@pytest.mark.parametrize("mode", ("full", "blocks"))
+def test_cancelled_cbc_returns_at_once_with_the_dp_schedule(year_horizon, mode):
+    if "cbc" not in available_backends():
+        pytest.skip("cbc not installed")
+    df, p, optimum = year_horizon
+    cancel = CancelToken()
+    threading.Timer(1.0, cancel.cancel).start()
+    t0 = time.perf_counter()
+    result = run_dispatch(df, p, engine="mip", mode=mode, backend="cbc", cancel=cancel)
+    assert time.perf_counter() - t0 < 4.0
+    assert result.attrs["status"] == "Feasible"
+    assert result.attrs["stopped"] == "cancelled"
+    assert result.attrs["objective"] == pytest.approx(optimum, rel=1e-6)
+    assert_min_runs(result["KGJ_on"].to_numpy(), p)
+
+
+def test_cbc_keeps_the_time_budget(year_horizon):
+    if "cbc" not in available_backends():
+        pytest.skip("cbc not installed")
+    df, p, optimum = year_horizon
+    t0 = time.perf_counter()
+    result = run_dispatch(df, p, engine="mip", backend="cbc", time_limit=1.0)
+    assert time.perf_counter() - t0 < 3.0
+    assert result.attrs["stopped"] == "time_limit"
+    assert result.attrs["objective"] == pytest.approx(optimum, rel=1e-6)
@@ -0,0 +1,177 @@
+"""
+Job manager tests: progress and results of background jobs, the bounded
+pool, cancelling queued and running jobs, the heartbeat reaper, and pool
+runs (Monte Carlo, sensitivity grid) stopped part way through.
+"""
+
+import threading
+import time
+
+import pytest
+
+from dispatch_engine import CancelToken, TechParams
+from job_manager import JobManager
+from locations_config import get_location
+from scenario_engine import run_scenarios
+from sensitivity import sweep
+from solver_scheduler import SolverScheduler
+from test_dispatch_engine import random_horizon
+
+
+def wait_done(jobs: JobManager, job_id: str, timeout: float = 10.0):
+    end = time.time() + timeout
+    while time.time() < end:
+        job = jobs.get(job_id)
+        if job.is_done:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} still {job.status}")
+
+
+def wait_for(condition, timeout: float = 10.0):
+    end = time.time() + timeout
+    while not condition():
+        assert time.time() < end, "condition not reached"
+        time.sleep(0.02)
+
+
+@pytest.fixture
+def jobs():
+    manager = JobManager(SolverScheduler(max_concurrent=2))
+    yield manager
+    manager.shutdown()
+
+
+def staged(stages: int, progress, cancel):
+    for i in range(stages):
+        progress((i + 1) / stages, f"stage {i + 1}")
+    return "result"
+
+
+def until_cancelled(started: threading.Event, progress, cancel):
+    started.set()
+    while not cancel.cancelled:
+        time.sleep(0.01)
+    return "incumbent"
+
+
+def test_job_reports_progress_and_result(jobs):
+    job = wait_done(jobs, jobs.submit(staged, 3, label="staged", owner="a"))
+    assert job.status == "done"
+    assert job.result == "result"
+    assert job.progress == 1.0
+    assert job.message == "stage 3"
+
+
+def test_failed_job_keeps_the_error(jobs):
+    def broken(progress, cancel):
+        raise ValueError("no input")
+
+    job = wait_done(jobs, jobs.submit(broken))
+    assert job.status == "failed"
+    assert job.error == "ValueError: no input"
+
+
+def test_pool_is_bounded_by_the_scheduler(jobs):
+    lock, running, peak = threading.Lock(), [0], [0]
+
+    def busy(progress, cancel):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.1)
+        with lock:
+            running[0] -= 1
+
+    ids = [jobs.submit(busy, owner=f"o{i % 3}") for i in range(8)]
+    for job_id in ids:
+        assert wait_done(jobs, job_id).status == "done"
+    assert peak[0] == 2
+    assert len([t for t in threading.enumerate() if t.name.startswith("kgj-job_")]) <= 2
+
+
+def test_cancelled_queued_job_leaves_the_queue(jobs):
+    started = [threading.Event() for _ in range(2)]
+    running = [jobs.submit(until_cancelled, event) for event in started]
+    for event in started:
+        assert event.wait(5)
+    ran = threading.Event()
+    queued = jobs.submit(until_cancelled, ran)
+    assert jobs.get(queued).position == 1
+
+    jobs.cancel(queued)
+    job = jobs.get(queued)
+    assert job.status == "cancelled" and job.started is None
+    assert jobs.scheduler.metrics()["queued"] == 0
+    for job_id in running:
+        jobs.cancel(job_id)
+        assert wait_done(jobs, job_id).status == "cancelled"
+    assert not ran.is_set()
+
+
+def test_cancelled_running_job_keeps_its_incumbent(jobs):
+    started = threading.Event()
+    job_id = jobs.submit(until_cancelled, started)
+    assert started.wait(5)
+    jobs.cancel(job_id)
+    job = wait_done(jobs, job_id)
+    assert job.status == "cancelled"
+    assert job.result == "incumbent"
+    assert jobs.scheduler.metrics()["slots_used"] == 0
+
+
+def test_weighted_job_holds_its_slots(jobs):
+    started = threading.Event()
+    heavy = jobs.submit(until_cancelled, started, weight=2)
+    assert started.wait(5)
+    light = jobs.submit(staged, 1)
+    time.sleep(0.3)
+    assert jobs.get(light).status == "queued"
+    jobs.cancel(heavy)
+    assert wait_done(jobs, light).status == "done"
+
+
+def test_job_of_a_live_owner_outlasts_the_heartbeat():
+    manager = JobManager(SolverScheduler(max_concurrent=2), heartbeat=0.2, alive=lambda owner: owner == "live")
+    try:
+        started = [threading.Event(), threading.Event()]
+        live = manager.submit(until_cancelled, started[0], owner="live")
+        gone = manager.submit(until_cancelled, started[1], owner="gone")
+        assert all(event.wait(5) for event in started)
+        # Nobody polls, as while a Streamlit script is blocked
+        wait_for(lambda: manager._jobs[gone].status == "cancelled")
+        time.sleep(1.0)
+        assert manager._jobs[live].status == "running"
+        manager.cancel(live)
+        assert wait_done(manager, live).result == "incumbent"
+    finally:
+        manager.shutdown()
+
+
+def cancel_after_first(cancel: CancelToken):
+    """progress callback that cancels once the first unit of work is done."""
+    def progress(fraction, message):
+        if fraction > 0:
+            cancel.cancel()
+    return progress
+
+
+def test_cancelled_scenarios_keep_the_solved_ones():
+    cancel = CancelToken()
+    table = run_scenarios(random_horizon(0), TechParams(), n=40, max_workers=1, batch=1,
+                          progress=cancel_after_first(cancel), cancel=cancel)
+    assert table.attrs["stopped"] == "cancelled"
+    assert 1 <= len(table) < 40
+    assert table.attrs["percentiles"].attrs["scenarios"] == len(table)
+
+
+def test_cancelled_sweep_marks_the_points_not_solved():
+    loc = get_location("behounkova")
+    cancel = CancelToken()
+    grid = {"fixed_gas_price": [30.0, 35.0, 40.0, 45.0, 50.0], "kgj_service": [10.0, 12.0, 14.0, 16.0]}
+    table = sweep(random_horizon(1), loc, grid, max_workers=1,
+                  progress=cancel_after_first(cancel), cancel=cancel)
+    assert table.attrs["stopped"] == "cancelled"
+    assert len(table) == 20
+    assert 1 <= table.attrs["solved"] < 20
+    assert (table["status"] == "Cancelled").sum() == 20 - table.attrs["solved"]
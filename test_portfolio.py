@@ -0,0 +1,83 @@
+"""
+Shared-limit portfolio tests: a plan reported "Feasible" keeps every cap,
+its profit stays between what the caps allow and the dual bound, and the
+status reaches the site results and the summary.
+"""
+
+import numpy as np
+import pytest
+
+from locations_config import LOCATIONS
+from portfolio import PORTFOLIO_ROW, SharedLimit, _usage, run_portfolio, run_shared_portfolio
+from test_dispatch_engine import random_horizon
+
+
+HOURS = 168
+
+
+def site_inputs():
+    """A week per site, the demand scaled to the site's heat capacity."""
+    inputs = {}
+    for seed, loc_id in enumerate(LOCATIONS):
+        p = LOCATIONS[loc_id].tech_params()
+        df = random_horizon(seed, hours=HOURS)
+        df["heat_demand"] *= (p.kgj_heat_output + p.boiler_max_heat + p.eboiler_max_heat) / 5.0
+        inputs[loc_id] = df
+    return inputs
+
+
+def total_use(results, resource: str) -> np.ndarray:
+    return sum(_usage(r, LOCATIONS[loc_id].tech_params(), resource) for loc_id, r in results.items())
+
+
+@pytest.fixture(scope="module")
+def unconstrained():
+    inputs = site_inputs()
+    results, _ = run_portfolio(inputs, engine="dp")
+    profit = sum(r.attrs["objective"] for r in results.values())
+    return inputs, profit, total_use(results, "gas")
+
+
+@pytest.mark.parametrize("period", ("annual", "hourly"))
+def test_feasible_plan_keeps_the_gas_cap(unconstrained, period):
+    inputs, free_profit, gas = unconstrained
+    cap = 0.8 * (gas.sum() if period == "annual" else gas.max())
+    results, summary = run_shared_portfolio(inputs, [SharedLimit("gas", cap, period)], engine="dp")
+
+    lagrange = summary.attrs["lagrange"]
+    assert lagrange["status"] == "Feasible"
+    use = total_use(results, "gas")
+    assert (use.sum() if period == "annual" else use.max()) <= cap * (1 + 1e-6)
+    profit = sum(r.attrs["objective"] for r in results.values())
+    assert profit <= lagrange["bound"] + 1e-6
+    assert lagrange["bound"] <= free_profit + 1e-6
+    assert lagrange["gap"] >= 0.0
+    assert summary.loc[PORTFOLIO_ROW, "status"] == "Feasible"
+    assert all(r.attrs["status"] == r.attrs["shared_limits"] == "Feasible" for r in results.values())
+
+
+def test_annual_grid_cap(unconstrained):
+    inputs, _, _ = unconstrained
+    results, summary = run_shared_portfolio(inputs, [SharedLimit("grid", 1.0, "annual")], engine="dp")
+    assert summary.attrs["lagrange"]["status"] == "Feasible"
+    assert total_use(results, "grid").sum() <= 1.0 + 1e-6
+
+
+def test_unreachable_cap_returns_the_least_violating_plan(unconstrained):
+    inputs, _, _ = unconstrained
+    results, summary = run_shared_portfolio(inputs, [SharedLimit("gas", 0.0, "annual")],
+                                            engine="dp", max_iter=3)
+    assert summary.attrs["lagrange"]["status"] == "Infeasible"
+    assert summary.loc[PORTFOLIO_ROW, "status"] == "Infeasible"
+    assert all(r.attrs["shared_limits"] == "Infeasible" for r in results.values())
+
+
+@pytest.mark.parametrize("limit, kwargs, message", [
+    (SharedLimit("gas", 1.0), dict(max_iter=0), "max_iter"),
+    (SharedLimit("steam", 1.0), {}, "Unknown shared resource"),
+    (SharedLimit("gas", 1.0, "monthly"), {}, "Unknown limit period"),
+    (SharedLimit("grid", 1.0, "hourly"), {}, "only be annual"),
+])
+def test_invalid_limits_are_rejected(limit, kwargs, message):
+    with pytest.raises(ValueError, match=message):
+        run_shared_portfolio(site_inputs(), [limit], engine="dp", **kwargs)
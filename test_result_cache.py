@@ -0,0 +1,74 @@
+"""
+Result cache tests: what the key depends on, hits through run_dispatch,
+and LRU eviction.
+"""
+
+import os
+from dataclasses import replace
+
+import pandas as pd
+import pytest
+
+from dispatch_engine import TechParams, run_dispatch
+from result_cache import ResultCache, cache_key
+from test_dispatch_engine import random_horizon
+
+
+OPTIONS = {"engine": "dp", "mode": "full"}
+
+
+def test_key_follows_inputs_params_and_options():
+    df, p = random_horizon(0), TechParams()
+    key = cache_key(df, p, OPTIONS)
+    assert cache_key(df.copy(), replace(p), dict(OPTIONS)) == key
+
+    changed = df.copy()
+    changed.loc[10, "ee_price"] += 0.01
+    assert cache_key(changed, p, OPTIONS) != key
+    assert cache_key(df, replace(p, kgj_service=13.0), OPTIONS) != key
+    assert cache_key(df, p, dict(OPTIONS, mode="rolling")) != key
+
+
+def test_second_run_is_a_hit(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    df, p = random_horizon(1), TechParams()
+    first = run_dispatch(df, p, engine="dp", cache=cache)
+    assert not first.attrs.get("cached")
+    assert len(cache.entries()) == 1
+
+    second = run_dispatch(df, p, engine="dp", cache=cache)
+    assert second.attrs["cached"]
+    assert second.attrs["status"] == "Optimal"
+    pd.testing.assert_frame_equal(second, first, check_dtype=False)
+
+
+def test_stopped_runs_are_not_stored(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    result = run_dispatch(random_horizon(2), TechParams(), engine="mip", cache=cache, time_limit=0)
+    assert result.attrs["stopped"] == "time_limit"
+    assert cache.entries() == []
+
+
+def test_eviction_removes_least_recently_used(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    p = TechParams()
+    keys = []
+    for seed in range(3):
+        df = random_horizon(seed)
+        keys.append(cache.key(df, p, OPTIONS))
+        cache.put(keys[-1], run_dispatch(df, p, engine="dp"))
+        os.utime(cache._path(keys[-1]), (seed, seed))
+    # A hit refreshes the oldest entry, so the second one goes first
+    assert cache.get(keys[0]) is not None
+    cache.max_bytes = cache.size() - 1
+    cache.evict()
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None and cache.get(keys[2]) is not None
+
+
+@pytest.mark.parametrize("field", ["ee_price", "heat_demand"])
+def test_key_ignores_extra_columns_but_not_inputs(field):
+    df, p = random_horizon(3), TechParams()
+    key = cache_key(df, p, OPTIONS)
+    assert cache_key(df.assign(note="x"), p, OPTIONS) == key
+    assert cache_key(df.assign(**{field: df[field] * 1.01}), p, OPTIONS) != key
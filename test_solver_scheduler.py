@@ -0,0 +1,102 @@
+"""
+Solver scheduler tests: round-robin across owners, released and timed-out
+tickets, weighted requests and the dispatcher hand-off (grant_next).
+"""
+
+import threading
+
+import pytest
+
+from dispatch_engine import CancelToken
+from solver_scheduler import SolverScheduler
+
+
+def serve_all(scheduler: SolverScheduler) -> list:
+    """Grant and release waiting tickets one by one; their owners in serving order."""
+    served = []
+    while scheduler.metrics()["queued"]:
+        ticket = scheduler.grant_next(lambda t: True, timeout=1.0)
+        served.append(ticket.owner)
+        scheduler.release(ticket)
+    return served
+
+
+def test_owners_are_served_round_robin():
+    scheduler = SolverScheduler(max_concurrent=1)
+    for owner, count in (("a", 4), ("b", 2), ("c", 1)):
+        for _ in range(count):
+            scheduler.enqueue(owner)
+    assert serve_all(scheduler) == ["a", "b", "c", "a", "b", "a", "a"]
+
+
+def test_late_owner_starts_level_with_the_others():
+    scheduler = SolverScheduler(max_concurrent=1)
+    for _ in range(4):
+        scheduler.enqueue("a")
+    for _ in range(2):
+        scheduler.release(scheduler.grant_next(lambda t: True, timeout=1.0))
+    for _ in range(2):
+        scheduler.enqueue("b")
+    # b does not get a burst for the two grants a had before it came
+    assert serve_all(scheduler) == ["a", "b", "a", "b"]
+
+
+def test_released_queued_ticket_leaves_the_queue():
+    scheduler = SolverScheduler(max_concurrent=1)
+    running = scheduler.enqueue("a")
+    assert scheduler.wait(running, timeout=1.0)
+    queued = scheduler.enqueue("b")
+    assert scheduler.position(queued) == 1
+
+    scheduler.release(queued)
+    assert scheduler.position(queued) == 0
+    assert scheduler.metrics()["queued"] == 0
+    scheduler.release(running)
+    metrics = scheduler.metrics()
+    assert (metrics["running"], metrics["slots_used"], metrics["served"]) == (0, 0, 1)
+
+
+def test_wait_timeout_keeps_the_place_and_cancel_leaves_it():
+    scheduler = SolverScheduler(max_concurrent=1)
+    running = scheduler.enqueue("a")
+    assert scheduler.wait(running, timeout=1.0)
+    first, second = scheduler.enqueue("b"), scheduler.enqueue("c")
+
+    assert not scheduler.wait(first, timeout=0.1)
+    assert scheduler.position(first) == 1
+
+    cancel = CancelToken()
+    cancel.cancel()
+    assert not scheduler.wait(second, cancel=cancel)
+    assert scheduler.metrics()["queued"] == 1
+
+    releaser = threading.Timer(0.2, scheduler.release, (running,))
+    releaser.start()
+    assert scheduler.wait(first, timeout=5.0)
+    releaser.join()
+
+
+@pytest.mark.parametrize("weight", (2, 5))
+def test_heavy_request_waits_for_a_free_pool_and_runs_alone(weight):
+    scheduler = SolverScheduler(max_concurrent=2)
+    light = scheduler.enqueue("a")
+    assert scheduler.wait(light, timeout=1.0)
+    heavy = scheduler.enqueue("b", weight=weight)
+    assert not scheduler.wait(heavy, timeout=0.1)
+
+    scheduler.release(light)
+    assert scheduler.wait(heavy, timeout=1.0)
+    assert scheduler.metrics()["slots_used"] == weight
+    other = scheduler.enqueue("c")
+    assert not scheduler.wait(other, timeout=0.1)
+    scheduler.release(heavy)
+    assert scheduler.wait(other, timeout=1.0)
+
+
+def test_grant_next_only_takes_accepted_tickets():
+    scheduler = SolverScheduler(max_concurrent=2)
+    ticket = scheduler.enqueue("a")
+    assert scheduler.grant_next(lambda t: False, timeout=0.1) is None
+    assert scheduler.position(ticket) == 1
+    assert scheduler.grant_next(lambda t: t is ticket, timeout=1.0) is ticket
+    assert scheduler.metrics()["running"] == 1